@@ -86,6 +86,10 @@ class BaseDocument(HasTraits):
 
     change_count = Int()
 
+    # Only incremented when the bytes or the structure of the data change;
+    # change_count is also bumped for display changes like the selection
+    data_version = Int()
+
     can_revert = Property(Bool, depends_on='metadata')
 
     permute = Any
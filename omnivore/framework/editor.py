@@ -539,6 +539,7 @@ class FrameworkEditor(Editor):
             self.metadata_dirty = True
 
         if flags.data_model_changed:
+            d.data_version += 1
             d.data_model_changed = True
             d.change_count += 1
             flags.rebuild_ui = True
@@ -649,6 +650,7 @@ class FrameworkEditor(Editor):
     @on_trait_change('document:byte_values_changed')
     def byte_values_changed(self):
         log.debug("byte_values_changed called!!!")
+        self.document.data_version += 1
         self.document.change_count += 1
         self.invalidate_search()
         self.compare_to_baseline()
@@ -221,6 +221,10 @@ class TextMinibuffer(Minibuffer):
 
 
 class NextPrevTextMinibuffer(TextMinibuffer):
+    # Searching is delayed until typing pauses for this many milliseconds, so
+    # a search that would be out of date before it finished isn't started
+    search_delay = 100
+
     def __init__(self, editor, command_cls, next_cls, prev_cls, next_match=False, prev_match=False, **kwargs):
         TextMinibuffer.__init__(self, editor, command_cls, **kwargs)
         self.next_cls = next_cls
@@ -230,6 +234,7 @@ class NextPrevTextMinibuffer(TextMinibuffer):
         self.next_match = next_match
         self.prev_match = prev_match
         self.segment = editor.segment
+        self.pending_search = None
 
     def create_header_controls(self, parent, sizer):
         print "BEFORE", self.editor.last_search_settings['match_case']
@@ -261,12 +266,38 @@ class NextPrevTextMinibuffer(TextMinibuffer):
             self.text.SetInsertionPointEnd()
             self.text.SetSelection(0, self.text.GetLastPosition())
 
+    def destroy_control(self):
+        self.cancel_pending_search()
+        TextMinibuffer.destroy_control(self)
+
     def change_editor(self, editor):
+        self.cancel_pending_search()
         self.segment.clear_style_bits(match=True)
         self.editor = editor
         self.segment = editor.segment
         self.search_command = None
 
+    def on_text(self, evt):
+        # each change of the text replaces the search that is waiting
+        self.cancel_pending_search()
+        self.pending_search = wx.CallLater(self.search_delay, self.perform_pending_search)
+        evt.Skip()
+
+    def cancel_pending_search(self):
+        if self.pending_search is not None:
+            self.pending_search.Stop()
+            self.pending_search = None
+
+    def perform_pending_search(self):
+        self.pending_search = None
+        if self.control is not None:
+            self.perform()
+
+    def finish_pending_search(self):
+        if self.pending_search is not None:
+            self.cancel_pending_search()
+            self.perform()
+
     def is_repeat(self, other):
         return self.__class__ == other.__class__ and self.command_cls == other.command_cls and self.editor == other.editor and self.segment == other.segment and self.search_command is not None
 
@@ -282,6 +313,7 @@ class NextPrevTextMinibuffer(TextMinibuffer):
         evt.Skip()
 
     def next(self):
+        self.finish_pending_search()
         if self.search_command is not None:
             cmd = self.next_cls(self.search_command)
             self.editor.process_command(cmd)
@@ -292,6 +324,7 @@ class NextPrevTextMinibuffer(TextMinibuffer):
         evt.Skip()
 
     def prev(self):
+        self.finish_pending_search()
         if self.search_command is not None:
             cmd = self.prev_cls(self.search_command)
             self.editor.process_command(cmd)
@@ -11,121 +11,59 @@ def count_in_range(source_list, lowest_valid, highest_valid):
     return count_low, count_high
 
 # Fast integer-multiple scaling of bitmaps
-def intscale(arr, hscale, wscale=None):
+def intscale(arr, hscale, wscale=None, out=None):
+    """Fast integer-multiple scaling of bitmaps.
+
+    Arrays are assumed to have the shape (height, width, depth). Any integer
+    scale is supported. Each source pixel is broadcast directly into its
+    block of the output, so there are no intermediate copies at the output
+    size. If out is given (e.g. the buffer that will become the bitmap), it
+    must be a contiguous uint8 array of the scaled size and the result is
+    written there.
+    """
     if wscale is None:
         wscale = hscale
     hscale, wscale = int(hscale), int(wscale)
-    h, w, depth = arr.shape
-    if hscale == 1 and wscale == 1:
-        return arr
-    elif hscale < 1 or wscale < 1:
+    if hscale < 1 or wscale < 1:
         raise ValueError("Scale must be an integer greater than 1")
-    elif hscale == wscale:
-        # some speedups for special cases where scale value is the same in both
-        # directions
-        if hscale == 2:
-            output = np.empty((h * hscale, w * wscale, depth), dtype=np.uint8)
-            # duplicate source pixels into two columns
-            output[::2,::2,:] = arr[:,:,:]
-            output[::2,1::2,:] = arr[:,:,:]
-            # then copy completed rows to the row below
-            output[1::2,:,:] = output[0::2,:,:]
-            return output
-        elif hscale == 3:
-            output = np.empty((h * hscale, w * wscale, depth), dtype=np.uint8)
-            # duplicate source pixels into three columns
-            output[::3,::3,:] = arr[:,:,:]
-            output[::3,1::3,:] = arr[:,:,:]
-            output[::3,2::3,:] = arr[:,:,:]
-            # then copy completed rows to the next two rows
-            output[1::3,:,:] = output[::3,:,:]
-            output[2::3,:,:] = output[::3,:,:]
-            return output
-        elif hscale == 4:
-            output = np.empty((h * hscale, w * wscale, depth), dtype=np.uint8)
-            # duplicate source pixels into four columns
-            output[::4,0::4,:] = arr[:,:,:]
-            output[::4,1::4,:] = arr[:,:,:]
-            output[::4,2::4,:] = arr[:,:,:]
-            output[::4,3::4,:] = arr[:,:,:]
-            # copy completed rows to the next three rows
-            output[1::4,:,:] = output[::4,:,:]
-            output[2::4,:,:] = output[::4,:,:]
-            output[3::4,:,:] = output[::4,:,:]
-            return output
-    output = np.empty((h * hscale, w * wscale, depth), dtype=np.uint8)
-    # duplicate source pixels horizontally first onto the first line
+    h, w, depth = arr.shape
+    if out is None:
+        if hscale == 1 and wscale == 1:
+            return arr
+        out = np.empty((h * hscale, w * wscale, depth), dtype=np.uint8)
+    # duplicate source pixels horizontally onto the first line of each
+    # block, then copy that line to the rest of the lines in the block
+    blocks = out.reshape((h, hscale, w * wscale, depth))
+    first = blocks[:,0,:,:]
     for i in range(wscale):
-        output[::hscale,i::wscale,:] = arr[:,:,:]
-    # duplicate lines to rows below them
-    for i in range(1, hscale):
-        output[i::hscale,:,:] = output[0::hscale,:,:]
-
-    return output
+        first[:,i::wscale,:] = arr
+    if hscale > 1:
+        blocks[:,1:,:,:] = first[:,np.newaxis,:,:]
+    return out
 
 # Fast integer-multiple scaling of bitmaps in the x direction
-def intwscale(arr, scale):
+def intwscale(arr, scale, out=None):
     """Fast integer-multiple scaling of bitmaps.
 
-    The scale is applied to both the width and height. Arrays are assumed to
-    have the shape (height, width, depth)
+    The scale is applied to the width only. Arrays are assumed to have the
+    shape (height, width, depth)
     """
-    scale = int(scale)
-    if scale == 1:
-        return arr
-    elif scale < 1:
-        raise ValueError("Scale must be an integer greater than 1")
-    h, w, depth = arr.shape
-    output = np.empty((h, w * scale, depth), dtype=np.uint8)
-    if scale == 2:
-        # duplicate source pixels into two columns
-        output[::,0::2,:] = arr[:,:,:]
-        output[::,1::2,:] = arr[:,:,:]
-    elif scale == 3:
-        # duplicate source pixels into three columns
-        output[::,0::3,:] = arr[:,:,:]
-        output[::,1::3,:] = arr[:,:,:]
-        output[::,2::3,:] = arr[:,:,:]
-    elif scale == 4:
-        # duplicate source pixels into three columns
-        output[::,0::4,:] = arr[:,:,:]
-        output[::,1::4,:] = arr[:,:,:]
-        output[::,2::4,:] = arr[:,:,:]
-        output[::,3::4,:] = arr[:,:,:]
-    else:
-        raise ValueError("Scale greater than 4 not yet implemented")
+    return intscale(arr, 1, scale, out)
 
-    return output
-
-def intwscale_font(arr, scale):
+def intwscale_font(arr, scale, out=None):
     """Fast integer-multiple scaling of font bitmaps.
 
-    The scale is applied to both the width and height. Arrays are assumed to
-    have the shape (num_glyphs, height, width, depth)
+    The scale is applied to the width only. Arrays are assumed to have the
+    shape (num_glyphs, height, width, depth)
     """
     scale = int(scale)
-    if scale == 1:
-        return arr
-    elif scale < 1:
+    if scale < 1:
         raise ValueError("Scale must be an integer greater than 1")
     num_glyphs, h, w, depth = arr.shape
-    output = np.empty((num_glyphs, h, w * scale, depth), dtype=np.uint8)
-    if scale == 2:
-        # duplicate source pixels into two columns
-        output[:,:,0::2,:] = arr[:,:,:,:]
-        output[:,:,1::2,:] = arr[:,:,:,:]
-    elif scale == 3:
-        # duplicate source pixels into three columns
-        output[:,:,0::3,:] = arr[:,:,:,:]
-        output[:,:,1::3,:] = arr[:,:,:,:]
-        output[:,:,2::3,:] = arr[:,:,:,:]
-    elif scale == 4:
-        # duplicate source pixels into three columns
-        output[:,:,0::4,:] = arr[:,:,:,:]
-        output[:,:,1::4,:] = arr[:,:,:,:]
-        output[:,:,2::4,:] = arr[:,:,:,:]
-        output[:,:,3::4,:] = arr[:,:,:,:]
-    else:
-        raise ValueError("Scale greater than 4 not yet implemented")
-
-    return output
+    if out is None:
+        if scale == 1:
+            return arr
+        out = np.empty((num_glyphs, h, w * scale, depth), dtype=np.uint8)
+    for i in range(scale):
+        out[:,:,i::scale,:] = arr
+    return out
@@ -2,6 +2,11 @@
 # Glenn Linderman, licensed under the pyparsing license arith.py from:
 #
 # http://pyparsing.wikispaces.com/file/view/arith.py/241810293/arith.py
+#
+# NumpyIntExpression can also compile an expression into an ExpressionPlan, a
+# flat list of numpy ufunc calls that write into temporary arrays. The plan is
+# cached by the text of the expression, so the parsing is only done once, and
+# the temporary arrays are reused as it evaluates a large array in blocks.
 import numpy as np
 
 from pyparsing import Word, nums, hexnums, alphas, Combine, oneOf, Optional, \
@@ -10,6 +15,111 @@ from pyparsing import Word, nums, hexnums, alphas, Combine, oneOf, Optional, \
 ParserElement.enablePackrat()
 
 
+class PlanRegister(object):
+    """A temporary array of an ExpressionPlan, holding either integers or
+    booleans
+    """
+    def __init__(self, index, is_bool):
+        self.index = index
+        self.is_bool = is_bool
+
+
+class PlanVariable(object):
+    def __init__(self, name):
+        self.name = name
+        self.is_bool = False
+
+
+class ExpressionPlan(object):
+    """A compiled expression: the list of ufunc calls that evaluate it
+
+    Each step is a ufunc, its arguments (which are constants, variables or
+    the results of earlier steps) and the register it stores its result in.
+    Integer arithmetic is done in 64 bits no matter what type the variables
+    are, so the bytes of a segment don't wrap around at 256.
+    """
+    # number of items evaluated at a time, small enough that the temporary
+    # arrays stay in the processor cache
+    block_size = 1 << 16
+
+    def __init__(self, text):
+        self.text = text
+        self.steps = []
+        self.registers = []
+        self.variables = set()
+        self.result = None
+        self.buffers = None
+        self.buffer_size = 0
+
+    def get_variable(self, name):
+        self.variables.add(name)
+        return PlanVariable(name)
+
+    def add(self, func, args, is_bool):
+        """Add a step that calls the ufunc with the arguments, returning its
+        result. If all the arguments are constants, the result is calculated
+        now instead.
+        """
+        if not any(isinstance(arg, (PlanRegister, PlanVariable)) for arg in args):
+            value = func(*args)
+            return bool(value) if is_bool else int(value)
+        register = PlanRegister(len(self.registers), is_bool)
+        self.registers.append(register)
+        self.steps.append((func, args, register))
+        return register
+
+    def get_buffers(self, size):
+        if self.buffers is None or self.buffer_size < size:
+            self.buffers = [np.empty(size, dtype=np.bool_ if r.is_bool else np.int64) for r in self.registers]
+            self.buffer_size = size
+        return [b[:size] for b in self.buffers]
+
+    def eval(self, vars_):
+        """Evaluate the expression using the arrays or values of the
+        variables, returning an array of the same length or a constant
+        """
+        if not isinstance(self.result, (PlanRegister, PlanVariable)):
+            return self.result
+        sizes = [len(vars_[name]) for name in self.variables if isinstance(vars_[name], np.ndarray)]
+        size = max(sizes) if sizes else 1
+        buffers = self.get_buffers(size)
+        with np.errstate(divide='ignore', invalid='ignore'):
+            for func, args, register in self.steps:
+                values = []
+                for arg in args:
+                    if isinstance(arg, PlanRegister):
+                        arg = buffers[arg.index]
+                    elif isinstance(arg, PlanVariable):
+                        arg = vars_[arg.name]
+                    values.append(arg)
+                if register.is_bool:
+                    func(*values, out=buffers[register.index])
+                else:
+                    func(*values, out=buffers[register.index], dtype=np.int64)
+        if isinstance(self.result, PlanVariable):
+            return vars_[self.result.name]
+        return buffers[self.result.index]
+
+    def eval_mask(self, size, get_vars, block_size=None):
+        """Evaluate the expression for size items in blocks, returning a
+        boolean array that's True wherever the result is nonzero.
+
+        get_vars(start, end) returns the dict of the variables for the block
+        of items from start to end.
+        """
+        if block_size is None:
+            block_size = self.block_size
+        mask = np.empty(size, dtype=np.bool_)
+        for start in range(0, size, block_size):
+            end = min(start + block_size, size)
+            result = self.eval(get_vars(start, end))
+            if isinstance(result, np.ndarray):
+                np.not_equal(result, 0, out=mask[start:end])
+            else:
+                mask[start:end] = bool(result)
+        return mask
+
+
 class EvalConstant():
     "Class to evaluate a parsed constant or variable"
 
@@ -28,6 +138,23 @@ class EvalConstant():
             else:
                 return int(v)
 
+    def compile(self, plan):
+        v = self.value
+        if v.startswith("$"):
+            return int(v[1:], 16)
+        elif v.startswith("0x"):
+            return int(v[2:], 16)
+        elif v[0].isdigit():
+            return int(v)
+        if "[" in v:
+            # neighboring items like b[-1] and b[+1]; b[0] is just b
+            name, offset = v[:-1].split("[")
+            offset = int(offset)
+            if offset:
+                return plan.get_variable("%s[%+d]" % (name, offset))
+            v = name
+        return plan.get_variable(v)
+
 
 class EvalSignOp():
     "Class to evaluate expressions with a leading + or - sign"
@@ -39,6 +166,12 @@ class EvalSignOp():
         mult = {'+':1, '-':-1}[self.sign]
         return mult * self.value.eval(vars_)
 
+    def compile(self, plan):
+        value = self.value.compile(plan)
+        if self.sign == '+':
+            return value
+        return plan.add(np.negative, (value,), False)
+
 
 def operatorOperands(tokenlist):
     "generator to extract operators and operands in pairs"
@@ -71,6 +204,19 @@ class EvalMultOp():
                 prod %= val.eval(vars_)
         return prod
 
+    opMap = {
+        '*': np.multiply,
+        '/': np.floor_divide,
+        '//': np.floor_divide,
+        '%': np.remainder,
+        }
+
+    def compile(self, plan):
+        value = self.value[0].compile(plan)
+        for op, val in operatorOperands(self.value[1:]):
+            value = plan.add(self.opMap[op], (value, val.compile(plan)), False)
+        return value
+
 
 class EvalAddOp():
     "Class to evaluate addition and subtraction expressions"
@@ -87,6 +233,13 @@ class EvalAddOp():
                 sum -= val.eval(vars_)
         return sum
 
+    def compile(self, plan):
+        value = self.value[0].compile(plan)
+        for op, val in operatorOperands(self.value[1:]):
+            func = np.add if op == '+' else np.subtract
+            value = plan.add(func, (value, val.compile(plan)), False)
+        return value
+
 
 class EvalBitwiseAndOp():
     "Class to evaluate addition and subtraction expressions"
@@ -101,6 +254,15 @@ class EvalBitwiseAndOp():
             val1 = val1 & val2
         return val1
 
+    def compile(self, plan):
+        value = self.value[0].compile(plan)
+        for op, val in operatorOperands(self.value[1:]):
+            val = val.compile(plan)
+            # the result of two comparisons stays boolean
+            is_bool = getattr(value, "is_bool", False) and getattr(val, "is_bool", False)
+            value = plan.add(np.bitwise_and, (value, val), is_bool)
+        return value
+
 
 class EvalBitwiseOrOp():
     "Class to evaluate addition and subtraction expressions"
@@ -115,6 +277,15 @@ class EvalBitwiseOrOp():
             val1 = val1 | val2
         return val1
 
+    def compile(self, plan):
+        value = self.value[0].compile(plan)
+        for op, val in operatorOperands(self.value[1:]):
+            val = val.compile(plan)
+            # the result of two comparisons stays boolean
+            is_bool = getattr(value, "is_bool", False) and getattr(val, "is_bool", False)
+            value = plan.add(np.bitwise_or, (value, val), is_bool)
+        return value
+
 
 class EvalLogicalAndOp():
     "Class to evaluate addition and subtraction expressions"
@@ -129,6 +300,12 @@ class EvalLogicalAndOp():
             val1 = np.logical_and(val1, val2)
         return val1
 
+    def compile(self, plan):
+        value = self.value[0].compile(plan)
+        for op, val in operatorOperands(self.value[1:]):
+            value = plan.add(np.logical_and, (value, val.compile(plan)), True)
+        return value
+
 
 class EvalLogicalOrOp():
     "Class to evaluate addition and subtraction expressions"
@@ -143,6 +320,12 @@ class EvalLogicalOrOp():
             val1 = np.logical_or(val1, val2)
         return val1
 
+    def compile(self, plan):
+        value = self.value[0].compile(plan)
+        for op, val in operatorOperands(self.value[1:]):
+            value = plan.add(np.logical_or, (value, val.compile(plan)), True)
+        return value
+
 
 class EvalComparisonOp():
     "Class to evaluate comparison expressions"
@@ -178,12 +361,33 @@ class EvalComparisonOp():
                 return True
             return False
 
+    ufuncMap = {
+        "<" : np.less,
+        "<=" : np.less_equal,
+        ">" : np.greater,
+        ">=" : np.greater_equal,
+        "==" : np.equal,
+        "!=" : np.not_equal,
+        "<>" : np.not_equal,
+        }
+
+    def compile(self, plan):
+        # chained comparisons like 3 < b < 10 work like they do in python
+        val1 = self.value[0].compile(plan)
+        result = None
+        for op, val in operatorOperands(self.value[1:]):
+            val2 = val.compile(plan)
+            value = plan.add(self.ufuncMap[op], (val1, val2), True)
+            result = value if result is None else plan.add(np.logical_and, (result, value), True)
+            val1 = val2
+        return result
+
 
 class NumpyIntExpression():
     integer = Word(nums)
     hexint = Combine(oneOf('0x $') + Word(hexnums))
 
-    variable = Word(alphas)
+    variable = Combine(Word(alphas) + Optional(Literal('[') + Optional(oneOf('+ -')) + Word(nums) + Literal(']')))
     operand = hexint | integer | variable
 
     signop = oneOf('+ -')
@@ -222,6 +426,28 @@ class NumpyIntExpression():
         result = ret.eval( self.vars_ )
         return result
 
+    # compiled plans by the text of their expression
+    plans = {}
+
+    max_plans = 100
+
+    @classmethod
+    def compile(cls, text):
+        """Return the cached ExpressionPlan of the expression, raising
+        ParseException if it isn't valid
+        """
+        try:
+            return cls.plans[text]
+        except KeyError:
+            pass
+        ret = cls.arith_expr.parseString(text, parseAll=True)[0]
+        plan = ExpressionPlan(text)
+        plan.result = ret.compile(plan)
+        if len(cls.plans) >= cls.max_plans:
+            cls.plans.clear()
+        cls.plans[text] = plan
+        return plan
+
 
 class EvalFloatConstant():
     "Class to evaluate a parsed constant or variable"
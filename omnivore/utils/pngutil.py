@@ -0,0 +1,49 @@
+import struct
+import zlib
+
+import numpy as np
+
+
+png_signature = b"\x89PNG\r\n\x1a\n"
+
+
+def png_chunk(tag, data):
+    crc = zlib.crc32(tag + data) & 0xffffffff
+    return struct.pack(">I", len(data)) + tag + data + struct.pack(">I", crc)
+
+
+def numpy_to_png(array, compress_level=6):
+    """Encode an RGB or greyscale uint8 image array as PNG data
+
+    array must have the shape (height, width, 3) for RGB or (height, width)
+    for greyscale. Only needs zlib, so images can be written without a GUI
+    toolkit or an imaging library.
+    """
+    array = np.asarray(array, dtype=np.uint8)
+    if array.ndim == 3 and array.shape[2] == 3:
+        color_type = 2
+    elif array.ndim == 2:
+        color_type = 0
+    else:
+        raise ValueError("PNG images must be (h, w) greyscale or (h, w, 3) RGB, not %s" % str(array.shape))
+    height, width = array.shape[0:2]
+    if height == 0 or width == 0:
+        raise ValueError("Can't create a PNG image with no pixels")
+
+    # every scanline is prefixed by its filter type, which is always zero
+    # (no filtering) here
+    scanlines = np.zeros((height, array[0].size + 1), dtype=np.uint8)
+    scanlines[:,1:] = array.reshape((height, -1))
+
+    header = struct.pack(">IIBBBBB", width, height, 8, color_type, 0, 0, 0)
+    return b"".join([
+        png_signature,
+        png_chunk(b"IHDR", header),
+        png_chunk(b"IDAT", zlib.compress(scanlines.tostring(), compress_level)),
+        png_chunk(b"IEND", b""),
+    ])
+
+
+def save_png(filename, array, compress_level=6):
+    with open(filename, "wb") as fh:
+        fh.write(numpy_to_png(array, compress_level))
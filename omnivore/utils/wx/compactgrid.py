@@ -31,6 +31,14 @@ def ForceBetween(min, val, max):
     return val
 
 
+def numpy_to_bitmap(array):
+    """Create a bitmap from an RGB array in the shape (height, width, 3)
+    directly, without the extra copies of going through a wx.Image
+    """
+    array = np.ascontiguousarray(array, dtype=np.uint8)
+    return wx.Bitmap.FromBuffer(array.shape[1], array.shape[0], array)
+
+
 def NiceFontForPlatform():
     point_size = 10
     family = wx.DEFAULT
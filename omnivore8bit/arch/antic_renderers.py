@@ -1,7 +1,5 @@
 import numpy as np
 
-import wx
-
 from atrcopy import match_bit_mask, comment_bit_mask, selected_bit_mask, diff_bit_mask, user_bit_mask, not_user_bit_mask
 
 from omnivore.utils.permute import bit_reverse_table
@@ -18,6 +16,55 @@ import logging
 log = logging.getLogger(__name__)
 
 
+# bitplane_lut[weight][byte] is the 8 pixel row of color register bits that a
+# single bitplane byte contributes to the final pixel values
+bitplane_bits = np.unpackbits(np.arange(256, dtype=np.uint8).reshape((-1, 1)), axis=1)
+bitplane_lut = dict([(w, bitplane_bits * np.uint8(w)) for w in (1, 2, 4, 8)])
+
+# bits_per_pixel_lut[bpp][byte] is the row of color register indexes of the
+# pixels packed into a byte
+bits_per_pixel_lut = {
+    1: bitplane_bits,
+    2: bitplane_bits[:,0::2] * 2 + bitplane_bits[:,1::2],
+    4: bitplane_bits[:,0::4] * 8 + bitplane_bits[:,1::4] * 4 + bitplane_bits[:,2::4] * 2 + bitplane_bits[:,3::4],
+}
+
+# Style classes select the palette row used to color a pixel
+normal_style_class = 0
+data_style_class = 1
+comment_style_class = 2
+match_style_class = 3
+highlight_style_class = 4
+empty_style_class = 5
+num_style_classes = 6
+
+style_class_luts = {}
+
+
+def get_style_class_lut(precedence):
+    """Return the table that maps a style byte to its style class
+
+    precedence lists the style classes in increasing order of priority; a
+    style byte gets the highest priority class whose bits it contains, or
+    the normal class if none.
+    """
+    try:
+        return style_class_luts[precedence]
+    except KeyError:
+        style = np.arange(256, dtype=np.uint8)
+        tests = {
+            data_style_class: (style & user_bit_mask) > 0,
+            comment_style_class: (style & comment_bit_mask) == comment_bit_mask,
+            match_style_class: (style & match_bit_mask) == match_bit_mask,
+            highlight_style_class: (style & selected_bit_mask) == selected_bit_mask,
+        }
+        lut = np.zeros(256, dtype=np.uint8)
+        for style_class in precedence:
+            lut[tests[style_class]] = style_class
+        style_class_luts[precedence] = lut
+        return lut
+
+
 class BaseRenderer(object):
     name = "base"
     scale_width = 1
@@ -26,6 +73,16 @@ class BaseRenderer(object):
     bitplanes = 1
     ignore_mask = not_user_bit_mask & (0xff ^ diff_bit_mask)
 
+    # Bitplane renderers: the value each plane contributes to the color
+    # register index, in the order the planes appear in the data
+    plane_weights = ()
+    interleave_by_line = False
+    use_bitplane_lut = True
+
+    # Style classes in increasing order of priority when a byte has more than
+    # one style bit set
+    style_precedence = (data_style_class, comment_style_class, match_style_class, highlight_style_class)
+
     def __eq__(self, other):
         try:
             return other is not None and self.name == other.name and self.pixels_per_byte == other.pixels_per_byte and self.bitplanes == other.bitplanes
@@ -38,74 +95,79 @@ class BaseRenderer(object):
 
     def get_colors(self, segment_viewer, registers):
         color_registers = [segment_viewer.machine.color_registers[r] for r in registers]
+        return self.get_style_colors(segment_viewer, color_registers)
+
+    def get_style_colors(self, segment_viewer, color_registers):
         h_colors = colors.get_blended_color_registers(color_registers, segment_viewer.preferences.highlight_background_color)
         m_colors = colors.get_blended_color_registers(color_registers, segment_viewer.preferences.match_background_color)
         c_colors = colors.get_blended_color_registers(color_registers, segment_viewer.preferences.comment_background_color)
         d_colors = colors.get_dimmed_color_registers(color_registers, segment_viewer.preferences.background_color, segment_viewer.preferences.data_background_color)
         return color_registers, h_colors, m_colors, c_colors, d_colors
 
-    def reshape(self, bitimage, bytes_per_row, nr):
-        # source array 'bitimage' in the shape of (size, w, 3)
-        h, w, colors = bitimage.shape
-        # create a new image with pixels in the correct aspect ratio
-        output = bitimage.reshape((nr, self.pixels_per_byte * bytes_per_row, 3))
-        output = intscale(output, self.scale_height, self.scale_width)
-        log.debug("bitimage: %d,%d,%d; ppb=%d bpr=%d, output=%s" % (h, w, colors, self.pixels_per_byte * self.scale_width, bytes_per_row, str(output.shape)))
-        return output
+    def get_palette_colors(self, segment_viewer):
+        return self.get_colors(segment_viewer, range(2**self.bitplanes))
 
-    def get_2bpp(self, segment_viewer, bytes_per_row, nr, count, bytes, style, colors):
-        bits = np.unpackbits(bytes)
-        bits = bits.reshape((-1, 8))
-        pixels = np.empty((nr * bytes_per_row, 4), dtype=np.uint8)
-        pixels[:,0] = bits[:,0] * 2 + bits[:,1]
-        pixels[:,1] = bits[:,2] * 2 + bits[:,3]
-        pixels[:,2] = bits[:,4] * 2 + bits[:,5]
-        pixels[:,3] = bits[:,6] * 2 + bits[:,7]
+    def get_palette(self, segment_viewer):
+        """Return the lookup table used to convert color register indexes to
+        RGB values, in the shape (num_style_classes, 256, 3).
 
-        style_per_pixel = np.vstack((style, style, style, style)).T
-        normal = (style_per_pixel & self.ignore_mask) == 0
-        highlight = (style_per_pixel & selected_bit_mask) == selected_bit_mask
-        data = (style_per_pixel & user_bit_mask) > 0
-        comment = (style_per_pixel & comment_bit_mask) == comment_bit_mask
-        match = (style_per_pixel & match_bit_mask) == match_bit_mask
-
-        color_registers, h_colors, m_colors, c_colors, d_colors = colors
-        bitimage = np.empty((nr * bytes_per_row, 4, 3), dtype=np.uint8)
-        for i in range(4):
-            color_is_set = (pixels == i)
-            bitimage[color_is_set & normal] = color_registers[i]
-            bitimage[color_is_set & data] = d_colors[i]
-            bitimage[color_is_set & comment] = c_colors[i]
-            bitimage[color_is_set & match] = m_colors[i]
-            bitimage[color_is_set & highlight] = h_colors[i]
-        bitimage[count:,:,:] = segment_viewer.preferences.empty_background_color.Get(False)
-        return bitimage
-
-    def get_4bpp(self, segment_viewer, bytes_per_row, nr, count, bytes, style, colors):
-        bits = np.unpackbits(bytes)
-        bits = bits.reshape((-1, 8))
-        pixels = np.empty((nr * bytes_per_row, 2), dtype=np.uint8)
-        pixels[:,0] = bits[:,0] * 8 + bits[:,1] * 4 + bits[:,2] * 2 + bits[:,3]
-        pixels[:,1] = bits[:,4] * 8 + bits[:,5] * 4 + bits[:,6] * 2 + bits[:,7]
-
-        style_per_pixel = np.vstack((style, style)).T
-        normal = (style_per_pixel & self.ignore_mask) == 0
-        highlight = (style_per_pixel & selected_bit_mask) == selected_bit_mask
-        data = (style_per_pixel & user_bit_mask) > 0
-        comment = (style_per_pixel & comment_bit_mask) == comment_bit_mask
-        match = (style_per_pixel & match_bit_mask) == match_bit_mask
-
-        color_registers, h_colors, m_colors, c_colors, d_colors = colors
-        bitimage = np.empty((nr * bytes_per_row, 2, 3), dtype=np.uint8)
-        for i in range(16):
-            color_is_set = (pixels == i)
-            bitimage[color_is_set & normal] = color_registers[i]
-            bitimage[color_is_set & data] = d_colors[i]
-            bitimage[color_is_set & comment] = c_colors[i]
-            bitimage[color_is_set & match] = m_colors[i]
-            bitimage[color_is_set & highlight] = h_colors[i]
-        bitimage[count:,:,:] = segment_viewer.preferences.empty_background_color.Get(False)
-        return bitimage
+        This only depends on the color registers and the preferences, so a
+        change to either only needs a new palette and not a new decode of the
+        bytes.
+        """
+        color_registers, h_colors, m_colors, c_colors, d_colors = self.get_palette_colors(segment_viewer)
+        num_colors = len(color_registers)
+        palette = np.zeros((num_style_classes, 256, 3), dtype=np.uint8)
+        palette[normal_style_class,0:num_colors] = color_registers
+        palette[data_style_class,0:num_colors] = d_colors
+        palette[comment_style_class,0:num_colors] = c_colors
+        palette[match_style_class,0:num_colors] = m_colors
+        palette[highlight_style_class,0:num_colors] = h_colors
+        palette[empty_style_class,:] = segment_viewer.preferences.empty_background_color.Get(False)
+        return palette
+
+    def get_style_classes(self, style):
+        return get_style_class_lut(self.style_precedence)[style]
+
+    def get_index_image(self, segment_viewer, bytes_per_row, nr, count, bytes, style):
+        """Decode the bytes into color register indexes
+
+        Returns a tuple of two uint8 arrays, the color register index of each
+        pixel and the style class of each pixel. Both are in the shape (nr,
+        pixels per row) and are not scaled by scale_width or scale_height.
+        """
+        raise NotImplementedError
+
+    def get_rgb_image(self, palette, pixels, style_classes, zoom_h=1, zoom_w=1, out=None):
+        """Convert the output of get_index_image into a scaled RGB image
+
+        The palette lookup is done at the unscaled size, and the renderer
+        scale and the additional zoom factors are applied in a single pass,
+        into the array out if supplied.
+        """
+        if speedups is not None:
+            bitimage = speedups.get_rgb_image(palette, pixels, style_classes)
+        else:
+            bitimage = palette[style_classes, pixels]
+        return intscale(bitimage, self.scale_height * zoom_h, self.scale_width * zoom_w, out)
+
+    def get_image(self, segment_viewer, bytes_per_row, nr, count, bytes, style):
+        pixels, style_classes = self.get_index_image(segment_viewer, bytes_per_row, nr, count, bytes, style)
+        return self.get_rgb_image(self.get_palette(segment_viewer), pixels, style_classes)
+
+    def get_packed_pixels(self, bits_per_pixel, bytes_per_row, nr, count, bytes, style):
+        return self.get_lut_pixels(bits_per_pixel_lut[bits_per_pixel], bytes_per_row, nr, count, bytes, style)
+
+    def get_lut_pixels(self, pixel_lut, bytes_per_row, nr, count, bytes, style):
+        """Decode each byte into the row of pixels given by pixel_lut[byte]
+        """
+        if speedups is not None:
+            return speedups.get_packed_pixels(bytes, style, pixel_lut, get_style_class_lut(self.style_precedence), bytes_per_row, nr, count, empty_style_class)
+        pixels_per_byte = pixel_lut.shape[1]
+        pixels = pixel_lut[bytes].reshape((nr, bytes_per_row * pixels_per_byte))
+        style_classes = self.get_style_classes(style).repeat(pixels_per_byte)
+        style_classes[count * pixels_per_byte:] = empty_style_class
+        return pixels, style_classes.reshape((nr, bytes_per_row * pixels_per_byte))
 
     def get_bitplane_pixels(self, bits, pixels, bytes_per_row, pixels_per_row):
         """Fill the pixels array with color register data
@@ -115,39 +177,48 @@ class BaseRenderer(object):
         """
         raise NotImplemented
 
+    def get_bitplane_pixels_lut(self, bytes, bytes_per_row, nr):
+        """Return an 8 pixel wide array of color register data using the
+        bitplane lookup tables.
+
+        Each group of 8 pixels is built by OR-ing together the table entries
+        of its plane bytes, using plane_weights to determine the bit value
+        that each plane contributes. Produces the same output as
+        get_bitplane_pixels.
+        """
+        bitplanes = self.bitplanes
+        if self.interleave_by_line:
+            pixel_rows = bytes_per_row / bitplanes
+            planes = bytes.reshape((nr, bitplanes, pixel_rows))
+        else:
+            planes = bytes.reshape((-1, bitplanes, 1))
+        pixels = np.zeros((planes.shape[0] * planes.shape[2], 8), dtype=np.uint8)
+        for i, weight in enumerate(self.plane_weights):
+            pixels |= bitplane_lut[weight][planes[:,i,:].ravel()]
+        return pixels
+
     def get_bitplane_style(self, style):
         raise NotImplemented
 
-    def get_bitplanes(self, segment_viewer, bytes_per_row, nr, count, bytes, style, colors):
+    def get_bitplanes(self, bytes_per_row, nr, count, bytes, style):
         bitplanes = self.bitplanes
         _, rem = divmod(np.alen(bytes), bitplanes)
         if rem > 0:
-            bytes = np.append(bytes, np.zeros(rem, dtype=np.uint8))
-            style = np.append(style, np.zeros(rem, dtype=np.uint8))
+            bytes = np.append(bytes, np.zeros(bitplanes - rem, dtype=np.uint8))
+            style = np.append(style, np.zeros(bitplanes - rem, dtype=np.uint8))
         pixels_per_row = 8 * bytes_per_row / bitplanes
-        bits = np.unpackbits(bytes).reshape((-1, 8))
-        pixels = np.empty((nr * bytes_per_row / bitplanes, pixels_per_row), dtype=np.uint8)
-        self.get_bitplane_pixels(bits, pixels, bytes_per_row, pixels_per_row)
+        if self.use_bitplane_lut:
+            pixels = self.get_bitplane_pixels_lut(bytes[:nr * bytes_per_row], bytes_per_row, nr)
+        else:
+            bits = np.unpackbits(bytes).reshape((-1, 8))
+            pixels = np.empty((nr * bytes_per_row / bitplanes, 8), dtype=np.uint8)
+            self.get_bitplane_pixels(bits, pixels, bytes_per_row, pixels_per_row)
         pixels = pixels.reshape((nr, pixels_per_row))
         s = self.get_bitplane_style(style)
-        style_per_pixel = s.repeat(8).reshape((-1, pixels_per_row))
-        normal = (style_per_pixel & self.ignore_mask) == 0
-        highlight = (style_per_pixel & selected_bit_mask) == selected_bit_mask
-        data = (style_per_pixel & user_bit_mask) > 0
-        comment = (style_per_pixel & comment_bit_mask) == comment_bit_mask
-        match = (style_per_pixel & match_bit_mask) == match_bit_mask
-
-        color_registers, h_colors, m_colors, c_colors, d_colors = colors
-        bitimage = np.empty((nr, pixels_per_row, 3), dtype=np.uint8)
-        for i in range(2**bitplanes):
-            color_is_set = (pixels == i)
-            bitimage[color_is_set & normal] = color_registers[i]
-            bitimage[color_is_set & data] = d_colors[i]
-            bitimage[color_is_set & comment] = c_colors[i]
-            bitimage[color_is_set & match] = m_colors[i]
-            bitimage[color_is_set & highlight] = h_colors[i]
-        bitimage[count:,:,:] = segment_viewer.preferences.empty_background_color.Get(False)
-        return bitimage
+        style_classes = self.get_style_classes(s).repeat(8).reshape((-1, pixels_per_row))[:nr]
+        first_empty_row = (count + bytes_per_row - 1) / bytes_per_row
+        style_classes[first_empty_row:,:] = empty_style_class
+        return pixels, style_classes
 
 
 class OneBitPerPixelB(BaseRenderer):
@@ -156,40 +227,11 @@ class OneBitPerPixelB(BaseRenderer):
     def get_bw_colors(self, segment_viewer):
         return ((255, 255, 255), (0, 0, 0))
 
-    def get_image(self, segment_viewer, bytes_per_row, nr, count, bytes, style):
-        bits = np.unpackbits(bytes)
-        pixels = bits.reshape((-1, 8))
-
-        background = (pixels == 0)
-        color1 = (pixels == 1)
-
-        bw_colors = self.get_bw_colors(segment_viewer)
-        h_colors = colors.get_blended_color_registers(bw_colors, segment_viewer.preferences.highlight_background_color)
-        m_colors = colors.get_blended_color_registers(bw_colors, segment_viewer.preferences.match_background_color)
-        c_colors = colors.get_blended_color_registers(bw_colors, segment_viewer.preferences.comment_background_color)
-        d_colors = colors.get_dimmed_color_registers(bw_colors, segment_viewer.preferences.background_color, segment_viewer.preferences.data_background_color)
-
-        style_per_pixel = np.vstack((style, style, style, style, style, style, style, style)).T
-        normal = (style_per_pixel & self.ignore_mask) == 0
-        highlight = (style_per_pixel & selected_bit_mask) == selected_bit_mask
-        data = (style_per_pixel & user_bit_mask) > 0
-        comment = (style_per_pixel & comment_bit_mask) == comment_bit_mask
-        match = (style_per_pixel & match_bit_mask) == match_bit_mask
-
-        bitimage = np.empty((nr * bytes_per_row, 8, 3), dtype=np.uint8)
-        bitimage[background & normal] = bw_colors[0]
-        bitimage[background & data] = d_colors[0]
-        bitimage[background & comment] = c_colors[0]
-        bitimage[background & match] = m_colors[0]
-        bitimage[background & highlight] = h_colors[0]
-        bitimage[color1 & normal] = bw_colors[1]
-        bitimage[color1 & data] = d_colors[1]
-        bitimage[color1 & comment] = c_colors[1]
-        bitimage[color1 & match] = m_colors[1]
-        bitimage[color1 & highlight] = h_colors[1]
-        bitimage[count:,:,:] = segment_viewer.preferences.empty_background_color.Get(False)
-
-        return self.reshape(bitimage, bytes_per_row, nr)
+    def get_palette_colors(self, segment_viewer):
+        return self.get_style_colors(segment_viewer, self.get_bw_colors(segment_viewer))
+
+    def get_index_image(self, segment_viewer, bytes_per_row, nr, count, bytes, style):
+        return self.get_packed_pixels(1, bytes_per_row, nr, count, bytes, style)
 
 
 class OneBitPerPixelW(OneBitPerPixelB):
@@ -230,115 +272,142 @@ class ModeC(ModeB):
     scale_height = 2
 
 
+# apple2_pixel_lut[byte] is the row of 7 pixels of an Apple II hi-res byte.
+# The low bit is the leftmost pixel and the high bit selects the palette, so
+# it isn't displayed.
+apple2_pixel_lut = np.ascontiguousarray(bitplane_bits[bit_reverse_table][:,0:7])
+
+apple2_screen_width = 40
+apple2_screen_height = 192
+apple2_page_size = 0x2000
+
+
+def generate_apple2_row_offsets():
+    """Return the offset into the hi-res page of the first byte of each of
+    the 192 lines on the screen
+    """
+    # From Apple Graphics and Arcade Game Design
+    y = np.arange(apple2_screen_height, dtype=np.int32)
+    a = y // 64
+    d = y - (64 * a)
+    b = d // 8
+    c = d - 8 * b
+    return (1024 * c) + (128 * b) + (40 * a)
+
+
+def generate_apple2_index():
+    """Return the offset into the hi-res page of each byte on the screen, in
+    screen order: 192 lines of 40 bytes, skipping the screen holes
+    """
+    offsets = generate_apple2_row_offsets()
+    return (offsets[:,np.newaxis] + np.arange(apple2_screen_width, dtype=np.int32)).ravel()
+
+apple2_screen_index = generate_apple2_index()
+
+
 class OneBitPerPixelApple2Linear(BaseRenderer):
     name = "B/W, Apple 2, Linear"
+    pixels_per_byte = 7
 
     def get_bw_colors(self, segment_viewer):
         return ((0, 0, 0), (255, 255, 255))
 
-    def get_image(self, segment_viewer, bytes_per_row, nr, count, bytes, style):
-        bits = np.unpackbits(bit_reverse_table[bytes])
-        pixels = bits.reshape((-1, 8))
-
-        background = (pixels[:,0:7] == 0)
-        color1 = (pixels[:,0:7] == 1)
-
-        bw_colors = self.get_bw_colors(segment_viewer)
-        h_colors = colors.get_blended_color_registers(bw_colors, segment_viewer.preferences.highlight_background_color)
-        m_colors = colors.get_blended_color_registers(bw_colors, segment_viewer.preferences.match_background_color)
-        c_colors = colors.get_blended_color_registers(bw_colors, segment_viewer.preferences.comment_background_color)
-        d_colors = colors.get_dimmed_color_registers(bw_colors, segment_viewer.preferences.background_color, segment_viewer.preferences.data_background_color)
-
-        style_per_pixel = np.vstack((style, style, style, style, style, style, style)).T
-        normal = (style_per_pixel & self.ignore_mask) == 0
-        highlight = (style_per_pixel & selected_bit_mask) == selected_bit_mask
-        data = (style_per_pixel & user_bit_mask) > 0
-        comment = (style_per_pixel & comment_bit_mask) == comment_bit_mask
-        match = (style_per_pixel & match_bit_mask) == match_bit_mask
-
-        bitimage = np.empty((nr * bytes_per_row, 7, 3), dtype=np.uint8)
-        bitimage[background & normal] = bw_colors[0]
-        bitimage[background & data] = d_colors[0]
-        bitimage[background & comment] = c_colors[0]
-        bitimage[background & match] = m_colors[0]
-        bitimage[background & highlight] = h_colors[0]
-        bitimage[color1 & normal] = bw_colors[1]
-        bitimage[color1 & data] = d_colors[1]
-        bitimage[color1 & comment] = c_colors[1]
-        bitimage[color1 & match] = m_colors[1]
-        bitimage[color1 & highlight] = h_colors[1]
-        bitimage[count:,:,:] = segment_viewer.preferences.empty_background_color.Get(False)
-
-        return bitimage.reshape((nr, bytes_per_row * 7, 3))
+    def get_palette_colors(self, segment_viewer):
+        return self.get_style_colors(segment_viewer, self.get_bw_colors(segment_viewer))
 
+    def get_index_image(self, segment_viewer, bytes_per_row, nr, count, bytes, style):
+        return self.get_lut_pixels(apple2_pixel_lut, bytes_per_row, nr, count, bytes, style)
 
-def generate_apple2_row_offsets():
-    offsets = np.zeros(192, dtype=np.int32)
-    for y in range(192):
-        # From Apple Graphics and Arcade Game Design
-        a = y // 64
-        d = y - (64 * a)
-        b = d // 8
-        c = d - 8 * b
-        offsets[i] = (1024 * c) + (128 * b) + (40 * a)
-    return offsets
 
-def generate_apple2_index():
-    offsets = generate_apple2_row_offsets()
-    bytepos = np.empty((192, 280), dtype=np.int32)
-    bytepos[:,0] = offsets * 7
+class OneBitPerPixelApple2FullScreen(OneBitPerPixelApple2Linear):
+    """Renders the entire hi-res page in screen order
 
-class OneBitPerPixelApple2FullScreen(BaseRenderer):
+    Every row of the screen is gathered from its interleaved offset in the
+    page, so it needs the data starting at the beginning of the page and
+    can't draw an arbitrary range of rows. It isn't one of the bitmap viewer
+    renderers for that reason, but can be used to render whole pages with
+    the headless renderer.
+    """
     name = "B/W, Apple 2, Screen Order"
 
-    def get_bw_colors(self, segment_viewer):
-        return ((0, 0, 0), (255, 255, 255))
+    def validate_bytes_per_row(self, bytes_per_row):
+        return apple2_screen_width
 
-    def get_image(self, segment_viewer, bytes_per_row, nr, count, bytes, style):
-        screen = np.zeros((8192,), dtype=np.uint8)
-        bytes = bytes[0:8192]
-        num_valid = len(bytes)  # might be smaller than 8192
-        screen[:num_valid] = bytes
-        bits = np.unpackbits(bit_reverse_table[screen])
-        pixels = bits.reshape((-1, 8))
-
-        background = (pixels[:,0:7] == 0)
-        color1 = (pixels[:,0:7] == 1)
-
-        bw_colors = self.get_bw_colors(segment_viewer)
-        h_colors = colors.get_blended_color_registers(bw_colors, segment_viewer.preferences.highlight_background_color)
-        m_colors = colors.get_blended_color_registers(bw_colors, segment_viewer.preferences.match_background_color)
-        c_colors = colors.get_blended_color_registers(bw_colors, segment_viewer.preferences.comment_background_color)
-        d_colors = colors.get_dimmed_color_registers(bw_colors, segment_viewer.preferences.background_color, segment_viewer.preferences.data_background_color)
-
-        style_per_pixel = np.vstack((style, style, style, style, style, style, style)).T
-        normal = (style_per_pixel & self.ignore_mask) == 0
-        highlight = (style_per_pixel & selected_bit_mask) == selected_bit_mask
-        data = (style_per_pixel & user_bit_mask) > 0
-        comment = (style_per_pixel & comment_bit_mask) == comment_bit_mask
-        match = (style_per_pixel & match_bit_mask) == match_bit_mask
-
-        bitimage = np.empty((192 * 40, 7, 3), dtype=np.uint8)
-        bitimage[background & normal] = bw_colors[0]
-        bitimage[background & data] = d_colors[0]
-        bitimage[background & comment] = c_colors[0]
-        bitimage[background & match] = m_colors[0]
-        bitimage[background & highlight] = h_colors[0]
-        bitimage[color1 & normal] = bw_colors[1]
-        bitimage[color1 & data] = d_colors[1]
-        bitimage[color1 & comment] = c_colors[1]
-        bitimage[color1 & match] = m_colors[1]
-        bitimage[color1 & highlight] = h_colors[1]
-        bitimage[count:,:,:] = segment_viewer.preferences.empty_background_color.Get(False)
-
-        return bitimage.reshape((nr, bytes_per_row * 7, 3))
-
-
-class OneBitPerPixelApple2Artifacting(BaseRenderer):
-    name = "Apple 2 (artifacting colors)"
+    def get_screen_bytes(self, count, bytes, style):
+        """Rearrange the hi-res page into screen order
 
-    def get_bw_colors(self, segment_viewer):
-        return ((255, 255, 255), (0, 0, 0))
+        Returns the bytes and the style classes of the 7680 bytes on the
+        screen. Screen bytes that are past the end of the data are given the
+        empty style.
+        """
+        num_valid = min(len(bytes), count, apple2_page_size)
+        index = apple2_screen_index
+        valid = index < num_valid
+        screen = np.zeros(len(index), dtype=np.uint8)
+        style_classes = np.empty(len(index), dtype=np.uint8)
+        style_classes.fill(empty_style_class)
+        if valid.all():
+            screen[:] = bytes[index]
+            style_classes[:] = self.get_style_classes(style[index])
+        else:
+            screen[valid] = bytes[index[valid]]
+            style_classes[valid] = self.get_style_classes(style[index[valid]])
+        return screen, style_classes
+
+    def fit_screen(self, array, fill, bytes_per_row, nr):
+        # the screen is always 192 lines, but the caller may be asking for a
+        # different number of bytes
+        size = bytes_per_row * nr * self.pixels_per_byte
+        array = array.ravel()
+        if len(array) < size:
+            array = np.append(array, np.zeros(size - len(array), dtype=np.uint8) + fill)
+        return array[:size].reshape((nr, bytes_per_row * self.pixels_per_byte))
+
+    def get_index_image(self, segment_viewer, bytes_per_row, nr, count, bytes, style):
+        screen, style_classes = self.get_screen_bytes(count, bytes, style)
+        pixels = apple2_pixel_lut[screen]
+        style_classes = style_classes.repeat(self.pixels_per_byte)
+        return self.fit_screen(pixels, 0, bytes_per_row, nr), self.fit_screen(style_classes, empty_style_class, bytes_per_row, nr)
+
+
+# Color registers of the artifacting renderer; the colored pixels start at
+# apple2_artifact_color and use 2 * palette bit + column parity as the offset
+apple2_artifact_black = 0
+apple2_artifact_white = 1
+apple2_artifact_color = 2
+
+
+def generate_apple2_artifact_lut():
+    """Return the table that maps an artifacting index to the color register
+    of a pixel
+
+    The index is built from a three pixel window centered on the pixel, the
+    column parity of the pixel and the palette bit of its byte: bits 0-2 are
+    the pixels to the right, center and left, bit 3 is set for odd columns
+    and bit 4 is the palette bit. An isolated lit pixel shows the color of
+    its column and palette; adjacent lit pixels show white, and an unlit
+    pixel between two lit pixels takes on their color.
+    """
+    index = np.arange(32, dtype=np.uint8)
+    right = index & 1
+    center = (index >> 1) & 1
+    left = (index >> 2) & 1
+    odd = (index >> 3) & 1
+    palette = (index >> 4) & 1
+    color = apple2_artifact_color + palette * 2 + odd
+    neighbor_color = apple2_artifact_color + palette * 2 + (odd ^ 1)
+    lut = np.zeros(32, dtype=np.uint8)
+    lut[(center == 1)] = color[(center == 1)]
+    lut[(center == 1) & ((left == 1) | (right == 1))] = apple2_artifact_white
+    filled = (center == 0) & (left == 1) & (right == 1)
+    lut[filled] = neighbor_color[filled]
+    return lut
+
+apple2_artifact_lut = generate_apple2_artifact_lut()
+
+
+class OneBitPerPixelApple2Artifacting(OneBitPerPixelApple2Linear):
+    name = "Apple 2 (artifacting colors)"
 
     # 0 0000000 0 0000000  # black 0, 0, 0
     # 0 0101010 0 1010101  # green 32, 192, 0
@@ -380,50 +449,37 @@ class OneBitPerPixelApple2Artifacting(BaseRenderer):
     # 01 - orange
     # 11 - white
 
-    def get_image(self, segment_viewer, bytes_per_row, nr, count, bytes, style):
-        bits = np.unpackbits(bit_reverse_table[bytes])
-        pixels = bits.reshape((-1, 8))
-
-        background = (pixels[:,0:7] == 0)
-        color1 = (pixels[:,0:7] == 1)
-
-        bw_colors = self.get_bw_colors(segment_viewer)
-        h_colors = colors.get_blended_color_registers(bw_colors, segment_viewer.preferences.highlight_background_color)
-        m_colors = colors.get_blended_color_registers(bw_colors, segment_viewer.preferences.match_background_color)
-        c_colors = colors.get_blended_color_registers(bw_colors, segment_viewer.preferences.comment_background_color)
-        d_colors = colors.get_dimmed_color_registers(bw_colors, segment_viewer.preferences.background_color, segment_viewer.preferences.data_background_color)
-
-        style_per_pixel = np.vstack((style, style, style, style, style, style, style)).T
-        normal = (style_per_pixel & self.ignore_mask) == 0
-        highlight = (style_per_pixel & selected_bit_mask) == selected_bit_mask
-        data = (style_per_pixel & user_bit_mask) > 0
-        comment = (style_per_pixel & comment_bit_mask) == comment_bit_mask
-        match = (style_per_pixel & match_bit_mask) == match_bit_mask
-
-        bitimage = np.empty((nr * bytes_per_row, 7, 3), dtype=np.uint8)
-        bitimage[background & normal] = bw_colors[0]
-        bitimage[background & data] = d_colors[0]
-        bitimage[background & comment] = c_colors[0]
-        bitimage[background & match] = m_colors[0]
-        bitimage[background & highlight] = h_colors[0]
-        bitimage[color1 & normal] = bw_colors[1]
-        bitimage[color1 & data] = d_colors[1]
-        bitimage[color1 & comment] = c_colors[1]
-        bitimage[color1 & match] = m_colors[1]
-        bitimage[color1 & highlight] = h_colors[1]
-        bitimage[count:,:,:] = segment_viewer.preferences.empty_background_color.Get(False)
-
-        return bitimage.reshape((nr, bytes_per_row * 7, 3))
+    def get_artifact_colors(self, segment_viewer):
+        # in the order of the apple2_artifact_* color registers: black,
+        # white, then the even and odd column colors of each palette
+        return ((0, 0, 0), (255, 255, 255), (159, 0, 253), (32, 192, 0), (0, 128, 255), (240, 80, 0))
+
+    def get_palette_colors(self, segment_viewer):
+        return self.get_style_colors(segment_viewer, self.get_artifact_colors(segment_viewer))
+
+    def get_index_image(self, segment_viewer, bytes_per_row, nr, count, bytes, style):
+        bits, style_classes = self.get_lut_pixels(apple2_pixel_lut, bytes_per_row, nr, count, bytes, style)
+
+        # pixels on either side, with the edges of the rows unlit
+        width = bits.shape[1]
+        window = bits << 1
+        window[:,1:] |= bits[:,:-1] << 2
+        window[:,:-1] |= bits[:,1:]
+        window[:,1::2] |= 8
+        palette = (bytes[:nr * bytes_per_row] >> 7).repeat(self.pixels_per_byte).reshape((nr, width))
+        window |= palette << 4
+        return apple2_artifact_lut[window], style_classes
 
 
 class TwoBitsPerPixel(BaseRenderer):
     name = "2bpp"
     pixels_per_byte = 4
 
-    def get_image(self, segment_viewer, bytes_per_row, nr, count, bytes, style):
-        colors = self.get_colors(segment_viewer, [0, 1, 2, 3])
-        bitimage = self.get_2bpp(segment_viewer, bytes_per_row, nr, count, bytes, style, colors)
-        return self.reshape(bitimage, bytes_per_row, nr)
+    def get_palette_colors(self, segment_viewer):
+        return self.get_colors(segment_viewer, [0, 1, 2, 3])
+
+    def get_index_image(self, segment_viewer, bytes_per_row, nr, count, bytes, style):
+        return self.get_packed_pixels(2, bytes_per_row, nr, count, bytes, style)
 
 
 class ModeD(TwoBitsPerPixel):
@@ -432,10 +488,8 @@ class ModeD(TwoBitsPerPixel):
     scale_height = 2
     pixels_per_byte = 4
 
-    def get_image(self, segment_viewer, bytes_per_row, nr, count, bytes, style):
-        colors = self.get_colors(segment_viewer, [8, 4, 5, 6])
-        bitimage = self.get_2bpp(segment_viewer, bytes_per_row, nr, count, bytes, style, colors)
-        return self.reshape(bitimage, bytes_per_row, nr)
+    def get_palette_colors(self, segment_viewer):
+        return self.get_colors(segment_viewer, [8, 4, 5, 6])
 
 
 class ModeE(ModeD):
@@ -449,19 +503,21 @@ class FourBitsPerPixel(BaseRenderer):
     name = "4bpp"
     pixels_per_byte = 2
 
-    def get_image(self, segment_viewer, bytes_per_row, nr, count, bytes, style):
-        colors = self.get_colors(segment_viewer, range(16))
-        bitimage = self.get_4bpp(segment_viewer, bytes_per_row, nr, count, bytes, style, colors)
-        return self.reshape(bitimage, bytes_per_row, nr)
+    def get_palette_colors(self, segment_viewer):
+        return self.get_colors(segment_viewer, range(16))
+
+    def get_index_image(self, segment_viewer, bytes_per_row, nr, count, bytes, style):
+        return self.get_packed_pixels(4, bytes_per_row, nr, count, bytes, style)
 
 
 class TwoBitPlanesLE(BaseRenderer):
     name = "2 Bit Planes (little endian)"
+    plane_weights = (1, 2)
     pixels_per_byte = 8
     bitplanes = 2
 
     def get_bitplane_pixels(self, bits, pixels, bytes_per_row, pixels_per_row):
-        for i in range(pixels_per_row):
+        for i in range(8):
             pixels[:,i] = bits[0::2,i] + bits[1::2,i] * 2
 
     def get_bitplane_style(self, style):
@@ -473,26 +529,27 @@ class TwoBitPlanesLE(BaseRenderer):
             bytes_per_row = (scale + 1) * self.bitplanes
         return bytes_per_row
 
-    def get_image(self, segment_viewer, bytes_per_row, nr, count, bytes, style):
-        colors = self.get_colors(segment_viewer, range(2**self.bitplanes))
-        bitimage = self.get_bitplanes(segment_viewer, bytes_per_row, nr, count, bytes, style, colors)
-        return bitimage
+    def get_index_image(self, segment_viewer, bytes_per_row, nr, count, bytes, style):
+        return self.get_bitplanes(bytes_per_row, nr, count, bytes, style)
 
 
 class TwoBitPlanesBE(TwoBitPlanesLE):
     name = "2 Bit Planes (big endian)"
+    plane_weights = (2, 1)
 
     def get_bitplane_pixels(self, bits, pixels, bytes_per_row, pixels_per_row):
-        for i in range(pixels_per_row):
+        for i in range(8):
             pixels[:,i] = bits[0::2,i] * 2 + bits[1::2,i]
 
 
 class TwoBitPlanesLineLE(TwoBitPlanesLE):
     name = "2 Bit Planes (little endian, interleave by line)"
+    plane_weights = (1, 2)
+    interleave_by_line = True
 
     def get_bitplane_pixels(self, bits, pixels, bytes_per_row, pixels_per_row):
         pixel_rows = bytes_per_row / 2
-        for i in range(pixels_per_row):
+        for i in range(8):
             for j in range(pixel_rows):
                 little = j
                 big = j + pixel_rows
@@ -501,10 +558,12 @@ class TwoBitPlanesLineLE(TwoBitPlanesLE):
 
 class TwoBitPlanesLineBE(TwoBitPlanesLE):
     name = "2 Bit Planes (big endian, interleave by line)"
+    plane_weights = (2, 1)
+    interleave_by_line = True
 
     def get_bitplane_pixels(self, bits, pixels, bytes_per_row, pixels_per_row):
         pixel_rows = bytes_per_row / 2
-        for i in range(pixels_per_row):
+        for i in range(8):
             for j in range(pixel_rows):
                 little = j + pixel_rows
                 big = j
@@ -513,10 +572,11 @@ class TwoBitPlanesLineBE(TwoBitPlanesLE):
 
 class ThreeBitPlanesLE(TwoBitPlanesLE):
     name = "3 Bit Planes (little endian)"
+    plane_weights = (4, 2, 1)
     bitplanes = 3
 
     def get_bitplane_pixels(self, bits, pixels, bytes_per_row, pixels_per_row):
-        for i in range(pixels_per_row):
+        for i in range(8):
             pixels[:,i] = bits[0::3,i] * 4 + bits[1::3,i] * 2 + bits[2::3,i]
 
     def get_bitplane_style(self, style):
@@ -525,19 +585,22 @@ class ThreeBitPlanesLE(TwoBitPlanesLE):
 
 class ThreeBitPlanesBE(ThreeBitPlanesLE):
     name = "3 Bit Planes (big endian)"
+    plane_weights = (1, 2, 4)
     bitplanes = 3
 
     def get_bitplane_pixels(self, bits, pixels, bytes_per_row, pixels_per_row):
-        for i in range(pixels_per_row):
+        for i in range(8):
             pixels[:,i] = bits[0::3,i] + bits[1::3,i] * 2 + bits[2::3,i] * 4
 
 
 class ThreeBitPlanesLineLE(ThreeBitPlanesLE):
     name = "3 Bit Planes (little endian, interleave by line)"
+    plane_weights = (1, 2, 4)
+    interleave_by_line = True
 
     def get_bitplane_pixels(self, bits, pixels, bytes_per_row, pixels_per_row):
         pixel_rows = bytes_per_row / 3
-        for i in range(pixels_per_row):
+        for i in range(8):
             for j in range(pixel_rows):
                 little = j
                 mid = j + pixel_rows
@@ -547,10 +610,12 @@ class ThreeBitPlanesLineLE(ThreeBitPlanesLE):
 
 class ThreeBitPlanesLineBE(ThreeBitPlanesBE):
     name = "3 Bit Planes (big endian, interleave by line)"
+    plane_weights = (4, 2, 1)
+    interleave_by_line = True
 
     def get_bitplane_pixels(self, bits, pixels, bytes_per_row, pixels_per_row):
         pixel_rows = bytes_per_row / 3
-        for i in range(pixels_per_row):
+        for i in range(8):
             for j in range(pixel_rows):
                 little = j + (2 * pixel_rows)
                 mid = j + pixel_rows
@@ -560,10 +625,11 @@ class ThreeBitPlanesLineBE(ThreeBitPlanesBE):
 
 class FourBitPlanesLE(TwoBitPlanesLE):
     name = "4 Bit Planes (little endian)"
+    plane_weights = (8, 4, 2, 1)
     bitplanes = 4
 
     def get_bitplane_pixels(self, bits, pixels, bytes_per_row, pixels_per_row):
-        for i in range(pixels_per_row):
+        for i in range(8):
             pixels[:,i] = bits[0::4,i] * 8 + bits[1::4,i] * 4 + bits[2::4,i] * 2 + bits[3::4,i]
 
     def get_bitplane_style(self, style):
@@ -572,18 +638,21 @@ class FourBitPlanesLE(TwoBitPlanesLE):
 
 class FourBitPlanesBE(FourBitPlanesLE):
     name = "4 Bit Planes (big endian)"
+    plane_weights = (1, 2, 4, 8)
 
     def get_bitplane_pixels(self, bits, pixels, bytes_per_row, pixels_per_row):
-        for i in range(pixels_per_row):
+        for i in range(8):
             pixels[:,i] = bits[0::4,i] + bits[1::4,i] * 2 + bits[2::4,i] * 4 + bits[3::4,i] * 8
 
 
 class FourBitPlanesLineLE(FourBitPlanesLE):
     name = "4 Bit Planes (little endian, interleave by line)"
+    plane_weights = (1, 2, 4, 8)
+    interleave_by_line = True
 
     def get_bitplane_pixels(self, bits, pixels, bytes_per_row, pixels_per_row):
         pixel_rows = bytes_per_row / 4
-        for i in range(pixels_per_row):
+        for i in range(8):
             for j in range(pixel_rows):
                 little = j
                 little_mid = j + pixel_rows
@@ -594,10 +663,12 @@ class FourBitPlanesLineLE(FourBitPlanesLE):
 
 class FourBitPlanesLineBE(FourBitPlanesLE):
     name = "4 Bit Planes (big endian, interleave by line)"
+    plane_weights = (8, 4, 2, 1)
+    interleave_by_line = True
 
     def get_bitplane_pixels(self, bits, pixels, bytes_per_row, pixels_per_row):
         pixel_rows = bytes_per_row / 4
-        for i in range(pixels_per_row):
+        for i in range(8):
             for j in range(pixel_rows):
                 little = j + (3 * pixel_rows)
                 little_mid = j + (2 * pixel_rows)
@@ -618,11 +689,7 @@ class GTIA9(FourBitsPerPixel):
     def get_colors(self, segment_viewer, registers):
         antic_color_registers = self.get_antic_color_registers(segment_viewer)
         color_registers = segment_viewer.machine.get_color_registers(antic_color_registers)
-        h_colors = colors.get_blended_color_registers(color_registers, segment_viewer.preferences.highlight_background_color)
-        m_colors = colors.get_blended_color_registers(color_registers, segment_viewer.preferences.match_background_color)
-        c_colors = colors.get_blended_color_registers(color_registers, segment_viewer.preferences.comment_background_color)
-        d_colors = colors.get_dimmed_color_registers(color_registers, segment_viewer.preferences.background_color, segment_viewer.preferences.data_background_color)
-        return color_registers, h_colors, m_colors, c_colors, d_colors
+        return self.get_style_colors(segment_viewer, color_registers)
 
 
 class GTIA10(GTIA9):
@@ -653,6 +720,8 @@ class BaseBytePerPixelRenderer(BaseRenderer):
     name = "Intermediate Mode 1 Byte Per Pixel"
     pixels_per_byte = 1
     bitplanes = 1
+    num_colors = 16
+    style_precedence = (comment_style_class, match_style_class, data_style_class, highlight_style_class)
 
     def pixels_from_2bpp(self, segment_viewer, bytes_per_row, nr, count, bytes, style, colors):
         bits = np.unpackbits(bytes)
@@ -665,66 +734,62 @@ class BaseBytePerPixelRenderer(BaseRenderer):
         style_per_pixel = np.vstack((style, style, style, style)).T
         return pixels, style_per_pixel
 
-    def get_image(self, segment_viewer, bytes_per_row, nr, count, bytes, style):
-        normal = style == 0
-        highlight = (style & selected_bit_mask) == selected_bit_mask
-        comment = (style & comment_bit_mask) == comment_bit_mask
-        data = (style & user_bit_mask) > 0
-        match = (style & match_bit_mask) == match_bit_mask
-
-        color_registers, h_colors, m_colors, c_colors, d_colors = self.get_colors(segment_viewer, range(16))
-        bitimage = np.empty((nr * bytes_per_row, 3), dtype=np.uint8)
-        for i in range(16):
-            color_is_set = (bytes == i)
-            bitimage[color_is_set & normal] = color_registers[i]
-            bitimage[color_is_set & comment] = c_colors[i]
-            bitimage[color_is_set & match] = m_colors[i]
-            bitimage[color_is_set & data] = d_colors[i]
-            bitimage[color_is_set & highlight] = h_colors[i]
-        bitimage[count:,:] = segment_viewer.preferences.empty_background_color.Get(False)
-        return bitimage.reshape((nr, bytes_per_row, 3))
+    def get_palette_colors(self, segment_viewer):
+        return self.get_colors(segment_viewer, range(self.num_colors))
 
+    def get_index_image(self, segment_viewer, bytes_per_row, nr, count, bytes, style):
+        pixels = bytes.reshape((nr, bytes_per_row))
+        style_classes = self.get_style_classes(style)
+        style_classes[count:] = empty_style_class
+        return pixels, style_classes.reshape((nr, bytes_per_row))
 
-def get_numpy_font_map_image(segment_viewer, antic_font, bytes, style, start_byte, end_byte, bytes_per_row, num_rows, start_col, num_cols):
-    width = int(antic_font.char_w * num_cols)
-    height = int(num_rows * antic_font.char_h)
-    log.debug("pixel width: %dx%d" % (width, height))
-    array = np.empty((height, width, 3), dtype=np.uint8)
 
+class JumpmanPlayfieldRenderer(BaseBytePerPixelRenderer):
+    """ Custom renderer instead of Antic Mode D renderer. Need to display
+    highlighting on a per-pixel level which isn't possible with the Mode D
+    renderer because the styling info is applied at the byte level and there
+    are 4 pixels per byte in Mode D.
+
+    So this renderer is one byte per pixel, using the first 32 colors. It is
+    mapped to the ANTIC color register order, so the first 4 colors are
+    player colors, then the 5 playfield colors. A blank screen corresponds to
+    the index value of 8, so the last playfield color.
+    """
+    name = "Jumpman 1 Byte Per Pixel"
+    num_colors = 32
+
+
+def get_font_map_glyphs(segment_viewer, antic_font, bytes, style, start_byte, end_byte, bytes_per_row, num_rows, start_col, num_cols):
+    """Return the index into the glyph atlas of antic_font for each character
+    cell. Cells past the end of the data or past the end of the row use the
+    blank glyph.
+    """
     log.debug("start byte: %s, end_byte: %s, bytes_per_row=%d num_rows=%d start_col=%d num_cols=%d" % (start_byte, end_byte, bytes_per_row, num_rows, start_col, num_cols))
     end_col = min(bytes_per_row, start_col + num_cols)
-    y = 0
-    e = start_byte
-    f = antic_font.normal_font
-    fh = antic_font.highlight_font
-    fd = antic_font.data_font
-    fm = antic_font.match_font
-    fc = antic_font.comment_font
-    char_w = antic_font.char_w
-    char_h = antic_font.char_h
     mapping = segment_viewer.machine.font_mapping.font_mapping
-    for j in range(num_rows):
-        x = 0
-        for i in range(start_col, start_col + num_cols):
-            if e + i >= end_byte or i >= end_col:
-                array[y:y+char_h,x:x+char_w,:] = segment_viewer.preferences.background_color
-            else:
-                c = mapping[bytes[j, i]]
-                s = style[j, i]
-                if s & selected_bit_mask:
-                    array[y:y+char_h,x:x+char_w,:] = fh[c]
-                elif s & match_bit_mask:
-                    array[y:y+char_h,x:x+char_w,:] = fm[c]
-                elif s & comment_bit_mask:
-                    array[y:y+char_h,x:x+char_w,:] = fc[c]
-                elif s & user_bit_mask:
-                    array[y:y+char_h,x:x+char_w,:] = fd[c]
-                else:
-                    array[y:y+char_h,x:x+char_w,:] = f[c]
-            x += char_w
-        y += char_h
-        e += bytes_per_row
-    return array
+    glyphs = np.empty((num_rows, num_cols), dtype=np.intp)
+    glyphs[:,:] = antic_font.blank_glyph
+    if end_col > start_col:
+        style_classes = get_style_class_lut(BaseRenderer.style_precedence)[style[0:num_rows,start_col:end_col]]
+        glyphs[:,0:end_col - start_col] = style_classes * antic_font.glyphs_per_style + mapping[bytes[0:num_rows,start_col:end_col]]
+    row_start = start_byte + np.arange(num_rows) * bytes_per_row
+    past_end = (row_start[:,np.newaxis] + np.arange(start_col, start_col + num_cols)) >= end_byte
+    glyphs[past_end] = antic_font.blank_glyph
+    return glyphs
+
+
+def get_numpy_font_glyph_image(font_atlas, glyphs):
+    num_rows, num_cols = glyphs.shape
+    _, char_h, char_w, _ = font_atlas.shape
+    # (rows, cols, char_h, char_w, 3) -> (rows, char_h, cols, char_w, 3) so
+    # the pixel rows of each character line up when flattened
+    array = font_atlas[glyphs].transpose(0, 2, 1, 3, 4)
+    return array.reshape((num_rows * char_h, num_cols * char_w, 3))
+
+
+def get_numpy_font_map_image(segment_viewer, antic_font, bytes, style, start_byte, end_byte, bytes_per_row, num_rows, start_col, num_cols):
+    glyphs = get_font_map_glyphs(segment_viewer, antic_font, bytes, style, start_byte, end_byte, bytes_per_row, num_rows, start_col, num_cols)
+    return get_numpy_font_glyph_image(antic_font.font_atlas, glyphs)
 
 
 class Mode2(BaseRenderer):
@@ -736,11 +801,12 @@ class Mode2(BaseRenderer):
     expected_chars = 128
 
     @classmethod
-    def get_image(cls, machine, antic_font, bytes, style, start_byte, end_byte, bytes_per_row, nr, start_col, visible_cols):
+    def get_image(cls, segment_viewer, antic_font, bytes, style, start_byte, end_byte, bytes_per_row, nr, start_col, visible_cols):
+        glyphs = get_font_map_glyphs(segment_viewer, antic_font, bytes, style, start_byte, end_byte, bytes_per_row, nr, start_col, visible_cols)
         if speedups is not None:
-            array = speedups.get_numpy_font_map_image(machine, antic_font, bytes, style, start_byte, end_byte, bytes_per_row, nr, start_col, visible_cols)
+            array = speedups.get_font_glyph_image(antic_font.font_atlas, glyphs)
         else:
-            array = get_numpy_font_map_image(machine, antic_font, bytes, style, start_byte, end_byte, bytes_per_row, nr, start_col, visible_cols)
+            array = get_numpy_font_glyph_image(antic_font.font_atlas, glyphs)
         return array
 
     @property
@@ -1009,6 +1075,10 @@ class ATASCIIFontMapping(object):
         return False
 
     def wx_char_to_byte(self, char, mods, control):
+        # wx is only needed for keyboard input, so the renderers can still be
+        # used without a GUI
+        import wx
+
         byte = None
 
         if mods == wx.MOD_RAW_CONTROL:
@@ -1081,6 +1151,31 @@ class AnticFontMapping(ATASCIIFontMapping):
 
 class BytePerPixelMemoryMap(BaseRenderer):
     name = "1Bpp Greyscale"
+    pixels_per_byte = 1
+
+    def get_palette(self, segment_viewer):
+        """Inverted greyscale ramp, where styled bytes are shaded with the
+        background color of their style instead of grey.
+        """
+        prefs = segment_viewer.preferences
+        shade = (np.arange(256, dtype=np.uint32) ^ 0xff).reshape((-1, 1))
+        palette = np.empty((num_style_classes, 256, 3), dtype=np.uint8)
+        palette[normal_style_class] = shade
+        for style_class, color in [
+                (data_style_class, prefs.data_background_color),
+                (comment_style_class, prefs.comment_background_color),
+                (match_style_class, prefs.match_background_color),
+                (highlight_style_class, prefs.highlight_background_color)]:
+            rgb = np.asarray(color.Get(False), dtype=np.uint32)
+            palette[style_class] = (rgb * shade) >> 8
+        palette[empty_style_class,:] = prefs.empty_background_color.Get(False)
+        return palette
+
+    def get_index_image(self, segment_viewer, bytes_per_row, nr, count, bytes, style):
+        pixels = bytes.reshape((nr, bytes_per_row))
+        style_classes = self.get_style_classes(style)
+        style_classes[count:] = empty_style_class
+        return pixels, style_classes.reshape((nr, bytes_per_row))
 
     def get_image(self, segment_viewer, bytes, style, start_byte, end_byte, bytes_per_row, nr, start_col, visible_cols):
         if speedups is not None:
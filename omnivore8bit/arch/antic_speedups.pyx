@@ -2,11 +2,16 @@ from __future__ import division
 import cython
 import numpy as np
 cimport numpy as np
+from cython.parallel import prange
+
+# All the kernels release the GIL and split the rows of the image across
+# cores (when compiled with OpenMP support), so large views of big images use
+# all the processors and don't block other threads like the emulator.
 
 
 @cython.boundscheck(False)
 @cython.wraparound(False)
-def get_numpy_memory_map_image(segment_viewer, np.ndarray[np.uint8_t, ndim=2] bytes, np.ndarray[np.uint8_t, ndim=2] style, int start_byte, int end_byte, int bytes_per_row, int num_rows, int start_col, int num_cols):
+def get_numpy_memory_map_image(segment_viewer, np.uint8_t[:,:] bytes, np.uint8_t[:,:] style, int start_byte, int end_byte, int bytes_per_row, int num_rows, int start_col, int num_cols):
     cdef int num_rows_with_data = (end_byte - start_byte + bytes_per_row - 1) // bytes_per_row
     cdef np.uint8_t bgr = segment_viewer.preferences.background_color[0]
     cdef np.uint8_t bgg = segment_viewer.preferences.background_color[1]
@@ -20,37 +25,87 @@ def get_numpy_memory_map_image(segment_viewer, np.ndarray[np.uint8_t, ndim=2] by
     cdef int width = end_col - start_col
     cdef int height = num_rows_with_data
     cdef np.ndarray[np.uint8_t, ndim=3] array = np.empty([height, width, 3], dtype=np.uint8)
+    cdef np.uint8_t[:,:,:] fast_array = array
 
-    cdef int y = 0
-    cdef int e = start_byte
-    cdef int x, i, j
-    cdef np.uint8_t bw = 0xff
+    cdef int x, i, j, e
     cdef np.uint8_t c, s
-    cdef np.uint16_t h
-    for j in range(end_row):
-        x = 0
-        for i in range(start_col, end_col):
-            if e + i >= end_byte:
-                array[y,x,0] = bgr
-                array[y,x,1] = bgg
-                array[y,x,2] = bgb
-            else:
-                c = bytes[j, i] ^ bw
-                s = style[j, i]
-                if s & 0x80:
-                    h = sr * c >> 8
-                    array[y,x,0] = h
-                    h = sg * c >> 8
-                    array[y,x,1] = h
-                    h = sb * c >> 8
-                    array[y,x,2] = h
+    with nogil:
+        for j in prange(height, schedule='static'):
+            e = start_byte + j * bytes_per_row
+            for x in range(width):
+                i = start_col + x
+                if j >= end_row or e + i >= end_byte:
+                    fast_array[j,x,0] = bgr
+                    fast_array[j,x,1] = bgg
+                    fast_array[j,x,2] = bgb
                 else:
-                    array[y,x,0] = c
-                    array[y,x,1] = c
-                    array[y,x,2] = c
-            x += 1
-        y += 1
-        e += bytes_per_row
+                    c = bytes[j, i] ^ 0xff
+                    s = style[j, i]
+                    if s & 0x80:
+                        fast_array[j,x,0] = (sr * c) >> 8
+                        fast_array[j,x,1] = (sg * c) >> 8
+                        fast_array[j,x,2] = (sb * c) >> 8
+                    else:
+                        fast_array[j,x,0] = c
+                        fast_array[j,x,1] = c
+                        fast_array[j,x,2] = c
+
+    return array
+
+
+# Decode packed 1, 2 or 4 bit per pixel data into color register indexes and
+# style classes; see BaseRenderer.get_packed_pixels. pixel_lut holds the
+# pixels packed into each byte value and style_class_lut the style class of
+# each style value.
+@cython.boundscheck(False)
+@cython.wraparound(False)
+def get_packed_pixels(np.uint8_t[:] bytes, np.uint8_t[:] style, np.uint8_t[:,:] pixel_lut, np.uint8_t[:] style_class_lut, int bytes_per_row, int num_rows, int count, int empty_style_class):
+    cdef int pixels_per_byte = pixel_lut.shape[1]
+    cdef int width = bytes_per_row * pixels_per_byte
+    cdef np.ndarray[np.uint8_t, ndim=2] pixels = np.empty([num_rows, width], dtype=np.uint8)
+    cdef np.ndarray[np.uint8_t, ndim=2] style_classes = np.empty([num_rows, width], dtype=np.uint8)
+    cdef np.uint8_t[:,:] fast_pixels = pixels
+    cdef np.uint8_t[:,:] fast_style_classes = style_classes
+
+    cdef int i, j, k, x, index
+    cdef np.uint8_t b, s
+    with nogil:
+        for j in prange(num_rows, schedule='static'):
+            for i in range(bytes_per_row):
+                index = j * bytes_per_row + i
+                b = bytes[index]
+                if index < count:
+                    s = style_class_lut[style[index]]
+                else:
+                    s = empty_style_class
+                x = i * pixels_per_byte
+                for k in range(pixels_per_byte):
+                    fast_pixels[j, x + k] = pixel_lut[b, k]
+                    fast_style_classes[j, x + k] = s
+
+    return pixels, style_classes
+
+
+# Convert color register indexes and style classes to RGB through the
+# palette; see BaseRenderer.get_rgb_image
+@cython.boundscheck(False)
+@cython.wraparound(False)
+def get_rgb_image(np.uint8_t[:,:,:] palette, np.uint8_t[:,:] pixels, np.uint8_t[:,:] style_classes):
+    cdef int height = pixels.shape[0]
+    cdef int width = pixels.shape[1]
+    cdef np.ndarray[np.uint8_t, ndim=3] array = np.empty([height, width, 3], dtype=np.uint8)
+    cdef np.uint8_t[:,:,:] fast_array = array
+
+    cdef int x, y
+    cdef np.uint8_t c, s
+    with nogil:
+        for y in prange(height, schedule='static'):
+            for x in range(width):
+                c = pixels[y, x]
+                s = style_classes[y, x]
+                fast_array[y, x, 0] = palette[s, c, 0]
+                fast_array[y, x, 1] = palette[s, c, 1]
+                fast_array[y, x, 2] = palette[s, c, 2]
 
     return array
 
@@ -58,48 +113,30 @@ def get_numpy_memory_map_image(segment_viewer, np.ndarray[np.uint8_t, ndim=2] by
 # Fast font rendering. As an optimization, only renders complete rectangles.
 # The first and last row may be partial depending on the start offset of the
 # segment, but these now have to be rendered separately in their own (single
-# row) rectangle
+# row) rectangle. The glyph index of each cell into the font atlas (see
+# antic_renderers.get_font_map_glyphs) already includes the style variant.
 @cython.boundscheck(False)
 @cython.wraparound(False)
-def get_numpy_font_map_image(segment_viewer, antic_font, np.ndarray[np.uint8_t, ndim=2] bytes, np.ndarray[np.uint8_t, ndim=2] style, int start_byte, int end_byte, int bytes_per_row, int num_rows, int start_col, int num_cols):
-    cdef int char_w = antic_font.char_w
-    cdef int char_h = antic_font.char_h
-    cdef int end_col = min(bytes_per_row, start_col + num_cols)
-    cdef int width = char_w * num_cols
-    cdef int height = num_rows * char_h
-    cdef np.ndarray[np.uint8_t, ndim=3] array = np.empty([height, width, 3], dtype=np.uint8)
+def get_font_glyph_image(np.uint8_t[:,:,:,:] font_atlas, np.intp_t[:,:] glyphs):
+    cdef int num_rows = glyphs.shape[0]
+    cdef int num_cols = glyphs.shape[1]
+    cdef int char_h = font_atlas.shape[1]
+    cdef int char_w = font_atlas.shape[2]
+    cdef np.ndarray[np.uint8_t, ndim=3] array = np.empty([num_rows * char_h, num_cols * char_w, 3], dtype=np.uint8)
     cdef np.uint8_t[:,:,:] fast_array = array
 
-    cdef int y = 0
-    cdef int x, i, j
-    cdef np.ndarray[np.uint8_t, ndim=4] f = antic_font.normal_font
-    cdef np.uint8_t[:,:,:,:] fast_f = f
-    cdef np.ndarray[np.uint8_t, ndim=4] fh = antic_font.highlight_font
-    cdef np.uint8_t[:,:,:,:] fast_fh = fh
-    cdef np.ndarray[np.uint8_t, ndim=4] fd = antic_font.data_font
-    cdef np.uint8_t[:,:,:,:] fast_fd = fd
-    cdef np.ndarray[np.uint8_t, ndim=4] fm = antic_font.match_font
-    cdef np.uint8_t[:,:,:,:] fast_fm = fm
-    cdef np.ndarray[np.uint8_t, ndim=4] fc = antic_font.comment_font
-    cdef np.uint8_t[:,:,:,:] fast_fc = fc
-    cdef np.uint8_t s, c
-    cdef np.ndarray[np.uint8_t] mapping = segment_viewer.machine.font_mapping.font_mapping
-    for j in range(num_rows):
-        x = 0
-        for i in range(start_col, start_col + num_cols):
-            c = mapping[bytes[j, i]]
-            s = style[j, i]
-            if s & 0x80:
-                fast_array[y:y+char_h,x:x+char_w,:] = fast_fh[c]
-            elif s & 0x20:
-                fast_array[y:y+char_h,x:x+char_w,:] = fast_fm[c]
-            elif s & 0x40:
-                fast_array[y:y+char_h,x:x+char_w,:] = fast_fc[c]
-            elif s & 0x07:
-                fast_array[y:y+char_h,x:x+char_w,:] = fast_fd[c]
-            else:
-                fast_array[y:y+char_h,x:x+char_w,:] = fast_f[c]
-            x += char_w
-        y += char_h
+    cdef int y, x, i, j, h, w
+    cdef np.intp_t g
+    with nogil:
+        for j in prange(num_rows, schedule='static'):
+            y = j * char_h
+            for i in range(num_cols):
+                g = glyphs[j, i]
+                x = i * char_w
+                for h in range(char_h):
+                    for w in range(char_w):
+                        fast_array[y + h, x + w, 0] = font_atlas[g, h, w, 0]
+                        fast_array[y + h, x + w, 1] = font_atlas[g, h, w, 1]
+                        fast_array[y + h, x + w, 2] = font_atlas[g, h, w, 2]
 
     return array
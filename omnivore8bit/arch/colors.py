@@ -100,6 +100,26 @@ def powerup_colors():
     return list([4, 30, 68, 213, 40, 202, 148, 70, 0])
 
 
+def get_color_registers(antic_color_registers, color_converter):
+    """Convert ANTIC color register values to the RGB register list used by
+    the renderers
+    """
+    registers = []
+    for c in antic_color_registers:
+        registers.append(color_converter(c))
+
+    # make sure there are 16 registers for 4bpp modes
+    for i in range(len(registers), 16):
+        registers.append((i*16, i*16, i*16))
+
+    # Extend to 32 for dimmed copies of the 16 colors
+    dim = []
+    for r in registers:
+        dim.append((r[0]/4 + 64, r[1]/4 + 64, r[2]/4 + 64))
+    registers.extend(dim)
+    return registers
+
+
 def gr0_colors(colors):
     if len(colors) == 5:
         bg_index = 2
@@ -1,12 +1,22 @@
+import threading
+import Queue
+from collections import OrderedDict
+
 import numpy as np
 
 from udis import miniasm, cputables
 import udis.udis_fast as udis_fast
 from udis.udis_fast.disasm_info import fast_disassemble_segment
 
-from atrcopy import match_bit_mask, comment_bit_mask, selected_bit_mask, user_bit_mask, data_style
+from atrcopy import match_bit_mask, comment_bit_mask, selected_bit_mask, user_bit_mask, data_style, DefaultSegment
+
+from omnivore8bit.utils.segmentutil import values_to_ranges
 
 from memory_map import EmptyMemoryMap
+from disasm_cache import get_key
+from listing import ListingWriter
+from disasm_search import DisassemblySearchIndex
+from xref import CrossReferenceIndex, get_line_arrays, xref_other, xref_read, xref_write, xref_jump, xref_call
 
 import logging
 log = logging.getLogger(__name__)
@@ -27,6 +37,42 @@ style_names = {
     UNINITIALIZED_DATA: "uninitialized data",
 }
 
+# Entry in BaseDisassembler.opcode_kinds for an opcode that hasn't been seen
+opcode_kind_unknown = 255
+
+# Syntax of the assemblers that listings can be generated for
+known_assemblers = [
+    {'comment char': ';',
+     'origin': '*=',
+     'data byte': '.byte',
+     'data byte prefix': '$',
+     'data byte separator': ', ',
+     'name': "MAC/65",
+     },
+    {'comment char': ';',
+     'origin': '.org',
+     'data byte': '.byte',
+     'data byte prefix': '$',
+     'data byte separator': ', ',
+     'name': "cc65",
+     },
+    {'comment char': ';',
+     'origin': '.org',
+     'data byte': '.byte',
+     'data byte prefix': '$',
+     'data byte separator': ', ',
+     'name': "MADS",
+     },
+    {'comment char': ';',
+     'origin': 'org',
+     'data byte': 'hex',
+     'data byte prefix': '',
+     'data byte separator': '',
+     'name': "Merlin",
+     },
+    ]
+
+
 def get_style_name(segment, index):
     if segment.is_valid_index(index):
         s = segment.style[index] & user_bit_mask
@@ -42,44 +88,548 @@ def iter_disasm_styles():
         yield i, name
 
 def fast_get_entire_style_ranges(segment, split_comments=[data_style], **kwargs):
+    """Return a list of ((start, end), style) covering the segment, where
+    style is the user style of the range.
+
+    A new range starts wherever the user style changes, and also at every
+    commented byte whose style is in split_comments.
+    """
     style_copy = segment.get_comment_locations(**kwargs)
-    # print "FAST_GET_ENTIRE", style_copy
-    # last = -1
-    # for i in range(len(style_copy)):
-    #     s = style_copy[i]
-    #     if s & comment_bit_mask:
-    #         if last == s:
-    #             print "%04x" % i,
-    #         else:
-    #             print
-    #             print "comment type: %02x" % s,
-    #             last = s
-    # print
-    num_bytes = len(style_copy)
-    if num_bytes < 1:
-        return []
-    first_index = 0
-    first_style = style_copy[0]
-    base_style = style_copy[0] & user_bit_mask
-    ranges = []
-    for i in range(1, num_bytes):
-        s = style_copy[i]
-        s2 = s & user_bit_mask
-        # print "%04x" % i, s, s2,
-        if s & comment_bit_mask:
-            if s2 == base_style and s2 not in split_comments:
-                # print "same w/skippable comment"
+    styles = style_copy & user_bit_mask
+    split = (style_copy & comment_bit_mask) > 0
+    split &= np.in1d(styles, split_comments)
+    return values_to_ranges(styles, split)
+
+
+class DisassemblyLine(object):
+    """Copy of a single row of the disassembly results
+
+    Rows produced by the fast disassembler refer to storage that belongs to
+    the results object, so rows that are moved into a
+    SplicedDisassemblyInfo are copied.
+    """
+    __slots__ = ['pc', 'dest_pc', 'num_bytes', 'flag', 'instruction']
+
+    def __init__(self, line):
+        self.pc = line.pc
+        self.dest_pc = line.dest_pc
+        self.num_bytes = line.num_bytes
+        self.flag = line.flag
+        self.instruction = line.instruction
+
+    is_placeholder = False
+
+    def __repr__(self):
+        return "%04x %d %02x %s" % (self.pc, self.num_bytes, self.flag, self.instruction)
+
+
+class PlaceholderLine(DisassemblyLine):
+    """Row standing in for bytes that haven't been disassembled yet
+
+    The instruction is only a comment, so the row displays the bytes with an
+    empty operand.
+    """
+    __slots__ = []
+
+    is_placeholder = True
+
+    def __init__(self, pc, num_bytes):
+        self.pc = pc
+        self.dest_pc = 0
+        self.num_bytes = num_bytes
+        self.flag = 0
+        self.instruction = ";..."
+
+
+class SplicedDisassemblyInfo(object):
+    """Disassembly results that can have runs of rows replaced
+
+    Provides the same interface as the results of fast_disassemble_segment
+    (row lookup, index_to_row and labels) but keeps its rows in a list so
+    the rows around an edit can be replaced by a new partial disassembly.
+    The labels array is kept up to date by counting the rows that refer to
+    each address, and the address, target address and flags of the rows
+    are also kept in arrays.
+
+    The rows are copied from info, the results of the fast disassembler, or
+    if info is None the list of lines is used as the initial rows.
+    """
+    def __init__(self, start_addr, num_bytes, info=None, lines=None):
+        self.start_addr = start_addr
+        if info is not None:
+            self.lines = [DisassemblyLine(line) for line in info]
+            self.index_to_row = np.array(info.index_to_row[0:num_bytes], dtype=np.int32)
+            self.labels = np.array(info.labels)
+        else:
+            self.lines = list(lines)
+            sizes = np.asarray([line.num_bytes for line in self.lines], dtype=np.int32)
+            self.index_to_row = np.repeat(np.arange(len(self.lines), dtype=np.int32), sizes)
+            self.labels = np.zeros(max(0x10000, start_addr + num_bytes), dtype=np.uint8)
+        self.label_counts = np.zeros(len(self.labels), dtype=np.int32)
+        self.pcs, self.dest_pcs, self.flags = get_line_arrays(self.lines)
+        pcs = self.dest_pcs[self.label_rows & (self.dest_pcs >= 0) & (self.dest_pcs < len(self.labels))]
+        np.add.at(self.label_counts, pcs, 1)
+
+        # labels that don't come from a row's target address are never
+        # removed
+        self.base_labels = self.labels.copy()
+        self.base_labels[self.label_counts > 0] = 0
+
+    def __len__(self):
+        return len(self.lines)
+
+    def __iter__(self):
+        return iter(self.lines)
+
+    def __getitem__(self, row):
+        return self.lines[row]
+
+    @property
+    def num_instructions(self):
+        return len(self.lines)
+
+    @property
+    def label_rows(self):
+        return (self.flags & udis_fast.flag_label) > 0
+
+    def get_instruction_start_pc(self, pc):
+        row = self.index_to_row[pc - self.start_addr]
+        return self.lines[row].pc
+
+    def is_placeholder(self, index):
+        return self.lines[self.index_to_row[index]].is_placeholder
+
+    def has_placeholders(self, first_row=0, last_row=None):
+        for line in self.lines[first_row:last_row]:
+            if line.is_placeholder:
+                return True
+        return False
+
+    def is_instruction_start(self, pc):
+        index = pc - self.start_addr
+        if index < 0 or index >= len(self.index_to_row):
+            return False
+        return self.lines[self.index_to_row[index]].pc == pc
+
+    def count_labels(self, lines, delta):
+        """Add delta to the reference count of the target address of each
+        line that has a label, and return the addresses whose label has
+        appeared or disappeared as a result.
+        """
+        size = len(self.label_counts)
+        pcs = np.asarray([line.dest_pc for line in lines if line.flag & udis_fast.flag_label and 0 <= line.dest_pc < size], dtype=np.int32)
+        if len(pcs) == 0:
+            return pcs
+        before = self.label_counts[pcs] > 0
+        np.add.at(self.label_counts, pcs, delta)
+        after = self.label_counts[pcs] > 0
+        pcs = np.unique(pcs[before != after])
+        self.labels[pcs] = self.base_labels[pcs]
+        self.labels[pcs[self.label_counts[pcs] > 0]] = 1
+        return pcs
+
+    def rows_targeting(self, start_pc, end_pc):
+        """Return the rows that have a label whose target address is in the
+        range start_pc up to but not including end_pc
+        """
+        return np.where(self.label_rows & (self.dest_pcs >= start_pc) & (self.dest_pcs < end_pc))[0]
+
+    def splice(self, first_row, last_row, lines):
+        """Replace the rows first_row up to but not including last_row
+
+        The new lines must cover exactly the same bytes as the rows being
+        replaced. Returns the replaced lines and the addresses whose label
+        has changed.
+        """
+        old_lines = self.lines[first_row:last_row]
+        changed = np.union1d(self.count_labels(old_lines, -1), self.count_labels(lines, 1))
+
+        self.lines[first_row:last_row] = lines
+        pcs, dest_pcs, flags = get_line_arrays(lines)
+        self.pcs = np.concatenate((self.pcs[:first_row], pcs, self.pcs[last_row:]))
+        self.dest_pcs = np.concatenate((self.dest_pcs[:first_row], dest_pcs, self.dest_pcs[last_row:]))
+        self.flags = np.concatenate((self.flags[:first_row], flags, self.flags[last_row:]))
+
+        delta = len(lines) - len(old_lines)
+        next_row = first_row + len(lines)
+        if delta != 0 and next_row < len(self.lines):
+            # everything after the splice moves to a new row
+            end_index = self.lines[next_row].pc - self.start_addr
+            self.index_to_row[end_index:] += delta
+        for row, line in enumerate(lines, first_row):
+            index = line.pc - self.start_addr
+            self.index_to_row[index:index + line.num_bytes] = row
+        return old_lines, changed
+
+
+class PcTextCache(object):
+    """Text associated with rows of the disassembly, like labels or data
+    directives, stored in an array indexed by the offset of the row's address
+    from the start of the segment
+
+    Supports the parts of the dict interface used by the caches, keyed on
+    address.
+    """
+    def __init__(self, start_addr, num_bytes):
+        self.start_addr = start_addr
+        self.text = np.empty(num_bytes, dtype=object)
+        self.present = np.zeros(num_bytes, dtype=np.bool_)
+
+    def __len__(self):
+        return int(np.count_nonzero(self.present))
+
+    def __contains__(self, pc):
+        index = pc - self.start_addr
+        return 0 <= index < len(self.present) and self.present[index]
+
+    def __getitem__(self, pc):
+        if pc not in self:
+            raise KeyError(pc)
+        return self.text[pc - self.start_addr]
+
+    def __setitem__(self, pc, text):
+        index = pc - self.start_addr
+        self.text[index] = text
+        self.present[index] = True
+
+    def __iter__(self):
+        return (self.start_addr + i for i in np.nonzero(self.present)[0])
+
+    def __eq__(self, other):
+        return dict(self.iteritems()) == dict(other.iteritems())
+
+    def __ne__(self, other):
+        return not self == other
+
+    def get(self, pc, default=None):
+        if pc not in self:
+            return default
+        return self.text[pc - self.start_addr]
+
+    def pop(self, pc, default=None):
+        if pc not in self:
+            return default
+        index = pc - self.start_addr
+        text = self.text[index]
+        self.text[index] = None
+        self.present[index] = False
+        return text
+
+    def set_items(self, items):
+        """Add a list of (pc, text) pairs
+        """
+        if items:
+            pcs, texts = zip(*items)
+            indexes = np.asarray(pcs, dtype=np.int32) - self.start_addr
+            self.text[indexes] = texts
+            self.present[indexes] = True
+
+    def clear_range(self, start_pc, end_pc):
+        start = max(0, start_pc - self.start_addr)
+        end = max(start, end_pc - self.start_addr)
+        self.text[start:end] = None
+        self.present[start:end] = False
+
+    def keys(self):
+        return list(self)
+
+    def iteritems(self):
+        for i in np.nonzero(self.present)[0]:
+            yield self.start_addr + i, self.text[i]
+
+
+class FormattedRowCache(object):
+    """Least recently used cache of the formatted text of disassembly rows
+
+    Entries are keyed on the address, the number of bytes and the column of
+    the row rather than the row number, so they are still valid after rows
+    before them are added or removed by an edit. Calling sync before using
+    the cache drops the entries that the disassembler has marked as changed
+    in its text_version and text_changes.
+    """
+    def __init__(self, max_rows=1024):
+        self.max_rows = max_rows
+        self.rows = OrderedDict()
+        self.disassembler = None
+        self.version = None
+        self.num_changes = 0
+
+    def __len__(self):
+        return len(self.rows)
+
+    def __contains__(self, key):
+        return key in self.rows
+
+    def __setitem__(self, key, text):
+        self.rows[key] = text
+        if len(self.rows) > self.max_rows:
+            self.rows.popitem(last=False)
+
+    def get(self, key, default=None):
+        try:
+            text = self.rows.pop(key)
+        except KeyError:
+            return default
+        self.rows[key] = text
+        return text
+
+    def clear(self):
+        self.rows.clear()
+
+    def sync(self, disassembler):
+        d = disassembler
+        if d is not self.disassembler or d.text_version != self.version:
+            self.rows.clear()
+            self.disassembler = d
+            self.version = d.text_version
+            self.num_changes = len(d.text_changes)
+        elif self.num_changes < len(d.text_changes):
+            self.invalidate_ranges(d.text_changes[self.num_changes:])
+            self.num_changes = len(d.text_changes)
+
+    def invalidate_ranges(self, ranges):
+        """Remove the rows that overlap any of the (start_pc, end_pc) ranges
+        """
+        if not self.rows or not ranges:
+            return
+        keys = self.rows.keys()
+        pcs = np.asarray([k[0] for k in keys], dtype=np.int64)
+        ends = pcs + np.maximum(np.asarray([k[1] for k in keys], dtype=np.int64), 1)
+        changed = np.zeros(len(keys), dtype=np.bool_)
+        for start_pc, end_pc in ranges:
+            changed |= (pcs < end_pc) & (ends > start_pc)
+        for i in np.flatnonzero(changed):
+            del self.rows[keys[i]]
+
+
+class DisassemblyRequest(object):
+    """Range of bytes to be disassembled for a ProgressiveDisassembly
+
+    block is the block number for a block that is being disassembled ahead
+    of the rest because it is visible, or None when continuing from the end
+    of the finished rows.
+    """
+    def __init__(self, progress, start, end, block=None):
+        self.progress = progress
+        self.generation = progress.generation
+        self.start = start
+        self.end = end
+        self.block = block
+        self.lines = None
+        self.error = None
+
+    def __str__(self):
+        return "%s %d:%d%s" % (self.__class__.__name__, self.start, self.end, "" if self.block is None else " block %d" % self.block)
+
+    @property
+    def is_stale(self):
+        return self.generation != self.progress.generation
+
+    def process(self, disassembler):
+        keep_origin = self.block is None and self.start == 0
+        self.lines = disassembler.disassemble_lines(self.progress.segment, self.start, self.end, keep_origin)
+
+
+class ProgressiveDisassembly(object):
+    """Disassembly of a segment that is filled in a block at a time
+
+    The rows start out as placeholders. Rows are finished in order from the
+    start of the segment, but blocks that are visible (as reported by the
+    priority_range callback, which returns a range of indexes) are
+    disassembled first on their own so they can be displayed. These rows
+    aren't final because the first instruction in the block might really
+    begin in the previous block, so they are replaced when the finished rows
+    reach them.
+
+    Only one request is outstanding at a time: next_request returns the
+    next range to disassemble, which can be processed in a worker thread,
+    and apply splices the results into the rows.
+    """
+    block_size = 0x400
+
+    placeholder_size = 16
+
+    def __init__(self, disassembler, segment, priority_range=None):
+        self.disassembler = disassembler
+        self.segment = segment
+        self.size = len(segment)
+        self.priority_range = priority_range
+        self.generation = 0
+        self.pending = None
+        self.frontier = 0
+        self.speculative = set()
+        self.window = disassembler.resync_window
+        self.info = SplicedDisassemblyInfo(segment.start_addr, self.size, lines=self.get_placeholders(0, self.size))
+
+    @property
+    def is_complete(self):
+        return self.frontier >= self.size
+
+    def get_placeholders(self, start, end):
+        """Return placeholder lines covering the range of indexes, never
+        crossing a block boundary
+        """
+        lines = []
+        index = start
+        while index < end:
+            block_end = min(end, (index // self.block_size + 1) * self.block_size)
+            num_bytes = min(self.placeholder_size, block_end - index)
+            lines.append(PlaceholderLine(self.segment.start_addr + index, num_bytes))
+            index += num_bytes
+        return lines
+
+    def get_block_range(self, block):
+        return block * self.block_size, min(self.size, (block + 1) * self.block_size)
+
+    def cancel(self):
+        """Any request that is being processed will be ignored
+        """
+        self.generation += 1
+        self.pending = None
+
+    def next_request(self):
+        """Return the next DisassemblyRequest, or None if the disassembly is
+        complete or a request is already outstanding
+        """
+        if self.is_complete or self.pending is not None:
+            return None
+        if self.priority_range is not None:
+            start, end = self.priority_range()
+            for block in range(max(start, 0) // self.block_size, (min(end, self.size) + self.block_size - 1) // self.block_size):
+                block_start, block_end = self.get_block_range(block)
+                if block_end <= self.frontier or block in self.speculative:
+                    continue
+                if block_start > self.frontier:
+                    self.pending = DisassemblyRequest(self, block_start, block_end, block)
+                    return self.pending
+                # the finished rows have already reached this block
+                break
+        _, block_end = self.get_block_range(self.frontier // self.block_size)
+        self.pending = DisassemblyRequest(self, self.frontier, min(self.size, block_end + self.window))
+        return self.pending
+
+    def apply(self, request):
+        """Splice the results of the request into the rows
+
+        Returns True if the rows have changed. Requests that have been
+        superseded are ignored.
+        """
+        if request is not self.pending or request.is_stale:
+            return False
+        self.pending = None
+        if request.block is not None:
+            info = self.info
+            first_row = info.index_to_row[request.start]
+            last_row = info.index_to_row[request.end - 1] + 1
+            info.splice(first_row, last_row, request.lines)
+            self.speculative.add(request.block)
+            return True
+        return self.apply_continuation(request)
+
+    def can_end_at(self, index):
+        """Finished rows can stop at any index where an unfinished row
+        starts, or inside a placeholder because it can be split
+        """
+        if index >= self.size:
+            return True
+        line = self.info[self.info.index_to_row[index]]
+        return line.is_placeholder or line.pc - self.segment.start_addr == index
+
+    def apply_continuation(self, request):
+        info = self.info
+        start_addr = self.segment.start_addr
+        start = request.start
+        _, block_end = self.get_block_range(start // self.block_size)
+        if request.end == self.size:
+            trusted = self.size
+        else:
+            trusted = request.end - self.disassembler.resync_margin
+        count = len(request.lines)
+        for i, line in enumerate(request.lines):
+            index = line.pc - start_addr
+            if index >= block_end and self.can_end_at(index):
+                count = i
+                break
+            if index >= trusted:
+                count = -1
+                break
+        else:
+            if request.end < self.size:
+                count = -1
+        if count < 0:
+            # the rows didn't reach a place to stop before the end of the
+            # window, so try again with more
+            self.window *= 2
+            return False
+
+        lines = request.lines[:count]
+        last = lines[-1]
+        end = last.pc - start_addr + last.num_bytes
+        first_row = info.index_to_row[start]
+        if end >= self.size:
+            last_row = info.num_instructions
+        else:
+            last_row = info.index_to_row[end]
+            line = info[last_row]
+            if line.pc - start_addr < end:
+                # the new rows end in the middle of a placeholder, so replace
+                # it with one that covers the rest of its bytes
+                lines.append(PlaceholderLine(start_addr + end, line.pc - start_addr + line.num_bytes - end))
+                last_row += 1
+        info.splice(first_row, last_row, lines)
+        self.frontier = end
+        self.window = self.disassembler.resync_window
+        self.speculative = set(b for b in self.speculative if self.get_block_range(b)[1] > end)
+        return True
+
+    def step(self, disassembler=None):
+        """Process the next request in the current thread
+        """
+        request = self.next_request()
+        if request is not None:
+            request.process(disassembler or self.disassembler)
+            self.apply(request)
+        return request
+
+
+class DisassemblyWorker(threading.Thread):
+    """Thread to process DisassemblyRequests
+
+    Uses its own copy of the disassembler so it doesn't share the state of
+    the one in the main thread. callback is called from the worker thread
+    with each processed request, so it must not call GUI methods directly.
+    """
+    def __init__(self, disassembler, callback):
+        threading.Thread.__init__(self, name="DisassemblyWorker")
+        self.setDaemon(True)
+        self.source = disassembler
+        self.disassembler = disassembler.copy()
+        self.callback = callback
+        self.requests = Queue.Queue()
+        self.start()
+
+    def send_request(self, request):
+        self.requests.put(request)
+
+    def stop(self):
+        self.requests.put(None)
+
+    def run(self):
+        log.debug("%s: starting disassembly thread" % self.name)
+        while True:
+            request = self.requests.get(True)
+            if request is None:
+                break
+            if request.is_stale:
+                log.debug("%s: skipping stale %s" % (self.name, request))
                 continue
-        elif s2 == base_style: # or s == first_style:
-            # print "same"
-            continue
-        ranges.append(((first_index, i), base_style))
-        # print "last\nbreak here -> %x:%x = %s" % ((ranges[-1][0][0], ranges[-1][0][1], ranges[-1][1]))
-        first_index = i
-        first_style = s
-        base_style = s2
-    ranges.append(((first_index, i+1), base_style))
-    return ranges
+            try:
+                request.process(self.disassembler)
+            except Exception, e:
+                import traceback
+                request.error = traceback.format_exc()
+            self.callback(request)
+        log.debug("%s: stopped disassembly thread" % self.name)
 
 
 class BaseDisassembler(object):
@@ -88,6 +638,8 @@ class BaseDisassembler(object):
     read_instructions = set()
     write_instructions = set()
     rw_modes = set()
+    jump_instructions = set()
+    call_instructions = set()
     highlight_flags = 0
     default_assembler = {
         'comment char': ';',
@@ -101,9 +653,27 @@ class BaseDisassembler(object):
     cached_miniassemblers = {}
     label_format = "L%04X"  # Labels always upper case to match udis
 
+    # Incremental disassembly works forward from the edit in windows of at
+    # least this many bytes until the instruction boundaries line up with the
+    # previous disassembly again
+    resync_window = 256
+
+    # Rows that start this close to the end of a partial window might be cut
+    # short, so they are never used as the point where the boundaries line up
+    resync_margin = 16
+
+    # Style bits that affect the disassembly; changes to other bits like the
+    # selection don't need any rows to be disassembled again
+    disassembly_style_mask = user_bit_mask | comment_bit_mask
+
+    # Number of changed address ranges kept for views before they are
+    # replaced by a change to text_version
+    max_text_changes = 1000
+
     def __init__(self, asm_syntax=None, memory_map=None, hex_lower=True, mnemonic_lower=False):
         if asm_syntax is None:
             asm_syntax = self.default_assembler
+        self.asm_syntax = asm_syntax
         self.hex_lower = hex_lower
         self.mnemonic_lower = mnemonic_lower
         if self.hex_lower:
@@ -123,11 +693,32 @@ class BaseDisassembler(object):
         self.comment_char = case_func(asm_syntax['comment char'])
         self.fast = udis_fast.DisassemblerWrapper(self.cpu, fast=True, mnemonic_lower=mnemonic_lower, hex_lower=hex_lower)
         self.memory_map = memory_map if memory_map is not None else EmptyMemoryMap()
+        self.chunk_processors = []
         self.segment = None
         self.info = None
+        self.progress = None
+        self.cache = None
+        self.cache_key = None
+        self.batch_results = None
+        self.disassembled_data = None
+        self.disassembled_style = None
+        self.disassembled_labels = {}
         self._pc_label_cache = None
         self._dest_pc_label_cache = None
         self._computed_directive_cache = None
+        self._xrefs = None
+        self._search_index = None
+
+        # Kind of reference made by each opcode, filled in from the first
+        # row found with the opcode
+        self.opcode_kinds = np.zeros(256, dtype=np.uint8) + opcode_kind_unknown
+
+        # Views that keep the formatted text of rows check these: everything
+        # is out of date when text_version changes, otherwise only the rows
+        # in the (start_pc, end_pc) ranges added to text_changes since they
+        # last looked.
+        self.text_version = 0
+        self.text_changes = []
 
     @classmethod
     def get_nop(cls):
@@ -145,6 +736,7 @@ class BaseDisassembler(object):
     @property
     def label_dict(self):
         d = {}
+        self.complete()
         if self.info:
             all_pcs = np.where(self.info.labels > 0)[0]
             inside = np.where((self.start_addr <= all_pcs) & (all_pcs < self.end_addr))[0]
@@ -162,14 +754,268 @@ class BaseDisassembler(object):
 
     def add_chunk_processor(self, disassembler_name, style):
         self.fast.add_chunk_processor(disassembler_name, style)
+        self.chunk_processors.append((disassembler_name, style))
 
-    def disassemble_segment(self, segment):
+    def copy(self):
+        """Return a new disassembler with the same settings, for use in
+        another thread
+        """
+        d = self.__class__(self.asm_syntax, self.memory_map, self.hex_lower, self.mnemonic_lower)
+        for name, style in self.chunk_processors:
+            d.add_chunk_processor(name, style)
+        return d
+
+    def set_segment(self, segment):
+        self.cancel_progress()
         self.invalidate_caches()
+        if segment is self.segment:
+            self.update_segment_labels(segment)
         self.segment = segment
         self.start_addr = segment.start_addr
         self.end_addr = self.start_addr + len(segment)
-        self.info = fast_disassemble_segment(self.fast, segment)
         self.use_labels = self.start_addr > 0
+        self.disassembled_data = np.array(segment.data[:], dtype=np.uint8)
+        self.disassembled_style = segment.style[:] & self.disassembly_style_mask
+        self.disassembled_labels = dict(segment.memory_map)
+
+    def disassemble_segment(self, segment):
+        self.set_segment(segment)
+        self.info = self.load_cached_info(segment)
+        if self.info is None:
+            self.info = fast_disassemble_segment(self.fast, segment)
+            self.save_cached_info()
+        return self.info
+
+    def load_cached_info(self, segment):
+        """Return the results of a previous disassembly of a segment with the
+        same contents from the batch results or the on-disk cache, or None if
+        there aren't any
+        """
+        self.cache_key = None
+        if self.cache is None and not self.batch_results:
+            return None
+        self.cache_key = get_key(self, segment)
+        if self.batch_results:
+            # results of disassembling all the segments of the document at
+            # once in disasm_batch, keyed the same way as the cache
+            info = self.batch_results.get(self.cache_key)
+            if info is not None:
+                if self.cache is not None and self.cache_key not in self.cache:
+                    self.cache.save(self.cache_key, info, len(segment))
+                return info
+        if self.cache is None:
+            return None
+        return self.cache.load(self.cache_key, segment.start_addr)
+
+    def save_cached_info(self):
+        if self.cache is not None and self.cache_key is not None:
+            self.cache.save(self.cache_key, self.info, len(self.segment))
+
+    def start_disassembly(self, segment, priority_range=None):
+        """Start a progressive disassembly of the segment.
+
+        The rows are placeholders until they are filled in by processing the
+        requests returned by self.progress.next_request (normally in a
+        DisassemblyWorker) and passing them back to apply_progress.
+        priority_range is a callable returning the range of indexes that
+        should be disassembled first.
+        """
+        if len(segment) == 0:
+            return self.disassemble_segment(segment)
+        self.set_segment(segment)
+        self.info = self.load_cached_info(segment)
+        if self.info is None:
+            self.progress = ProgressiveDisassembly(self, segment, priority_range)
+            self.info = self.progress.info
+        return self.info
+
+    def cancel_progress(self):
+        if self.progress is not None:
+            self.progress.cancel()
+            self.progress = None
+
+    @property
+    def is_complete(self):
+        return self.progress is None
+
+    def apply_progress(self, request):
+        """Add the results of a processed request to the disassembly,
+        returning True if any rows have changed
+        """
+        progress = self.progress
+        if progress is None or request.progress is not progress:
+            return False
+        if request.error is not None:
+            log.error("Background disassembly failed, disassembling synchronously: %s" % request.error)
+            self.complete()
+            return True
+        changed = progress.apply(request)
+        if changed:
+            self.invalidate_caches()
+        if progress.is_complete:
+            self.progress = None
+            self.save_cached_info()
+        return changed
+
+    def complete(self):
+        """Finish any progressive disassembly in the current thread
+        """
+        if self.progress is not None:
+            self.disassemble_segment(self.segment)
+
+    def update_segment(self, segment):
+        """Bring the disassembly up to date after changes to the bytes or
+        their styles, re-disassembling only the area around the changes.
+
+        The changes are found by comparing to the data and style at the time
+        of the last disassembly, so any change to the segment will be
+        handled. Anything other than a modification of the same segment
+        falls back to a full disassembly.
+        """
+        if self.info is None or not self.is_current(segment) or len(segment) != len(self.disassembled_data):
+            return self.disassemble_segment(segment)
+        if self.progress is not None:
+            # nothing is final yet, so start over
+            self.update_segment_labels(segment)
+            return self.start_disassembly(segment, self.progress.priority_range)
+        data = segment.data[:]
+        style = segment.style[:] & self.disassembly_style_mask
+        changed = np.where((data != self.disassembled_data) | (style != self.disassembled_style))[0]
+        if len(changed) > 0:
+            start = changed[0]
+            end = changed[-1] + 1
+            if end - start > len(segment) / 2:
+                return self.disassemble_segment(segment)
+            self.disassembled_data[start:end] = data[start:end]
+            if (style[start:end] != self.disassembled_style[start:end]).any():
+                self.disassembled_style[start:end] = style[start:end]
+                start = self.get_style_restart_index(style, start)
+            self.disassemble_range(segment, start, end)
+        self.update_segment_labels(segment)
+        return self.info
+
+    def update_segment_range(self, segment, first, last):
+        """Bring the disassembly up to date after a command has changed the
+        bytes, styles or comments of the indexes first through last.
+
+        These are the index_range of the command's display flags, which
+        includes the last index for commands like SetCommentCommand (those
+        that report the end of a python style range only cause one more row
+        to be formatted). Comments can change without changing the
+        disassembly, so the rows covering the range are always marked to be
+        formatted again.
+        """
+        info = self.update_segment(segment)
+        self.add_text_change(self.start_addr + first, self.start_addr + last + 1)
+        return info
+
+    def update_segment_labels(self, segment):
+        """Apply any labels that have been added, changed or removed in the
+        segment's memory map since the last disassembly
+        """
+        labels = segment.memory_map
+        old = self.disassembled_labels
+        if labels == old:
+            return
+        for pc in set(labels) | set(old):
+            text = labels.get(pc, "")
+            if text != old.get(pc, ""):
+                self.set_label(pc, text)
+        self.disassembled_labels = dict(labels)
+
+    def get_style_restart_index(self, style, index):
+        """Return the index where disassembly must restart after a change in
+        style at index
+
+        A style change can join the change to the range of bytes before it.
+        The last instruction of a code range is cut off at the end of the
+        range, so the disassembly has to include the byte before the change.
+        The lines of other ranges are laid out from the start of the range,
+        so it has to restart at the beginning of that range.
+        """
+        if index == 0:
+            return index
+        user = style[:index] & user_bit_mask
+        if user[-1] == 0:
+            return index - 1
+        boundaries = np.where(user != user[-1])[0]
+        if len(boundaries) == 0:
+            return 0
+        return boundaries[-1] + 1
+
+    def disassemble_lines(self, segment, start, end, keep_origin=False):
+        """Disassemble the bytes from index start up to but not including end
+        as if they were a segment on their own, returning a list of
+        DisassemblyLine objects
+        """
+        subset = DefaultSegment(segment.rawdata[start:end], segment.start_addr + start)
+        info = fast_disassemble_segment(self.fast, subset)
+        lines = [DisassemblyLine(line) for line in info]
+        if not keep_origin:
+            # the subset always starts with an origin directive, but it's not
+            # part of the surrounding disassembly
+            while lines and lines[0].num_bytes == 0 and lines[0].flag == udis_fast.flag_origin:
+                lines.pop(0)
+        return lines
+
+    def find_resync_row(self, lines, end, trusted):
+        """Find the first of the new lines at or after index end that starts
+        on the same address as a row of the current disassembly. Returns the
+        position in lines and the current row, or (-1, -1) if the boundaries
+        don't line up before index trusted.
+        """
+        info = self.info
+        for i, line in enumerate(lines):
+            index = line.pc - self.start_addr
+            if index >= trusted:
+                break
+            if index >= end:
+                row = info.index_to_row[index]
+                if info[row].pc == line.pc:
+                    return i, row
+        return -1, -1
+
+    def disassemble_range(self, segment, start, end):
+        """Re-disassemble after a change to the bytes from index start up to
+        but not including end
+
+        Disassembly restarts at the beginning of the instruction that
+        contains the first changed byte, because everything before it is
+        unaffected. It continues past the changed bytes until a row starts on
+        an address where a row started before, after which the previous
+        disassembly is valid again. The new rows are spliced into the
+        results in place of the old ones.
+        """
+        info = self.get_spliced_info()
+        self.cache_key = None
+        first_row = info.index_to_row[start]
+        resync = info[first_row].pc - self.start_addr
+        size = len(segment)
+        window = end - resync + self.resync_window
+        while True:
+            stop = min(resync + window, size)
+            lines = self.disassemble_lines(segment, resync, stop)
+            if stop == size:
+                i, last_row = self.find_resync_row(lines, end, size)
+                if i < 0:
+                    i, last_row = len(lines), info.num_instructions
+                break
+            i, last_row = self.find_resync_row(lines, end, stop - self.resync_margin)
+            if i >= 0:
+                break
+            window *= 2
+        lines = lines[:i]
+        log.debug("Re-disassembled %d:%d as rows %d:%d, now %d rows" % (resync, stop, first_row, last_row, len(lines)))
+        old_lines, changed_labels = info.splice(first_row, last_row, lines)
+        end_pc = lines[-1].pc + lines[-1].num_bytes if lines else resync + self.start_addr
+        self.update_caches(old_lines, lines, changed_labels, resync + self.start_addr, end_pc, first_row)
+
+    def get_spliced_info(self):
+        """Return the disassembly results in a form that can be modified in
+        place, converting the results of the fast disassembler if necessary
+        """
+        if not isinstance(self.info, SplicedDisassemblyInfo):
+            self.info = SplicedDisassemblyInfo(self.start_addr, len(self.segment), info=self.info)
         return self.info
 
     def is_current(self, segment):
@@ -193,37 +1039,278 @@ class BaseDisassembler(object):
             self.create_computed_directive_cache()
         return self._computed_directive_cache
 
+    @property
+    def xrefs(self):
+        if self._xrefs is None:
+            self.create_xrefs()
+        return self._xrefs
+
+    def create_xrefs(self):
+        # During a progressive disassembly only the finished rows are
+        # indexed; placeholders don't refer to anything. The index is
+        # recreated when the worker adds more rows, so it never finishes the
+        # disassembly in the GUI thread.
+        xrefs = CrossReferenceIndex(self.get_reference_kinds)
+        info = self.info
+        if hasattr(info, "flags"):
+            xrefs.add_references(info.pcs, info.dest_pcs, info.flags, udis_fast.flag_label)
+        else:
+            xrefs.add_lines(info, udis_fast.flag_label)
+        self._xrefs = xrefs
+        log.debug("Created cross reference index, %d references" % len(xrefs))
+
+    @property
+    def search_index(self):
+        if self._search_index is None:
+            self.create_search_index()
+        index = self._search_index
+        comments = self.segment.get_comments_in_range(0, len(self.segment))
+        if index.label_index is None or index.comments != comments:
+            index.set_labels(self.iter_search_labels(), comments)
+        return index
+
+    def create_search_index(self):
+        # like the cross references, only covers the finished rows until the
+        # progressive disassembly is complete
+        self._search_index = DisassemblySearchIndex(self.start_addr, self.info)
+        log.debug("Created search index, %d rows" % len(self._search_index))
+
+    def iter_search_labels(self):
+        for labels in [self.pc_label_cache, self.dest_pc_label_cache, self.computed_directive_cache]:
+            for item in labels.iteritems():
+                yield item
+
+    def get_reference_kind(self, line):
+        """Classify the reference to the target address of the line by the
+        mnemonic of its instruction
+        """
+        text = line.instruction.split(None, 1)
+        mnemonic = text[0].lower() if text else ""
+        if mnemonic in self.call_instructions:
+            return xref_call
+        if mnemonic in self.jump_instructions:
+            return xref_jump
+        if mnemonic in self.write_instructions:
+            return xref_write
+        if mnemonic in self.read_instructions:
+            return xref_read
+        return xref_other
+
+    def get_reference_kinds(self, pcs, flags):
+        """Classify the references made by the rows at the addresses pcs
+
+        Every row with the same opcode makes the same kind of reference, so
+        the mnemonic is only checked for the first row found with each
+        opcode and the rest are looked up from opcode_kinds.
+        """
+        kinds = np.zeros(len(pcs), dtype=np.uint8)
+        if not (self.read_instructions or self.write_instructions or self.jump_instructions or self.call_instructions):
+            return kinds
+        instructions = (flags & (udis_fast.flag_data_bytes | udis_fast.flag_origin)) == 0
+        pcs = pcs[instructions]
+        opcodes = self.disassembled_data[pcs - self.start_addr]
+        missing = np.flatnonzero(self.opcode_kinds[opcodes] == opcode_kind_unknown)
+        if len(missing) > 0:
+            info = self.info
+            new_opcodes, first = np.unique(opcodes[missing], return_index=True)
+            for opcode, i in zip(new_opcodes, missing[first]):
+                line = info[info.index_to_row[pcs[i] - self.start_addr]]
+                self.opcode_kinds[opcode] = self.get_reference_kind(line)
+        kinds[instructions] = self.opcode_kinds[opcodes]
+        return kinds
+
+    def get_referrers(self, pc):
+        """Return a list of (index, kind) of the rows that refer to the
+        address pc
+        """
+        sources, kinds = self.xrefs.get_referrers(pc)
+        return zip(sources - self.start_addr, kinds)
+
     def invalidate_caches(self):
         log.debug("Invalidating label caches")
         self._pc_label_cache = None
         self._dest_pc_label_cache = None
         self._computed_directive_cache = None
+        self._xrefs = None
+        self._search_index = None
+        self.text_version += 1
+        self.text_changes = []
+
+    def add_text_change(self, start_pc, end_pc):
+        if len(self.text_changes) >= self.max_text_changes:
+            self.text_version += 1
+            self.text_changes = []
+        self.text_changes.append((start_pc, end_pc))
+
+    def add_text_changes(self, start_pc, end_pc):
+        """Record that the rows covering start_pc up to but not including
+        end_pc and the rows that refer to an address in that range may be
+        shown differently
+        """
+        info = self.info
+        self.add_text_change(start_pc, end_pc)
+        for row in info.rows_targeting(start_pc, end_pc):
+            pc = info[row].pc
+            self.add_text_change(pc, pc + 1)
 
     def create_label_caches(self):
-        pc_labels = {}
-        dest_pc_labels = {}
-        for line in self.info:
-            text = self.get_pc_label(line.pc)
-            if text:
-                pc_labels[line.pc] = text
-            if line.flag & udis_fast.flag_label:
-                text = self.get_dest_pc_label(line.dest_pc)
-                if text:
-                    dest_pc_labels[line.pc] = text
+        pc_labels = PcTextCache(self.start_addr, len(self.segment))
+        dest_pc_labels = PcTextCache(self.start_addr, len(self.segment))
+        if not self.load_cached_texts(pc_labels, "pc_labels") or not self.load_cached_texts(dest_pc_labels, "dest_pc_labels"):
+            for line in self.info:
+                self.add_line_labels(line, pc_labels, dest_pc_labels)
+            self.save_cached_texts(pc_labels, "pc_labels")
+            self.save_cached_texts(dest_pc_labels, "dest_pc_labels")
         self._pc_label_cache = pc_labels
         self._dest_pc_label_cache = dest_pc_labels
         log.debug("Created label caches: %d in pc, %d in dest_pc" % (len(pc_labels), len(dest_pc_labels)))
 
+    def load_cached_texts(self, text_cache, name):
+        """Fill the cache from the on-disk cache entry of the current
+        disassembly, returning False if it isn't available
+        """
+        if self.cache is None or self.cache_key is None:
+            return False
+        items = self.cache.load_texts(self.cache_key, name)
+        if items is None:
+            return False
+        text_cache.set_items(items)
+        return True
+
+    def save_cached_texts(self, text_cache, name):
+        if self.cache is not None and self.cache_key is not None:
+            self.cache.save_texts(self.cache_key, name, list(text_cache.iteritems()))
+
+    def add_line_labels(self, line, pc_labels, dest_pc_labels):
+        text = self.get_pc_label(line.pc)
+        if text:
+            pc_labels[line.pc] = text
+        if line.flag & udis_fast.flag_label:
+            text = self.get_dest_pc_label(line.dest_pc)
+            if text:
+                dest_pc_labels[line.pc] = text
+
+    def update_pc_label(self, pc):
+        text = self.get_pc_label(pc)
+        if text:
+            self._pc_label_cache[pc] = text
+        else:
+            self._pc_label_cache.pop(pc)
+
+    def update_dest_pc_labels(self, start_pc, end_pc):
+        """Recompute the operand labels of the rows that refer to an address
+        in the range start_pc up to but not including end_pc
+        """
+        info = self.info
+        dest_pc_labels = self._dest_pc_label_cache
+        for row in info.rows_targeting(start_pc, end_pc):
+            line = info[row]
+            text = self.get_dest_pc_label(line.dest_pc)
+            if text:
+                dest_pc_labels[line.pc] = text
+            else:
+                dest_pc_labels.pop(line.pc)
+
     def create_computed_directive_cache(self):
-        pc_to_directive = {}
-        for line in self.info:
-            if line.flag & udis_fast.flag_data_bytes:
-                operand = self.get_operand_from_instruction(line.instruction)
-                text = self.format_data_directive_bytes(operand)
-                pc_to_directive[line.pc] = text
+        pc_to_directive = PcTextCache(self.start_addr, len(self.segment))
+        if not self.load_cached_texts(pc_to_directive, "directives"):
+            for line in self.info:
+                self.add_line_directive(line, pc_to_directive)
+            self.save_cached_texts(pc_to_directive, "directives")
         self._computed_directive_cache = pc_to_directive
         log.debug("Created directive cache, %d lines" % (len(pc_to_directive)))
 
+    def add_line_directive(self, line, pc_to_directive):
+        if line.flag & udis_fast.flag_data_bytes:
+            operand = self.get_operand_from_instruction(line.instruction)
+            text = self.format_data_directive_bytes(operand)
+            pc_to_directive[line.pc] = text
+
+    def update_caches(self, old_lines, new_lines, changed_labels, start_pc, end_pc, first_row=None):
+        """Update the entries in the label and directive caches after the
+        rows covering start_pc up to but not including end_pc have been
+        replaced
+
+        changed_labels is the list of addresses that have gained or lost a
+        label as a result of the replacement. Caches that haven't been
+        created yet are left alone. The search index is patched if the row
+        number of the first replaced row is known, otherwise it is thrown
+        away.
+        """
+        info = self.info
+        self.add_text_changes(start_pc, end_pc)
+        for pc in changed_labels:
+            self.add_text_change(pc, pc + 1)
+        if self._pc_label_cache is not None:
+            pc_labels = self._pc_label_cache
+            dest_pc_labels = self._dest_pc_label_cache
+            pc_labels.clear_range(start_pc, end_pc)
+            dest_pc_labels.clear_range(start_pc, end_pc)
+            for line in new_lines:
+                self.add_line_labels(line, pc_labels, dest_pc_labels)
+
+            # rows elsewhere whose address gained or lost a label
+            for pc in changed_labels:
+                if (pc < start_pc or pc >= end_pc) and info.is_instruction_start(pc):
+                    self.update_pc_label(pc)
+
+            # rows elsewhere that refer to an address in the changed range
+            # may need a different offset from the nearest instruction
+            self.update_dest_pc_labels(start_pc, end_pc)
+        if self._computed_directive_cache is not None:
+            pc_to_directive = self._computed_directive_cache
+            pc_to_directive.clear_range(start_pc, end_pc)
+            for line in new_lines:
+                self.add_line_directive(line, pc_to_directive)
+        if self._xrefs is not None:
+            self._xrefs.replace(start_pc, end_pc, new_lines, udis_fast.flag_label)
+        if self._search_index is not None:
+            if first_row is None:
+                self._search_index = None
+            else:
+                self._search_index.splice(first_row, first_row + len(old_lines), new_lines)
+
+    def set_label(self, pc, text):
+        """Change the name of an address, or remove it if text is empty
+
+        Only the cache entries of the row at the address and the rows that
+        refer to it are updated. The change is made to a private copy of
+        the memory map, so other disassemblers sharing the map aren't
+        affected. Removing a label restores the machine or document label
+        of the address, if any.
+        """
+        mmap = self.memory_map
+        if not getattr(mmap, "is_private", False):
+            cls = mmap if isinstance(mmap, type) else mmap.__class__
+            base = getattr(cls, "base_rmemmap", cls.rmemmap)
+            mmap = type(cls.__name__, (cls,), {"rmemmap": dict(cls.rmemmap), "wmemmap": dict(cls.wmemmap), "base_rmemmap": dict(base), "is_private": True})
+            self.memory_map = mmap
+        if text:
+            mmap.rmemmap[pc] = text
+        elif pc in mmap.base_rmemmap:
+            mmap.rmemmap[pc] = mmap.base_rmemmap[pc]
+        else:
+            mmap.rmemmap.pop(pc, None)
+        self.cache_key = None
+        if self._search_index is not None:
+            self._search_index.label_index = None
+        if self._pc_label_cache is None or self.progress is not None:
+            # the rows that refer to the address aren't known without
+            # converting the disassembly, so every row may have changed
+            self.text_version += 1
+            self.text_changes = []
+            return
+        info = self.get_spliced_info()
+
+        # operands pointing inside the instruction at the address are shown
+        # as an offset from its label, so they change too
+        end_pc = pc + 1
+        if info.is_instruction_start(pc):
+            self.update_pc_label(pc)
+            end_pc = pc + max(1, info[info.index_to_row[pc - self.start_addr]].num_bytes)
+        self.update_dest_pc_labels(pc, end_pc)
+        self.add_text_changes(pc, end_pc)
+
     def get_origin(self, pc):
         return "%s $%s" % (self.asm_origin, self.fmt_hex4 % pc)
 
@@ -372,124 +1459,50 @@ class BaseDisassembler(object):
 
         Return information designed to be used by program list formatters.
         """
-        if end < 0:
-            end = len(self.info.index_to_row)
-
-        start_row = self.info.index_to_row[start]
-        end_row = self.info.index_to_row[end - 1] # end is python style range, want actual last byte
-
-        for row in range(start_row, end_row + 1):
-            line = self.info[row]
-            index = line.pc - self.start_addr
-            label = self.format_label(line)
-            comment = self.format_comment(index, line)
-            operand = self.get_operand_from_instruction(line.instruction)
-            if line.flag & udis_fast.flag_data_bytes and line.num_bytes > max_bytes_per_line:
-                first = True
-                for i in range(0, line.num_bytes, max_bytes_per_line):
-                    count = min(line.num_bytes, i + max_bytes_per_line) - i
-                    hex_bytes = self.format_data_list_bytes(index + i, count)
-                    subset = operand[i*2:(i+count)*2]
-                    code = self.format_data_directive_bytes(subset)
-                    yield line, hex_bytes, label + "   " + code, comment, count
-                    if first:
-                        label = "     "
-                        comment = ""
-                        first = False
-            else:
-                if line.flag == udis_fast.flag_origin:
-                    hex_bytes = ""
-                else:
-                    hex_bytes = self.format_data_list_bytes(index, line.num_bytes)
-                code = self.format_operand(line, operand)
-                # expand to 8 spaces
-                code = label + "   " + code
-                yield line, hex_bytes, code, comment, line.num_bytes
+        writer = ListingWriter(self, None, max_bytes_per_line)
+        writer.prepare(start, end)
+        return writer.iter_rows(start, end)
 
     def get_disassembled_text(self, start=0, end=-1):
         """Returns list of lines representing the disassembly
 
         Raises IndexError if the disassembly hasn't reached the index yet
         """
-        lines = []
-        start_row = self.info.index_to_row[start]
-        line = self.info[start_row]
-        lines.append("        " + self.get_origin(line.pc))
-        for line, hex_bytes, code, comment, num_bytes in self.iter_row_text(start, end):
-            if comment:
-                text = "%-30s; %s" % (code, comment)
-            else:
-                text = code
-            lines.append(text)
-        return lines
+        return list(ListingWriter(self, None).iter_source(start, end))
 
     def get_atasm_lst_text(self):
         """Returns list of lines representing the disassembly
-
-        Raises IndexError if the disassembly hasn't reached the index yet
         """
-        lines = [""]
-        lines.append("Source: %s.s" % (self.segment.name))
-        line_num = 2
-        pc = self.segment.start_addr
-        for line, hex_bytes, code, comment, num_bytes in self.iter_row_text():
-            if line.flag == udis_fast.flag_origin:
-                line_num += 1
-                continue
-            pc = line.pc
-            if comment:
-                code = "%-30s; %s" % (code, comment.rstrip())
-            if ".byte" in code:
-                count = 0
-                hex_bytes = hex_bytes.upper()
-                text = ""
-                while count < num_bytes:
-                    sub_bytes = hex_bytes[count * 3:count * 3 + 6].rstrip()
-                    if count == 0:
-                        text = "%05d %04X  %-17s %s" % (line_num, pc, sub_bytes, code)
-                    else:
-                        text += "\n%05d %04X  %s " % (line_num, pc + count, sub_bytes)
-                    count += 2
-            else:
-                text = "%05d %04X  %-17s %s" % (line_num, line.pc, hex_bytes.upper(), code)
-            lines.append(text)
-            line_num += 1
-        return lines
+        self.complete()
+        return list(ListingWriter(self, None).iter_atasm_lst())
 
-    def search_labels(self, labels, search_text, match_case=False):
-        s = self.start_addr
-        matches = []
-        if not match_case:
-            for pc, label in labels.iteritems():
-                if search_text in label.lower():
-                    matches.append((pc - s, pc - s + 1))
-        else:
-            for pc, label in labels.iteritems():
-                if search_text in label:
-                    matches.append((pc - s, pc - s + 1))
-        return matches
-
-    def search(self, search_text, match_case=False):
-        s = self.start_addr
-        if not match_case:
-            search_text = search_text.lower()
-            matches = [(t.pc - s, t.pc - s + t.num_bytes) for t in self.info if search_text in t.instruction.lower()]
-        else:
-            matches = [(t.pc - s, t.pc - s + t.num_bytes) for t in self.info if search_text in t.instruction]
-        log.debug("instruction matches: %s" % str(matches))
-
-        label_matches = self.search_labels(self.pc_label_cache, search_text, match_case)
-        matches.extend(label_matches)
-        log.debug("pc label matches: %s" % str(label_matches))
-
-        label_matches = self.search_labels(self.dest_pc_label_cache, search_text, match_case)
-        matches.extend(label_matches)
-        log.debug("dest pc label matches: %s" % str(label_matches))
-
-        label_matches = self.search_labels(self.computed_directive_cache, search_text, match_case)
-        matches.extend(label_matches)
-        log.debug("computed directives match: %s" % str(label_matches))
+    def write_disassembled_text(self, fh, start=0, end=-1):
+        """Write the lines of get_disassembled_text to the file handle,
+        without building the whole listing in memory
+        """
+        ListingWriter(self, fh).write_source(start, end)
 
+    def write_atasm_lst_text(self, fh):
+        """Write the lines of get_atasm_lst_text to the file handle, without
+        building the whole listing in memory
+        """
+        ListingWriter(self, fh).write_atasm_lst()
+
+    def search(self, search_text, match_case=False, mode="substring"):
+        """Return a list of (start, end) index ranges of the rows whose
+        instruction contains the search text, followed by the addresses
+        whose label, directive or comment contains it.
+
+        mode is one of "substring", "token" to match only whole mnemonics,
+        operands or labels, or "regex" to use the search text as a regular
+        expression. The search index is created on the first search and
+        kept up to date with the disassembly, so searching again as each
+        character is typed doesn't have to scan all the rows. While a
+        progressive disassembly is running, only the rows that have been
+        disassembled so far are searched.
+        """
+        matches = self.search_index.search(search_text, match_case, mode)
+        log.debug("%s matches: %d" % (mode, len(matches)))
         return matches
 
 
@@ -499,6 +1512,8 @@ class Basic6502Disassembler(BaseDisassembler):
     read_instructions = {"adc", "and", "asl", "bit", "cmp", "cpx", "cpy", "dec", "eor", "inc", "lda", "ldx", "ldy", "lsr", "ora", "rol", "ror", "sbc", "jsr", "jmp"}
     write_instructions = {"sax", "shx", "shy", "slo", "sre", "sta", "stx", "sty"}
     rw_modes = {"absolute", "absolutex", "absolutey", "indirect", "indirectx", "indirecty", "relative", "zeropage", "zeropagex", "zeropagey"}
+    jump_instructions = {"jmp", "bcc", "bcs", "beq", "bmi", "bne", "bpl", "bra", "brl", "bvc", "bvs", "jml"}
+    call_instructions = {"jsr", "jsl"}
 
 
 class Undocumented6502Disassembler(Basic6502Disassembler):
@@ -0,0 +1,195 @@
+"""Disassembly of many segments at once using a pool of worker processes
+
+Disk images can have dozens of segments (boot sectors, executable chunks,
+files) that are disassembled independently of each other, so they are
+divided among worker processes instead of being disassembled one at a time.
+
+The bytes and styles of the segments are copied into shared memory once,
+before the worker processes are started. A job only describes where its
+segment is in the shared arrays, so the data is never pickled. The results
+are sent back in the compact form used by the disassembly cache.
+"""
+import multiprocessing
+
+import numpy as np
+
+from atrcopy import SegmentData, DefaultSegment
+from udis.udis_fast.disasm_info import fast_disassemble_segment
+
+from omnivore8bit.utils.batchutil import run_jobs
+
+from disasm_cache import get_key, pack_info, unpack_info
+
+import logging
+log = logging.getLogger(__name__)
+
+
+def share_array(array):
+    """Return a copy of the uint8 array in shared memory
+    """
+    shared = multiprocessing.RawArray('B', len(array))
+    np.frombuffer(shared, dtype=np.uint8)[:] = array
+    return shared
+
+
+class SharedSegments(object):
+    """The base arrays of a list of segments copied into shared memory
+
+    Segments that are views into the same base arrays (like all the segments
+    of a disk image) share a single copy. Each job is a tuple of the index
+    of the base arrays, the position of the segment in them and the origin
+    of the segment. The position is a (start, end) tuple for a contiguous
+    segment or the array of indexes for a segment that uses a byte order.
+
+    copy_array makes the copy of each base array, defaulting to a copy in
+    shared memory.
+    """
+    def __init__(self, segments, copy_array=share_array):
+        self.arrays = []
+        self.jobs = []
+        bases = {}
+        for segment in segments:
+            r = segment.rawdata
+            base = r.data_base
+            if id(base) not in bases:
+                bases[id(base)] = len(self.arrays)
+                self.arrays.append((copy_array(base), copy_array(r.style_base)))
+            if r.is_indexed:
+                where = np.asarray(r.order, dtype=np.int32)
+            else:
+                where = r.byte_bounds_offset()
+            self.jobs.append((bases[id(base)], where, segment.start_addr))
+
+
+def get_shared_segment(arrays, job):
+    """Return a segment that uses the shared memory of the job's segment
+    """
+    base_index, where, start_addr = job
+    data, style = arrays[base_index]
+    if isinstance(where, tuple):
+        start, end = where
+        r = SegmentData(data[start:end], style[start:end])
+    else:
+        r = SegmentData(data, style, order=where)
+    return DefaultSegment(r, start_addr)
+
+
+def get_settings(disassembler):
+    """Return the settings needed to create an equivalent disassembler in
+    another process
+    """
+    d = disassembler
+    return d.__class__, d.asm_syntax, d.hex_lower, d.mnemonic_lower, list(d.chunk_processors)
+
+
+def create_disassembler(settings):
+    cls, asm_syntax, hex_lower, mnemonic_lower, chunk_processors = settings
+    d = cls(asm_syntax, None, hex_lower, mnemonic_lower)
+    for name, style in chunk_processors:
+        d.add_chunk_processor(name, style)
+    return d
+
+
+# State of each worker process, set by init_worker
+worker_disassembler = None
+worker_arrays = None
+
+
+def init_worker(settings, shared_arrays):
+    global worker_disassembler, worker_arrays
+    worker_disassembler = create_disassembler(settings)
+    worker_arrays = [(np.frombuffer(data, dtype=np.uint8), np.frombuffer(style, dtype=np.uint8)) for data, style in shared_arrays]
+
+
+def disassemble_job(job_id, job):
+    segment = get_shared_segment(worker_arrays, job)
+    info = fast_disassemble_segment(worker_disassembler.fast, segment)
+    return pack_info(info, len(segment))
+
+
+def disassemble_segments(disassembler, segments, processes=None):
+    """Disassemble the segments using a pool of worker processes, yielding
+    a (segment, info, error) tuple for each segment as it completes.
+
+    The disassembler provides the settings and isn't changed. processes is
+    the number of worker processes, defaulting to the number of CPUs.
+    """
+    if processes == 1 or len(segments) < 2:
+        for segment in segments:
+            try:
+                info = fast_disassemble_segment(disassembler.fast, segment)
+            except Exception, e:
+                yield segment, None, "%s: %s" % (e.__class__.__name__, e)
+            else:
+                yield segment, info, None
+        return
+    shared = SharedSegments(segments)
+
+    # largest segments first so the small ones fill in at the end
+    jobs = sorted(enumerate(shared.jobs), key=lambda j: -len(segments[j[0]]))
+    for job_id, arrays, error in run_jobs(disassemble_job, jobs, processes, initializer=init_worker, initargs=(get_settings(disassembler), shared.arrays)):
+        segment = segments[job_id]
+        info = unpack_info(segment.start_addr, arrays) if arrays is not None else None
+        yield segment, info, error
+
+
+def get_snapshots(segments):
+    """Return segments with a copy of the bytes and styles of the segments,
+    so they can be disassembled in another thread while the originals are
+    edited.
+
+    Like SharedSegments, the base arrays are only copied once, so the
+    copies are also views into the same base arrays and are shared again by
+    disassemble_segments.
+    """
+    copies = SharedSegments(segments, lambda a: np.array(a, dtype=np.uint8))
+    return [get_shared_segment(copies.arrays, job) for job in copies.jobs]
+
+
+class BatchDisassemblyRequest(object):
+    """Disassembly of many segments, processed by a DisassemblyWorker like
+    the requests of a ProgressiveDisassembly so the GUI thread doesn't wait
+    for the pool of worker processes.
+
+    items is a list of (segment, disassembler) with the disassembler that
+    would be used to view each segment. The segments are copied when the
+    request is created. When processed, results has the results from
+    old_results and the results of the segments that aren't in old_results
+    or the disassembly cache, keyed like the disassembly cache.
+    """
+    is_stale = False
+
+    def __init__(self, items, old_results, processes=None):
+        snapshots = get_snapshots([segment for segment, d in items])
+        self.items = [(segment, d) for segment, (_, d) in zip(snapshots, items)]
+        self.old_results = old_results
+        self.processes = processes
+        self.results = None
+        self.error = None
+
+    def __str__(self):
+        return "%s %d segments" % (self.__class__.__name__, len(self.items))
+
+    def process(self, disassembler=None):
+        old = self.old_results
+        results = {}
+        keys = {}
+        queued = set()
+        segments = []
+        d = None
+        for segment, d in self.items:
+            key = get_key(d, segment)
+            if key in old:
+                results[key] = old[key]
+            elif key not in queued and (d.cache is None or key not in d.cache):
+                queued.add(key)
+                keys[id(segment)] = key
+                segments.append(segment)
+        if segments:
+            log.debug("%s: disassembling %d of %d segments" % (self, len(segments), len(self.items)))
+            for segment, info, error in disassemble_segments(d, segments, self.processes):
+                if error is not None:
+                    log.error("Failed disassembling %s: %s" % (segment, error))
+                else:
+                    results[keys[id(segment)]] = info
+        self.results = results
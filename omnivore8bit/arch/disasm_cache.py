@@ -0,0 +1,297 @@
+"""Disassembly results saved on disk so a segment that has been seen before
+doesn't have to be disassembled again
+
+Each entry is a directory of numpy arrays named by a hash of everything that
+affects the results: the bytes of the segment, the style bits that control
+the disassembly, the origin, the CPU, the formatting options and the labels
+of the memory map. The arrays are memory mapped when an entry is loaded, so
+only the rows that are displayed are ever read from disk.
+
+The total size of the entries is limited by evicting the least recently
+used entries, using the modification time of the entry directories that is
+updated every time an entry is loaded.
+"""
+import os
+import shutil
+import hashlib
+import tempfile
+
+import numpy as np
+
+import logging
+log = logging.getLogger(__name__)
+
+
+format_version = "1"
+
+row_dtype = np.dtype([
+    ('pc', '<i4'),
+    ('num_bytes', '<i4'),
+    ('flag', '<i4'),
+    ('dest_pc', '<i4'),
+    ('text_start', '<i4'),
+    ('text_end', '<i4'),
+])
+
+
+def get_key(disassembler, segment):
+    """Return the hash of everything that affects the disassembly of the
+    segment
+    """
+    d = disassembler
+    h = hashlib.sha1()
+    h.update(format_version)
+    h.update("%s %s %d %d %d" % (d.__class__.__name__, d.cpu, segment.start_addr, d.hex_lower, d.mnemonic_lower))
+    h.update(repr(d.chunk_processors))
+    h.update(repr(sorted(d.asm_syntax.items())))
+    h.update(repr(sorted(d.memory_map.rmemmap.items())))
+    h.update(np.ascontiguousarray(segment.data[:]).tostring())
+    h.update(np.ascontiguousarray(segment.style[:] & d.disassembly_style_mask).tostring())
+    return h.hexdigest()
+
+
+def pack_text(strings):
+    """Return the concatenation of the strings as a uint8 array and the
+    offsets of the end of each string
+    """
+    text = "".join(strings)
+    ends = np.cumsum([len(s) for s in strings], dtype=np.int32)
+    return np.frombuffer(text, dtype=np.uint8), ends
+
+
+def pack_info(info, num_bytes):
+    """Return the disassembly results as a dict of numpy arrays, in the form
+    used by the cache entries
+    """
+    if isinstance(info, CachedDisassemblyInfo):
+        return {
+            "rows": info.rows,
+            "text": info.text,
+            "index_to_row": info.index_to_row,
+            "labels": info.labels,
+        }
+    lines = list(info)
+    rows = np.empty(len(lines), dtype=row_dtype)
+    rows['pc'] = [line.pc for line in lines]
+    rows['num_bytes'] = [line.num_bytes for line in lines]
+    rows['flag'] = [line.flag for line in lines]
+    rows['dest_pc'] = [line.dest_pc for line in lines]
+    text, ends = pack_text([line.instruction for line in lines])
+    rows['text_end'] = ends
+    rows['text_start'][0:1] = 0
+    rows['text_start'][1:] = ends[:-1]
+    return {
+        "rows": rows,
+        "text": text,
+        "index_to_row": np.asarray(info.index_to_row[0:num_bytes], dtype=np.int32),
+        "labels": np.asarray(info.labels, dtype=np.uint8),
+    }
+
+
+def unpack_info(start_addr, arrays):
+    """Return the disassembly results from the arrays created by pack_info
+    """
+    return CachedDisassemblyInfo(start_addr, arrays["rows"], arrays["text"], arrays["index_to_row"], arrays["labels"])
+
+
+class CachedLine(object):
+    __slots__ = ['pc', 'dest_pc', 'num_bytes', 'flag', 'instruction']
+
+    is_placeholder = False
+
+    def __init__(self, row, text):
+        self.pc = int(row['pc'])
+        self.num_bytes = int(row['num_bytes'])
+        self.flag = int(row['flag'])
+        self.dest_pc = int(row['dest_pc'])
+        self.instruction = text[row['text_start']:row['text_end']].tostring()
+
+
+class CachedDisassemblyInfo(object):
+    """Disassembly results loaded from the cache
+
+    Provides the same interface as the results of fast_disassemble_segment,
+    creating the rows from the memory mapped arrays as they are accessed.
+    """
+    def __init__(self, start_addr, rows, text, index_to_row, labels):
+        self.start_addr = start_addr
+        self.rows = rows
+        self.text = text
+        self.index_to_row = index_to_row
+        self.labels = labels
+
+    def __len__(self):
+        return len(self.rows)
+
+    def __iter__(self):
+        for row in range(len(self.rows)):
+            yield self[row]
+
+    def __getitem__(self, row):
+        return CachedLine(self.rows[row], self.text)
+
+    @property
+    def num_instructions(self):
+        return len(self.rows)
+
+    def get_instruction_start_pc(self, pc):
+        row = self.index_to_row[pc - self.start_addr]
+        return int(self.rows[row]['pc'])
+
+
+class DisassemblyCache(object):
+    default_max_size = 256 * 1024 * 1024
+
+    caches = {}
+
+    def __init__(self, dirname, max_size=None):
+        self.dirname = dirname
+        self.max_size = max_size if max_size is not None else self.default_max_size
+        if not os.path.exists(dirname):
+            os.makedirs(dirname)
+
+    @classmethod
+    def get_cache(cls, dirname):
+        """Return the shared cache for the directory
+        """
+        if dirname not in cls.caches:
+            cls.caches[dirname] = cls(dirname)
+        return cls.caches[dirname]
+
+    def get_key(self, disassembler, segment):
+        return get_key(disassembler, segment)
+
+    def __contains__(self, key):
+        return os.path.isdir(self.get_path(key))
+
+    def get_path(self, key, name=None):
+        path = os.path.join(self.dirname, key)
+        if name is not None:
+            path = os.path.join(path, name + ".npy")
+        return path
+
+    def load(self, key, start_addr):
+        """Return the disassembly results for the key, or None if they aren't
+        in the cache
+        """
+        path = self.get_path(key)
+        if not os.path.isdir(path):
+            return None
+        arrays = {}
+        try:
+            for name in ["rows", "text", "index_to_row", "labels"]:
+                arrays[name] = np.load(self.get_path(key, name), mmap_mode="r")
+        except (IOError, ValueError), e:
+            log.warning("Discarding bad disassembly cache entry %s: %s" % (key, e))
+            self.remove(key)
+            return None
+        self.touch(key)
+        log.debug("Loaded %d rows from disassembly cache entry %s" % (len(arrays["rows"]), key))
+        return unpack_info(start_addr, arrays)
+
+    def save(self, key, info, num_bytes):
+        """Save the disassembly results, replacing any existing entry
+        """
+        self.save_arrays(key, pack_info(info, num_bytes))
+
+    def save_arrays(self, key, arrays):
+        """Save the disassembly results already converted by pack_info
+        """
+        # write to a temporary directory and rename it so a partially
+        # written entry is never seen
+        tmpdir = tempfile.mkdtemp(prefix="tmp", dir=self.dirname)
+        try:
+            for name, array in arrays.iteritems():
+                np.save(os.path.join(tmpdir, name + ".npy"), array)
+            self.remove(key)
+            os.rename(tmpdir, self.get_path(key))
+        except (IOError, OSError), e:
+            log.error("Failed saving disassembly cache entry %s: %s" % (key, e))
+            shutil.rmtree(tmpdir, True)
+            return
+        log.debug("Saved %d rows to disassembly cache entry %s" % (len(arrays["rows"]), key))
+        self.evict(key)
+
+    def load_texts(self, key, name):
+        """Return the list of (pc, text) saved with save_texts, or None if
+        the entry doesn't have them
+        """
+        try:
+            pcs = np.load(self.get_path(key, name + "_pcs"), mmap_mode="r")
+            ends = np.load(self.get_path(key, name + "_ends"), mmap_mode="r")
+            text = np.load(self.get_path(key, name + "_text"), mmap_mode="r").tostring()
+        except (IOError, ValueError):
+            return None
+        if len(pcs) != len(ends) or (len(ends) > 0 and ends[-1] != len(text)):
+            # the arrays are from different saves
+            log.warning("Discarding mismatched %s in disassembly cache entry %s" % (name, key))
+            return None
+        starts = np.zeros(len(ends), dtype=np.int32)
+        starts[1:] = ends[:-1]
+        return [(int(pc), text[s:e]) for pc, s, e in zip(pcs, starts, ends)]
+
+    def save_texts(self, key, name, items):
+        """Add a list of (pc, text) pairs to an existing entry
+        """
+        if not os.path.isdir(self.get_path(key)):
+            return
+        items = sorted(items)
+        pcs = np.asarray([pc for pc, _ in items], dtype=np.int32)
+        text, ends = pack_text([t for _, t in items])
+        # like the entry itself, each array is written to a temporary file
+        # and renamed so a partially written array is never seen
+        tmpnames = []
+        try:
+            for suffix, array in [("_text", text), ("_ends", ends), ("_pcs", pcs)]:
+                fd, tmpname = tempfile.mkstemp(prefix="tmp", suffix=".npy", dir=self.get_path(key))
+                tmpnames.append(tmpname)
+                with os.fdopen(fd, "wb") as fh:
+                    np.save(fh, array)
+            for suffix, tmpname in zip(["_text", "_ends", "_pcs"], tmpnames):
+                os.rename(tmpname, self.get_path(key, name + suffix))
+        except (IOError, OSError), e:
+            log.error("Failed saving %s to disassembly cache entry %s: %s" % (name, key, e))
+            for tmpname in tmpnames:
+                if os.path.exists(tmpname):
+                    os.remove(tmpname)
+
+    def touch(self, key):
+        try:
+            os.utime(self.get_path(key), None)
+        except OSError:
+            pass
+
+    def remove(self, key):
+        path = self.get_path(key)
+        if os.path.exists(path):
+            shutil.rmtree(path, True)
+
+    def get_entries(self):
+        """Return a list of (mtime, size, key) of the entries, oldest first
+        """
+        entries = []
+        for key in os.listdir(self.dirname):
+            path = self.get_path(key)
+            if key.startswith("tmp") or not os.path.isdir(path):
+                continue
+            size = 0
+            for filename in os.listdir(path):
+                size += os.path.getsize(os.path.join(path, filename))
+            entries.append((os.path.getmtime(path), size, key))
+        entries.sort()
+        return entries
+
+    def evict(self, keep=None):
+        """Remove the least recently used entries until the total size is
+        within the limit, never removing the entry keep
+        """
+        entries = self.get_entries()
+        total = sum(size for _, size, _ in entries)
+        for mtime, size, key in entries:
+            if total <= self.max_size:
+                break
+            if key == keep:
+                continue
+            log.debug("Evicting disassembly cache entry %s, %d bytes" % (key, size))
+            self.remove(key)
+            total -= size
@@ -0,0 +1,252 @@
+"""Indexed search of the text of a disassembly
+
+Searching used to lowercase and scan the instruction text of every row for
+every keystroke in the minibuffer. DisassemblySearchIndex is built once per
+disassembly instead:
+
+ * the instruction text of all rows is joined into a single newline
+   separated string (and its lower case copy), along with the offset of each
+   row in it. Substring and regular expression searches are a single scan of
+   that string in C, and the match positions are converted to rows with a
+   binary search.
+
+ * the mnemonic of each row is stored as an id in an array, so a search for
+   a whole mnemonic is a comparison of that array.
+
+ * labels, data directives and comments are indexed by the trigrams of
+   their text, so only the entries that contain every trigram of the search
+   text are checked.
+
+When rows of the disassembly are replaced, the same rows are replaced in the
+joined text and the arrays. The label index is rebuilt the next time it is
+needed.
+"""
+import re
+
+import numpy as np
+
+import udis.udis_fast as udis_fast
+
+import logging
+log = logging.getLogger(__name__)
+
+
+search_modes = ["substring", "token", "regex"]
+
+
+def get_token_regex(text):
+    """Return the regular expression that matches the text only where it is
+    not part of a longer word
+    """
+    return r"(?<![\w$#])" + re.escape(text) + r"(?![\w])"
+
+
+def get_trigrams(text):
+    return set(text[i:i + 3] for i in range(len(text) - 2))
+
+
+class TrigramIndex(object):
+    """Index of a list of (pc, text) entries by the lower case trigrams of
+    their text
+    """
+    def __init__(self, items):
+        items = list(items)
+        self.pcs = np.asarray([pc for pc, text in items], dtype=np.int32)
+        self.texts = [text for pc, text in items]
+        self.lower_texts = [text.lower() for text in self.texts]
+        postings = {}
+        for i, text in enumerate(self.lower_texts):
+            for gram in get_trigrams(text):
+                postings.setdefault(gram, []).append(i)
+        self.postings = dict((gram, np.asarray(ids, dtype=np.int32)) for gram, ids in postings.iteritems())
+
+    def __len__(self):
+        return len(self.texts)
+
+    def get_candidates(self, text):
+        """Return the entries that contain all the trigrams of the text
+        """
+        grams = get_trigrams(text.lower())
+        if not grams:
+            return np.arange(len(self.texts), dtype=np.int32)
+        found = None
+        for gram in sorted(grams, key=lambda g: len(self.postings.get(g, ()))):
+            ids = self.postings.get(gram)
+            if ids is None:
+                return np.zeros(0, dtype=np.int32)
+            found = ids if found is None else np.intersect1d(found, ids, assume_unique=True)
+            if len(found) == 0:
+                break
+        return found
+
+    def search(self, text, match_case=False, mode="substring"):
+        """Return the sorted, unique addresses of the entries that match
+        """
+        if mode == "regex":
+            try:
+                regex = re.compile(text, 0 if match_case else re.IGNORECASE)
+            except re.error:
+                return np.zeros(0, dtype=np.int32)
+            texts = self.texts
+            ids = [i for i, t in enumerate(texts) if regex.search(t)]
+        else:
+            candidates = self.get_candidates(text)
+            texts = self.texts if match_case else self.lower_texts
+            if not match_case:
+                text = text.lower()
+            if mode == "token":
+                regex = re.compile(get_token_regex(text))
+                ids = [i for i in candidates if regex.search(texts[i])]
+            else:
+                ids = [i for i in candidates if text in texts[i]]
+        return np.unique(self.pcs[np.asarray(ids, dtype=np.int32)])
+
+
+class DisassemblySearchIndex(object):
+    """Index of the instruction text of each row of a disassembly and of its
+    labels and comments
+    """
+    def __init__(self, start_addr, lines):
+        self.start_addr = start_addr
+        self.mnemonics = {}
+        lines = list(lines)
+        self.text, self.starts = self.join_lines(lines)
+        self.lower_text = None
+        self.pcs, self.sizes, self.mnemonic_ids = self.get_line_arrays(lines)
+        self.label_index = None
+        self.comments = None
+
+    def __len__(self):
+        return len(self.pcs)
+
+    def join_lines(self, lines):
+        """Return the text of the lines joined by newlines and the offset of
+        the start of each line in it
+        """
+        # placeholder rows of a progressive disassembly aren't searched
+        texts = ["" if getattr(line, "is_placeholder", False) else line.instruction for line in lines]
+        text = "\n".join(texts) + "\n" if texts else ""
+        ends = np.flatnonzero(np.frombuffer(text, dtype=np.uint8) == 10)
+        if len(ends) != len(texts):
+            # a newline in the text of a row would throw off every row after
+            # it, so it's replaced by a space
+            return self.join_texts([t.replace("\n", " ") for t in texts])
+        starts = np.zeros(len(texts), dtype=np.int64)
+        starts[1:] = ends[:-1] + 1
+        return text, starts
+
+    def join_texts(self, texts):
+        text = "\n".join(texts) + "\n" if texts else ""
+        lengths = np.asarray([len(t) + 1 for t in texts], dtype=np.int64)
+        return text, np.cumsum(lengths) - lengths
+
+    def get_mnemonic_id(self, line):
+        if line.flag & (udis_fast.flag_data_bytes | udis_fast.flag_origin) or getattr(line, "is_placeholder", False):
+            return -1
+        text = line.instruction.split(None, 1)
+        if not text:
+            return -1
+        mnemonic = text[0].lower()
+        try:
+            return self.mnemonics[mnemonic]
+        except KeyError:
+            id = len(self.mnemonics)
+            self.mnemonics[mnemonic] = id
+            return id
+
+    def get_line_arrays(self, lines):
+        pcs = np.asarray([line.pc for line in lines], dtype=np.int32)
+        sizes = np.asarray([line.num_bytes for line in lines], dtype=np.int32)
+        mnemonic_ids = np.asarray([self.get_mnemonic_id(line) for line in lines], dtype=np.int32)
+        return pcs, sizes, mnemonic_ids
+
+    def splice(self, first_row, last_row, lines):
+        """Replace the rows first_row up to but not including last_row with
+        the text of the new lines
+        """
+        lines = list(lines)
+        text, starts = self.join_lines(lines)
+        size = len(self.text)
+        start = self.starts[first_row] if first_row < len(self.starts) else size
+        end = self.starts[last_row] if last_row < len(self.starts) else size
+        self.text = self.text[:start] + text + self.text[end:]
+        if self.lower_text is not None:
+            self.lower_text = self.lower_text[:start] + text.lower() + self.lower_text[end:]
+        self.starts = np.concatenate((self.starts[:first_row], starts + start, self.starts[last_row:] + (len(text) - (end - start))))
+        pcs, sizes, mnemonic_ids = self.get_line_arrays(lines)
+        self.pcs = np.concatenate((self.pcs[:first_row], pcs, self.pcs[last_row:]))
+        self.sizes = np.concatenate((self.sizes[:first_row], sizes, self.sizes[last_row:]))
+        self.mnemonic_ids = np.concatenate((self.mnemonic_ids[:first_row], mnemonic_ids, self.mnemonic_ids[last_row:]))
+        self.label_index = None
+
+    def get_row_text(self, row):
+        start = self.starts[row]
+        end = self.starts[row + 1] if row + 1 < len(self.starts) else len(self.text)
+        return self.text[start:end - 1]
+
+    def get_text(self, match_case):
+        if match_case:
+            return self.text
+        if self.lower_text is None:
+            self.lower_text = self.text.lower()
+        return self.lower_text
+
+    def get_match_rows(self, regex, text):
+        """Return the rows that contain a match of the compiled regular
+        expression, ignoring any match that continues into the next row
+        """
+        spans = np.asarray([m.span() for m in regex.finditer(text)], dtype=np.int64).reshape(-1, 2)
+        if len(spans) == 0:
+            return np.zeros(0, dtype=np.int32)
+        rows = np.searchsorted(self.starts, spans[:, 0], side="right") - 1
+        ends = np.append(self.starts[1:], len(text))[rows] - 1
+        return np.unique(rows[spans[:, 1] <= ends])
+
+    def search_rows(self, text, match_case=False, mode="substring"):
+        """Return the rows whose instruction text matches
+        """
+        if mode == "regex":
+            try:
+                regex = re.compile(text, re.MULTILINE if match_case else re.MULTILINE | re.IGNORECASE)
+            except re.error:
+                return np.zeros(0, dtype=np.int32)
+            return self.get_match_rows(regex, self.text)
+        if not match_case:
+            text = text.lower()
+        if mode == "token":
+            id = self.mnemonics.get(text.lower())
+            if id is not None:
+                # mnemonics are reserved words, so they won't be found
+                # anywhere else in the instruction. They all have the same
+                # case, so checking the first is enough to match case.
+                rows = np.flatnonzero(self.mnemonic_ids == id)
+                if match_case and len(rows) > 0 and self.get_row_text(rows[0]).split(None, 1)[0] != text:
+                    return np.zeros(0, dtype=np.int32)
+                return rows
+            regex = re.compile(get_token_regex(text))
+        else:
+            regex = re.compile(re.escape(text))
+        return self.get_match_rows(regex, self.get_text(match_case))
+
+    def set_labels(self, items, comments):
+        """Index the (pc, text) entries of the labels and directives and the
+        comments of the segment
+        """
+        items = list(items)
+        items.extend((self.start_addr + index, text) for index, text in comments.iteritems() if text)
+        self.label_index = TrigramIndex(items)
+        self.comments = comments
+
+    def search(self, text, match_case=False, mode="substring"):
+        """Return a list of (start, end) index ranges of the rows whose
+        instruction matches, followed by the single byte ranges of the
+        addresses whose label, directive or comment matches
+        """
+        s = self.start_addr
+        rows = self.search_rows(text, match_case, mode)
+        starts = self.pcs[rows] - s
+        matches = zip(starts.tolist(), (starts + self.sizes[rows]).tolist())
+        if self.label_index is not None:
+            indexes = self.label_index.search(text, match_case, mode) - s
+            matches.extend(zip(indexes.tolist(), (indexes + 1).tolist()))
+        return matches
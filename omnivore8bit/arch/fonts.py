@@ -1,7 +1,6 @@
 import hashlib, uuid
 
 import numpy as np
-import wx
 
 import colors
 
@@ -104,10 +103,22 @@ class AnticFont(object):
         c_colors = colors.get_blended_color_registers(m.color_registers, prefs.comment_background_color)
         self.comment_font = font_renderer.get_font(data, c_colors, self.comment_gr0_colors, reverse)
 
+        # All style variants of the font in a single array so the font map
+        # renderers can assemble a frame with one lookup. The variants are in
+        # the order of the renderer style classes (normal, data, comment,
+        # match, highlight) followed by a blank background glyph.
+        self.glyphs_per_style = self.normal_font.shape[0]
+        blank = np.empty((1,) + self.normal_font.shape[1:], dtype=np.uint8)
+        blank[:] = prefs.background_color
+        self.font_atlas = np.vstack((self.normal_font, self.data_font, self.comment_font, self.match_font, self.highlight_font, blank))
+        self.blank_glyph = self.font_atlas.shape[0] - 1
+
     def get_height(self, zoom):
         return self.char_h * self.scale_h * zoom
 
     def get_image(self, char_index, zoom, highlight=False):
+        import wx
+
         f = self.highlight_font if highlight else self.normal_font
         array = f[char_index]
         w = self.char_w
@@ -0,0 +1,222 @@
+"""Disassembly listings
+
+ListingWriter formats the rows of a disassembly for the source and ATasm
+style listings. The get_disassembled_text, get_atasm_lst_text and
+iter_row_text methods of the disassembler use it to build the lines, and it
+can also write the listing to a file handle in large blocks as it goes, so
+only a block of the listing is ever in memory. The hex bytes of the listed
+rows are formatted at once and the data directives are assembled from a
+table of formatted digit pairs, instead of string formatting every byte of
+every row.
+"""
+import numpy as np
+
+import udis.udis_fast as udis_fast
+
+import logging
+log = logging.getLogger(__name__)
+
+
+class ListingWriter(object):
+    # number of characters collected before they are written to the file
+    block_size = 256 * 1024
+
+    def __init__(self, disassembler, fh, max_bytes_per_line=8, newline="\n"):
+        self.disassembler = disassembler
+        self.fh = fh
+        self.max_bytes_per_line = max_bytes_per_line
+        self.newline = newline
+        self.pending = []
+        self.pending_size = 0
+        self.digit_tokens = {}
+        self.offset = 0
+        self.hex_text = None
+        self.hex_text_upper = None
+        self.comments = None
+        self.comment_counts = None
+
+    def write_line(self, text):
+        self.pending.append(text)
+        self.pending.append(self.newline)
+        self.pending_size += len(text) + len(self.newline)
+        if self.pending_size >= self.block_size:
+            self.flush()
+
+    def flush(self):
+        if self.pending:
+            self.fh.write("".join(self.pending))
+            self.pending = []
+            self.pending_size = 0
+
+    def prepare(self, start=0, end=-1):
+        """Format the hex bytes and find the comments of the rows covering
+        the indexes start up to but not including end
+        """
+        d = self.disassembler
+        info = d.info
+        segment = d.segment
+        if end < 0:
+            end = len(info.index_to_row)
+        first = info[info.index_to_row[start]].pc - d.start_addr
+        line = info[info.index_to_row[end - 1]]
+        last = line.pc - d.start_addr + line.num_bytes
+        self.offset = first
+        table = np.asarray([d.fmt_hex2 % i for i in range(256)], dtype=object)
+        self.hex_text = " ".join(table[segment.data[first:last]])
+        self.hex_text_upper = None
+
+        # number of commented bytes before each index, so rows without any
+        # comments are found without looking up each byte
+        self.comments = segment.get_comments_in_range(first, last)
+        has_comment = np.zeros(last - first + 1, dtype=np.int32)
+        for index, text in self.comments.iteritems():
+            if text:
+                has_comment[index - first + 1] = 1
+        self.comment_counts = np.cumsum(has_comment)
+
+    def get_hex_bytes(self, index, num, upper=False):
+        if upper:
+            if self.hex_text_upper is None:
+                self.hex_text_upper = self.hex_text.upper()
+            text = self.hex_text_upper
+        else:
+            text = self.hex_text
+        index -= self.offset
+        return text[index * 3:(index + num) * 3 - 1]
+
+    def get_data_directive(self, digits):
+        tokens = self.digit_tokens
+        d = self.disassembler
+        parts = []
+        for i in range(0, (len(digits) / 2) * 2, 2):
+            pair = digits[i:i + 2]
+            token = tokens.get(pair)
+            if token is None:
+                token = d.fmt_hex_digits % (pair[0], pair[1])
+                tokens[pair] = token
+            parts.append(token)
+        return d.fmt_hex_directive + " " + d.fmt_hex_digit_separator.join(parts)
+
+    def get_comment(self, index, line):
+        comments = []
+        c = line.instruction
+        if ";" in c:
+            _, c = c.split(";", 1)
+            comments.append(c)
+        end = index + line.num_bytes
+        counts = self.comment_counts
+        if line.num_bytes > 0 and counts[end - self.offset] > counts[index - self.offset]:
+            for i in range(index, end):
+                c = self.comments.get(i)
+                if c:
+                    comments.append(c)
+        if comments:
+            text = " ".join(comments)
+            return text.replace("\r", "").replace("\n", "")
+        return ""
+
+    def iter_rows(self, start=0, end=-1, upper=False):
+        """Yield a tuple of the line, hex bytes, code, comment and number of
+        bytes for each row of the listing covering the indexes start up to
+        but not including end. Data rows with more than max_bytes_per_line
+        bytes are split over several rows. prepare must be called first.
+
+        Raises IndexError if the disassembly hasn't reached the rows yet.
+        """
+        d = self.disassembler
+        info = d.info
+        if end < 0:
+            end = len(info.index_to_row)
+        start_row = info.index_to_row[start]
+        end_row = info.index_to_row[end - 1]
+        if d.progress is not None and info.has_placeholders(start_row, end_row + 1):
+            raise IndexError("Disassembly hasn't reached index %d yet" % start)
+        max_bytes = self.max_bytes_per_line
+        flag_data_bytes = udis_fast.flag_data_bytes
+        flag_origin = udis_fast.flag_origin
+        start_addr = d.start_addr
+        for row in range(start_row, end_row + 1):
+            line = info[row]
+            index = line.pc - start_addr
+            label = d.format_label(line)
+            comment = self.get_comment(index, line)
+            operand = d.get_operand_from_instruction(line.instruction)
+            if line.flag & flag_data_bytes and line.num_bytes > max_bytes:
+                for i in range(0, line.num_bytes, max_bytes):
+                    count = min(line.num_bytes, i + max_bytes) - i
+                    hex_bytes = self.get_hex_bytes(index + i, count, upper)
+                    code = self.get_data_directive(operand[i*2:(i+count)*2])
+                    yield line, hex_bytes, label + "   " + code, comment, count
+                    label = "     "
+                    comment = ""
+            else:
+                if line.flag == flag_origin:
+                    hex_bytes = ""
+                else:
+                    hex_bytes = self.get_hex_bytes(index, line.num_bytes, upper)
+                if line.flag == flag_origin or not line.flag & flag_data_bytes:
+                    code = d.format_operand(line, operand)
+                else:
+                    code = self.get_data_directive(operand)
+                yield line, hex_bytes, label + "   " + code, comment, line.num_bytes
+
+    def iter_source(self, start=0, end=-1):
+        """Yield the lines of the source listing
+        """
+        self.prepare(start, end)
+        d = self.disassembler
+        line = d.info[d.info.index_to_row[start]]
+        yield "        " + d.get_origin(line.pc)
+        for line, hex_bytes, code, comment, num_bytes in self.iter_rows(start, end):
+            if comment:
+                yield "%-30s; %s" % (code, comment)
+            else:
+                yield code
+
+    def iter_atasm_lst(self):
+        """Yield the lines of the ATasm style listing. The bytes of data rows
+        are listed two to a line, in one string joined by the newline.
+        """
+        self.prepare()
+        d = self.disassembler
+        yield ""
+        yield "Source: %s.s" % (d.segment.name)
+        flag_origin = udis_fast.flag_origin
+        line_num = 2
+        for line, hex_bytes, code, comment, num_bytes in self.iter_rows(upper=True):
+            if line.flag == flag_origin:
+                line_num += 1
+                continue
+            if comment:
+                code = "%-30s; %s" % (code, comment.rstrip())
+            if ".byte" in code and num_bytes == 0:
+                yield ""
+            elif ".byte" in code:
+                pc = line.pc
+                parts = ["%05d %04X  %-17s %s" % (line_num, pc, hex_bytes[0:6].rstrip(), code)]
+                for count in range(2, num_bytes, 2):
+                    parts.append("%05d %04X  %s " % (line_num, pc + count, hex_bytes[count * 3:count * 3 + 6].rstrip()))
+                yield self.newline.join(parts)
+            else:
+                yield "%05d %04X  %-17s %s" % (line_num, line.pc, hex_bytes, code)
+            line_num += 1
+
+    def write_source(self, start=0, end=-1):
+        """Write the lines of the source listing, finishing the disassembly
+        first if needed
+        """
+        self.disassembler.complete()
+        write_line = self.write_line
+        for text in self.iter_source(start, end):
+            write_line(text)
+        self.flush()
+
+    def write_atasm_lst(self):
+        """Write the lines of the ATasm style listing, finishing the
+        disassembly first if needed
+        """
+        self.disassembler.complete()
+        write_line = self.write_line
+        for text in self.iter_atasm_lst():
+            write_line(text)
+        self.flush()
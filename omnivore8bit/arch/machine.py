@@ -255,24 +255,9 @@ class Machine(HasTraits):
         self.bitmap_color_change_event = True
 
     def get_color_registers(self, antic_color_registers=None):
-        color_converter = self.get_color_converter()
-        registers = []
         if antic_color_registers is None:
             antic_color_registers = self.antic_color_registers
-        for c in antic_color_registers:
-            registers.append(color_converter(c))
-
-        # make sure there are 16 registers for 4bpp modes
-        i = len(registers)
-        for i in range(len(registers), 16):
-            registers.append((i*16, i*16, i*16))
-
-        # Extend to 32 for dimmed copies of the 16 colors
-        dim = []
-        for r in registers:
-            dim.append((r[0]/4 + 64, r[1]/4 + 64, r[2]/4 + 64))
-        registers.extend(dim)
-        return registers
+        return colors.get_color_registers(antic_color_registers, self.get_color_converter())
 
     def get_color_converter(self):
         if self.color_standard == 0:
@@ -348,37 +333,7 @@ class Machine(HasTraits):
 
     @classmethod
     def guess_default_assemblers(cls):
-        asm_list = [
-            {'comment char': ';',
-             'origin': '*=',
-             'data byte': '.byte',
-             'data byte prefix': '$',
-             'data byte separator': ', ',
-             'name': "MAC/65",
-             },
-            {'comment char': ';',
-             'origin': '.org',
-             'data byte': '.byte',
-             'data byte prefix': '$',
-             'data byte separator': ', ',
-             'name': "cc65",
-             },
-            {'comment char': ';',
-             'origin': '.org',
-             'data byte': '.byte',
-             'data byte prefix': '$',
-             'data byte separator': ', ',
-             'name': "MADS",
-             },
-            {'comment char': ';',
-             'origin': 'org',
-             'data byte': 'hex',
-             'data byte prefix': '',
-             'data byte separator': '',
-             'name': "Merlin",
-             },
-            ]
-        return [dict(asm) for asm in asm_list]  # force a copy
+        return [dict(asm) for asm in disasm.known_assemblers]  # force a copy
 
     @classmethod
     def set_system_default_assembler(cls, task, asm):
@@ -445,6 +400,8 @@ class Machine(HasTraits):
             mmap = parent.__class__("CustomMemoryMap", (parent,), {"rmemmap": dict(self.memory_map.rmemmap), "wmemmap": dict(self.memory_map.wmemmap)})
             if document_memory_map:
                 mmap.rmemmap.update(document_memory_map)
+            # labels to fall back on when a segment label is removed
+            mmap.base_rmemmap = dict(mmap.rmemmap)
             if segment_memory_map:
                 mmap.rmemmap.update(segment_memory_map)
         return self.disassembler(self.assembler, mmap, hex_lower, mnemonic_lower)
@@ -499,6 +456,9 @@ predefined = {
         antic_renderers.OneBitPerPixelPM2(),
         antic_renderers.OneBitPerPixelPM4(),
         antic_renderers.OneBitPerPixelApple2Linear(),
+        # OneBitPerPixelApple2FullScreen maps the whole hi-res page at once,
+        # not the visible rows, so it's only used by the headless renderer
+        antic_renderers.OneBitPerPixelApple2Artifacting(),
         antic_renderers.ModeB(),
         antic_renderers.ModeC(),
         antic_renderers.ModeD(),
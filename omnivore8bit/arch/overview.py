@@ -0,0 +1,166 @@
+import numpy as np
+
+import logging
+log = logging.getLogger(__name__)
+
+
+class MemoryMapPyramid(object):
+    """Downsampled summaries of a segment used by the memory map overview
+
+    Level zero is a copy of the bytes and style of the segment (although
+    get_level returns the segment itself for it), and each level above it summarizes blocks of `reduction` entries of the level
+    below, so an entry at level n covers reduction**n bytes. Each level keeps
+    the maximum byte value, the mean byte value and the OR of all the style
+    bits in the block, so regions of code, data, comments and search matches
+    are still visible when the whole segment is shown at once.
+
+    The copy of the source bytes is used to find what has changed since the
+    last update, so only the blocks containing changed bytes are recalculated
+    on every level. The summary arrays are updated in place, so any views of
+    them handed out by get_level stay current.
+    """
+    reduction = 4
+
+    summary_types = ["max", "mean"]
+
+    def __init__(self, data, style):
+        self.data = data
+        self.style = style
+        self.rebuild()
+
+    @property
+    def num_levels(self):
+        return len(self.maxes)
+
+    def is_source(self, data, style):
+        return data is self.data and style is self.style and len(data) == self.num_bytes
+
+    def block_size(self, level):
+        return self.reduction ** level
+
+    def level_size(self, level):
+        """Number of valid entries at the level
+        """
+        b = self.block_size(level)
+        return (self.num_bytes + b - 1) // b
+
+    def padded(self, size):
+        r = self.reduction
+        return ((size + r - 1) // r) * r
+
+    def rebuild(self):
+        self.num_bytes = len(self.data)
+        n = self.num_bytes
+        size = self.padded(n)
+        values = np.zeros(size, dtype=np.uint8)
+        values[0:n] = self.data
+        style = np.zeros(size, dtype=np.uint8)
+        style[0:n] = self.style
+        self.maxes = [values]
+        self.means = [values]
+        self.sums = [values]
+        self.styles = [style]
+        self.counts = [None]
+        level = 1
+        while n > 1:
+            n = self.level_size(level)
+            size = self.padded(n)
+            self.maxes.append(np.zeros(size, dtype=np.uint8))
+            self.means.append(np.zeros(size, dtype=np.uint8))
+            self.sums.append(np.zeros(size, dtype=np.uint32))
+            self.styles.append(np.zeros(size, dtype=np.uint8))
+            b = self.block_size(level)
+            counts = np.empty(n, dtype=np.uint32)
+            counts[:] = b
+            counts[-1] = self.num_bytes - (n - 1) * b
+            self.counts.append(counts)
+            self.reduce_level(level, slice(0, n))
+            level += 1
+        log.debug("memory map pyramid: %d bytes, %d levels" % (self.num_bytes, self.num_levels))
+
+    def reduce_level(self, level, blocks):
+        """Recalculate the entries of the level given by blocks, which can be
+        a slice or an array of entry indexes, from the level below.
+        """
+        r = self.reduction
+        below = level - 1
+        self.maxes[level][blocks] = self.maxes[below].reshape((-1, r))[blocks].max(axis=1)
+        self.sums[level][blocks] = self.sums[below].reshape((-1, r))[blocks].sum(axis=1, dtype=np.uint32)
+        self.styles[level][blocks] = np.bitwise_or.reduce(self.styles[below].reshape((-1, r))[blocks], axis=1)
+        counts = self.counts[level][blocks]
+        self.means[level][blocks] = (self.sums[level][blocks] + counts // 2) // counts
+
+    def propagate(self, changed):
+        """Update the summaries on every level after the level zero entries
+        at the sorted indexes in changed have been modified
+        """
+        r = self.reduction
+        blocks = changed
+        for level in range(1, self.num_levels):
+            if len(blocks) > 1 and blocks[-1] - blocks[0] == len(blocks) - 1:
+                # contiguous range, so avoid the fancy indexing
+                blocks = np.arange(blocks[0] // r, blocks[-1] // r + 1)
+                self.reduce_level(level, slice(blocks[0], blocks[-1] + 1))
+            else:
+                blocks = np.unique(blocks // r)
+                self.reduce_level(level, blocks)
+
+    def update(self, start, end):
+        """Copy the source bytes in the range start:end and update the
+        summaries that depend on them
+        """
+        if len(self.data) != self.num_bytes:
+            self.rebuild()
+            return
+        start = max(0, start)
+        end = min(end, self.num_bytes)
+        if start >= end:
+            return
+        self.maxes[0][start:end] = self.data[start:end]
+        self.styles[0][start:end] = self.style[start:end]
+        self.propagate(np.arange(start, end))
+
+    def sync(self):
+        """Compare the source to the copy made during the last update and
+        update only the summaries of the bytes that are different.
+
+        Returns the number of changed bytes.
+        """
+        if len(self.data) != self.num_bytes:
+            self.rebuild()
+            return self.num_bytes
+        n = self.num_bytes
+        values = self.maxes[0]
+        style = self.styles[0]
+        changed = np.flatnonzero((values[0:n] != self.data) | (style[0:n] != self.style))
+        if len(changed) > 0:
+            values[changed] = self.data[changed]
+            style[changed] = self.style[changed]
+            self.propagate(changed)
+        return len(changed)
+
+    def get_level(self, level, summary="max"):
+        """Return the byte values and style bits at the level, using the
+        summary type to choose which byte value is used for each block.
+
+        Level zero is the source itself, so it never needs to be updated.
+        """
+        level = max(0, min(level, self.num_levels - 1))
+        if level == 0:
+            return self.data, self.style
+        n = self.level_size(level)
+        if summary == "mean":
+            values = self.means[level]
+        else:
+            values = self.maxes[level]
+        return values[0:n], self.styles[level][0:n]
+
+    def get_fit_level(self, bytes_per_row, num_rows):
+        """Return the lowest level that fits the entire segment into num_rows
+        rows of bytes_per_row entries each
+        """
+        space = max(1, bytes_per_row * num_rows)
+        for level in range(self.num_levels):
+            if self.level_size(level) <= space:
+                return level
+        return self.num_levels - 1
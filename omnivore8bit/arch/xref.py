@@ -0,0 +1,136 @@
+import numpy as np
+
+import logging
+log = logging.getLogger(__name__)
+
+
+xref_other = 0
+xref_read = 1
+xref_write = 2
+xref_jump = 3
+xref_call = 4
+
+xref_kind_names = {
+    xref_other: "ref",
+    xref_read: "read",
+    xref_write: "write",
+    xref_jump: "jump",
+    xref_call: "call",
+}
+
+
+def get_line_arrays(lines):
+    """Return the address, the target address and the flags of each line
+    """
+    pcs = np.asarray([line.pc for line in lines], dtype=np.int32)
+    dest_pcs = np.asarray([line.dest_pc for line in lines], dtype=np.int32)
+    flags = np.asarray([line.flag for line in lines], dtype=np.uint16)
+    return pcs, dest_pcs, flags
+
+
+class CrossReferenceIndex(object):
+    """Index of the rows of a disassembly that refer to each address
+
+    Each reference is stored as a 64 bit key with the target address in the
+    upper 32 bits and the address of the referring row in the lower 32 bits.
+    The keys are kept sorted, so all the references to an address (or a
+    range of addresses) are found with a binary search, and the references
+    are listed in order of the referring address.
+
+    The references from a range of rows are replaced when those rows are
+    disassembled again, by deleting the old keys and inserting the new ones
+    at their sorted positions.
+
+    The kind of each reference is found by calling classify with the
+    addresses and the flags of the referring rows, returning an array of
+    kinds.
+    """
+    def __init__(self, classify=None):
+        self.classify = classify
+        self.keys = np.zeros(0, dtype=np.int64)
+        self.kinds = np.zeros(0, dtype=np.uint8)
+
+    def __len__(self):
+        return len(self.keys)
+
+    def __eq__(self, other):
+        return np.array_equal(self.keys, other.keys) and np.array_equal(self.kinds, other.kinds)
+
+    def __ne__(self, other):
+        return not self == other
+
+    @property
+    def targets(self):
+        return (self.keys >> 32).astype(np.int32)
+
+    @property
+    def sources(self):
+        return (self.keys & 0xffffffff).astype(np.int32)
+
+    def get_references(self, pcs, dest_pcs, flags, flag_label):
+        """Return the sorted keys and the kinds of the references made by
+        the rows with addresses pcs that have a target address
+        """
+        refs = ((flags & flag_label) > 0) & (dest_pcs >= 0)
+        pcs = pcs[refs]
+        keys = (dest_pcs[refs].astype(np.int64) << 32) | pcs.astype(np.int64)
+        if self.classify is not None:
+            kinds = np.asarray(self.classify(pcs, flags[refs]), dtype=np.uint8)
+        else:
+            kinds = np.zeros(len(keys), dtype=np.uint8)
+        order = np.argsort(keys, kind="mergesort")
+        return keys[order], kinds[order]
+
+    def add_references(self, pcs, dest_pcs, flags, flag_label):
+        keys, kinds = self.get_references(pcs, dest_pcs, flags, flag_label)
+        self.insert(keys, kinds)
+
+    def add_lines(self, lines, flag_label):
+        pcs, dest_pcs, flags = get_line_arrays(lines)
+        self.add_references(pcs, dest_pcs, flags, flag_label)
+
+    def insert(self, keys, kinds):
+        if len(keys) == 0:
+            return
+        positions = np.searchsorted(self.keys, keys)
+        self.keys = np.insert(self.keys, positions, keys)
+        self.kinds = np.insert(self.kinds, positions, kinds)
+
+    def remove_sources(self, start_pc, end_pc):
+        """Remove the references made by rows with addresses from start_pc
+        up to but not including end_pc
+        """
+        sources = self.keys & 0xffffffff
+        keep = (sources < start_pc) | (sources >= end_pc)
+        if not keep.all():
+            self.keys = self.keys[keep]
+            self.kinds = self.kinds[keep]
+
+    def replace(self, start_pc, end_pc, lines, flag_label):
+        """Replace the references made by rows with addresses from start_pc
+        up to but not including end_pc with the references of the new lines
+        """
+        self.remove_sources(start_pc, end_pc)
+        self.add_lines(lines, flag_label)
+
+    def get_range(self, start_pc, end_pc):
+        first = np.searchsorted(self.keys, np.int64(start_pc) << 32)
+        last = np.searchsorted(self.keys, np.int64(end_pc) << 32)
+        return first, last
+
+    def get_referrers(self, target_pc, end_pc=None):
+        """Return the addresses of the rows that refer to target_pc (or to
+        any address up to but not including end_pc, if specified) and the
+        kind of each reference
+        """
+        if end_pc is None:
+            end_pc = target_pc + 1
+        first, last = self.get_range(target_pc, end_pc)
+        keys = self.keys[first:last]
+        return (keys & 0xffffffff).astype(np.int32), self.kinds[first:last]
+
+    def count_referrers(self, target_pc, end_pc=None):
+        if end_pc is None:
+            end_pc = target_pc + 1
+        first, last = self.get_range(target_pc, end_pc)
+        return last - first
@@ -20,9 +20,11 @@ from commands import *
 from omnivore8bit.arch.disasm import ANTIC_DISASM, JUMPMAN_LEVEL, JUMPMAN_HARVEST, UNINITIALIZED_DATA
 from omnivore8bit.arch.ui.antic_colors import AnticColorDialog
 from omnivore.utils.wx.dialogs import prompt_for_hex, prompt_for_dec, prompt_for_string, get_file_dialog_wildcard, ListReorderDialog
-from omnivore8bit.ui.dialogs import SegmentOrderDialog, SegmentInterleaveDialog
+from omnivore8bit.ui.dialogs import SegmentOrderDialog, SegmentInterleaveDialog, SearchResultsDialog
 from omnivore8bit.arch.machine import Machine
 from omnivore8bit.document import SegmentedDocument
+from omnivore8bit.utils.segmentutil import get_style_ranges, get_user_style_ranges
+from omnivore8bit.utils.searchutil import BytePattern, find_in_segments
 from omnivore.framework.minibuffer import *
 from omnivore.utils.textutil import parse_int_label_dict
 from omnivore.utils.nputil import count_in_range
@@ -285,7 +287,7 @@ class FindStyleBaseAction(EditorAction):
     tooltip = 'Select a particular style'
 
     def get_ranges(self, segment):
-        return segment.get_style_ranges(selected=True)
+        return get_style_ranges(segment, selected=True)
 
     def perform(self, event):
         e = self.active_editor
@@ -304,15 +306,15 @@ class FindCodeAction(FindStyleBaseAction):
     name = 'Code'
 
     def get_ranges(self, segment):
-        return segment.get_style_ranges(selected=True)
+        return get_user_style_ranges(segment, 0)
 
 
 class FindDataAction(FindStyleBaseAction):
     name = 'Data'
-    user_type = 0
+    user_type = data_style
 
     def get_ranges(self, segment):
-        return segment.get_style_ranges(data=True, user=self.user_type)
+        return get_user_style_ranges(segment, self.user_type)
 
 
 class FindDisplayListAction(FindDataAction):
@@ -347,7 +349,7 @@ class CustomDisassemblerAction(EditorAction):
     def perform(self, event):
         e = self.active_editor
         s = e.segment
-        ranges = s.get_style_ranges(selected=True)
+        ranges = get_style_ranges(s, selected=True)
         self.set_style(s, ranges)
         f = StatusFlags()
         f.byte_style_changed = True
@@ -748,6 +750,44 @@ class FindPrevAction(EditorAction):
         event.task.show_minibuffer(NextPrevTextMinibuffer(e, FindAllCommand, FindNextCommand, FindPrevCommand, prev_match=True, initial=e.last_search_settings["find"]))
 
 
+class FindInAllSegmentsAction(EditorAction):
+    """Search for a byte pattern in every segment of the document, including
+    user segments, and show a list of the matches. Choosing a match moves to
+    it in its segment.
+
+    Bytes that are part of more than one segment are only listed once, in the
+    smallest segment that contains them.
+    """
+    name = 'Find in All Segments...'
+    accelerator = 'Shift+Ctrl+F'
+    tooltip = 'Find bytes in every segment of the document'
+
+    def perform(self, event):
+        e = self.active_editor
+        text = prompt_for_string(e.window.control, "Enter hex bytes to find in all segments:\n(?? matches any byte, (a9|ad) matches either)", "Find in All Segments", e.last_search_settings["find"])
+        if not text:
+            return
+        try:
+            pattern = BytePattern.parse(text)
+        except ValueError, error:
+            e.task.status_bar.error = str(error)
+            return
+        e.last_search_settings["find"] = text
+        segments = e.document.segments
+        results = find_in_segments(segments, pattern)
+        if not results:
+            e.task.status_bar.message = "%s not found in any segment" % text
+            return
+        dlg = SearchResultsDialog(e.window.control, "Find in All Segments", segments, results, text)
+        if dlg.ShowModal() == wx.ID_OK:
+            selected = dlg.get_selected()
+            if selected is not None:
+                segment_num, index = selected
+                e.view_segment_number(segment_num)
+                e.index_clicked(index, 0, None)
+        dlg.Destroy()
+
+
 class FindAlgorithmAction(EditorAction):
     name = 'Find Using Expression'
     accelerator = 'Alt+Ctrl+F'
@@ -755,7 +795,7 @@ class FindAlgorithmAction(EditorAction):
 
     def perform(self, event):
         e = self.active_editor
-        event.task.show_minibuffer(NextPrevTextMinibuffer(e, FindAlgorithmCommand, FindNextCommand, FindPrevCommand, initial=e.last_search_settings["algorithm"], help_text=" Use variable 'a' for address, 'b' for byte values. (Mouse over for examples)", help_tip="Examples:\n\nAll bytes after the 10th byte: a > 10\n\nBytes with values > 128 but only after the 10th byte: (b > 128) and (a > 10)\n\n"))
+        event.task.show_minibuffer(NextPrevTextMinibuffer(e, FindAlgorithmCommand, FindNextCommand, FindPrevCommand, initial=e.last_search_settings["algorithm"], help_text=" Use variable 'a' for address, 'b' for byte values, 'w' for words, 's' for style; b[-1] and b[+1] for neighbors. (Mouse over for examples)", help_tip="Examples:\n\nAll bytes after the 10th byte: a > 10\n\nBytes with values > 128 but only after the 10th byte: (b > 128) and (a > 10)\n\nLDA absolute from hardware registers: b == $ad && w[+1] >= $d000\n\n"))
 
 
 class FindToSelectionAction(EditorAction):
@@ -884,7 +924,7 @@ class ListDiffAction(EditorAction):
     def perform(self, event):
         e = self.active_editor
         s = e.segment
-        ranges = s.get_style_ranges(diff=True)
+        ranges = get_style_ranges(s, diff=True)
         d = e.machine.get_disassembler(e.task.hex_grid_lower_case, e.task.assembly_lower_case)
         d.set_pc(s, s.start_addr)
         lines = []
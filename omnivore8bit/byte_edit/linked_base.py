@@ -16,7 +16,8 @@ from pyface.key_pressed_event import KeyPressedEvent
 from omnivore.framework.editor import FrameworkEditor
 from omnivore.framework.caret import CaretHandler
 from omnivore.utils.command import DisplayFlags
-from omnivore8bit.utils.segmentutil import SegmentData, DefaultSegment
+from omnivore8bit.utils.segmentutil import SegmentData, DefaultSegment, get_style_ranges
+from omnivore8bit.arch.disasm_batch import BatchDisassemblyRequest
 from . import actions as ba
 from . import commands as bc
 from ..jumpman import playfield as jp
@@ -63,6 +64,15 @@ class LinkedBase(CaretHandler):
 
     cached_preferences = Any(transient=True)
 
+    # disassembly of every segment of the document, keyed on the hash of the
+    # segment contents and disassembler settings
+    disassembly_results = Any(transient=True)
+
+    batch_disassembly_request = Any(None, transient=True)
+
+    # document and data version of the last batch disassembly
+    batch_disassembly_version = Any(None, transient=True)
+
     #### Events
 
     recalc_event = Event
@@ -73,6 +83,9 @@ class LinkedBase(CaretHandler):
 
     segment_selected_event = Event
 
+    # rows of the disassembly of the segment have changed
+    disassembly_changed_event = Event
+
     ##### Jumpman-specific traits
 
     jumpman_trigger_selected_event = Event
@@ -98,6 +111,9 @@ class LinkedBase(CaretHandler):
     def _segment_view_params_default(self):
         return {}
 
+    def _disassembly_results_default(self):
+        return {}
+
     def _jumpman_playfield_model_default(self):
         return jp.JumpmanPlayfieldModel(self)
 
@@ -322,7 +338,7 @@ class LinkedBase(CaretHandler):
 
         self.restore_segment_view_params(s)
         if False:  # select same bytes in new segment, if possible
-            self.selected_ranges = s.get_style_ranges(selected=True)
+            self.selected_ranges = get_style_ranges(s, selected=True)
             if self.selected_ranges:
                 # Arbitrarily puth the anchor on the last selected range
                 last = self.selected_ranges[-1]
@@ -333,17 +349,17 @@ class LinkedBase(CaretHandler):
 
     def convert_ranges(self, from_style, to_style):
         s = self.segment
-        ranges = s.get_style_ranges(**from_style)
+        ranges = get_style_ranges(s, **from_style)
         s.clear_style_bits(**from_style)
         s.clear_style_bits(**to_style)
         s.set_style_ranges(ranges, **to_style)
-        self.selected_ranges = s.get_style_ranges(selected=True)
+        self.selected_ranges = get_style_ranges(s, selected=True)
         self.document.change_count += 1
 
     def get_selected_index_metadata(self, indexes):
         """Return serializable string containing style information"""
         style = self.segment.get_style_at_indexes(indexes)
-        r_orig = self.segment.get_style_ranges(comment=True)
+        r_orig = get_style_ranges(self.segment, comment=True)
         comments = self.segment.get_comments_at_indexes(indexes)
         log.debug("after get_comments_at_indexes: %s" % str(comments))
         metadata = [style.tolist(), comments[0].tolist(), comments[1]]
@@ -364,7 +380,7 @@ class LinkedBase(CaretHandler):
         # Get the selected ranges directly from the segment style data, because
         # the selected ranges in the caret list can be out of order or
         # overlapping
-        ranges = s.get_style_ranges(selected=True)
+        ranges = get_style_ranges(s, selected=True)
         if len(ranges) == 1:
             seg_start, seg_end = ranges[0]
             if size < 0:
@@ -463,6 +479,22 @@ class LinkedBase(CaretHandler):
                 goto_actions.append(other_segment_actions)
         return goto_actions
 
+    def get_goto_actions_referrers(self, index, referrers):
+        """Add sub-menu to popup list for the rows of the disassembly that
+        refer to the address at index. referrers is the list of (index,
+        description) of each referring row.
+        """
+        goto_actions = []
+        if referrers:
+            addr = self.segment.start_addr + index
+            referrer_actions = ["References to $%04x..." % addr]
+            for ref_index, desc in referrers:
+                msg = "$%04x %s" % (self.segment.start_addr + ref_index, desc)
+                action = ba.GotoIndexAction(name=msg, enabled=True, segment_num=-1, addr_index=ref_index, task=self.editor.task, active_editor=self)
+                referrer_actions.append(action)
+            goto_actions.append(referrer_actions)
+        return goto_actions
+
     def get_goto_actions_same_byte(self, index):
         """Add sub-menu to popup list for for segments that have the same raw
         index (index into the base array) as the index into the current segment
@@ -483,6 +515,41 @@ class LinkedBase(CaretHandler):
                 goto_actions.append(other_segment_actions)
         return goto_actions
 
+    def get_batch_disassembly_request(self, create_disassembler, processes=None):
+        """Return a request to disassemble all the segments of the document
+        in a pool of worker processes, so viewing another segment doesn't
+        need to wait for its disassembly, or None if one is already running
+        or has already been run for the current data of the document.
+
+        create_disassembler is called with each segment to get a disassembler
+        with the current settings. The request is processed by a
+        DisassemblyWorker and passed to set_batch_disassembly_results.
+        Segments that already have results, either from an earlier batch or
+        in the disassembly cache, are skipped.
+        """
+        version = (self.document, self.document.data_version)
+        if self.batch_disassembly_request is not None or self.batch_disassembly_version == version:
+            return None
+        items = [(segment, create_disassembler(segment)) for segment in self.document.segments]
+        request = BatchDisassemblyRequest(items, dict(self.disassembly_results), processes)
+        self.batch_disassembly_request = request
+        self.batch_disassembly_version = version
+        return request
+
+    def set_batch_disassembly_results(self, request):
+        if request is not self.batch_disassembly_request:
+            return
+        self.batch_disassembly_request = None
+        if request.error is not None:
+            log.error("Batch disassembly failed: %s" % request.error)
+            self.batch_disassembly_version = None
+            return
+        # disassemblers keep a reference to the dict, so it's updated in
+        # place
+        results = self.disassembly_results
+        results.clear()
+        results.update(request.results)
+
     def popup_context_menu_from_actions(self, *args, **kwargs):
         self.editor.popup_context_menu_from_actions(*args, **kwargs)
 
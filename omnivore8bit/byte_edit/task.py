@@ -22,6 +22,7 @@ from ..emulators import actions as ea
 import omnivore8bit.arch.fonts as fonts
 import omnivore8bit.arch.colors as colors
 import omnivore8bit.arch.machine as machine
+from omnivore8bit.arch.overview import MemoryMapPyramid
 from omnivore8bit.utils.segmentutil import iter_known_segment_parsers
 
 
@@ -366,6 +367,7 @@ class ByteEditTask(FrameworkTask):
         return [
             ba.FindAction(),
             ba.FindAlgorithmAction(),
+            ba.FindInAllSegmentsAction(),
             ba.FindNextAction(),
             # SMenu(
             #     FindCodeAction(),
@@ -517,6 +519,13 @@ class ByteEditTask(FrameworkTask):
                     va.ViewerWidthAction(),
                     va.ViewerZoomAction(),
                     id="a1", separator=True),
+                Group(
+                    va.MemoryMapOverviewAction(),
+                    va.MemoryMapFitOverviewAction(),
+                    id="a2", separator=True),
+                Group(
+                    *[va.MemoryMapSummaryAction(summary=s) for s in MemoryMapPyramid.summary_types],
+                    id="a3", separator=True),
                 id='mm8', separator=False, name="Viewer Size"),
             ]
 
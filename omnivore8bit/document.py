@@ -13,6 +13,8 @@ from traits.api import Trait, Any, List, Event, Dict, Property, Bool
 
 from atrcopy import SegmentData, DefaultSegment, DefaultSegmentParser, InvalidSegmentParser, iter_parsers
 
+from omnivore8bit.utils.searchutil import PreviousMatches
+
 import logging
 log = logging.getLogger(__name__)
 
@@ -42,6 +44,10 @@ class SegmentedDocument(BaseDocument):
     # viewers, really.
     priority_level_refresh_event = Event
 
+    # matches of the last pattern of each searcher, used to refine the search
+    # as the pattern is typed
+    previous_matches = Any(transient=True)
+
     #### trait default values
 
     def _style_default(self):
@@ -54,6 +60,9 @@ class SegmentedDocument(BaseDocument):
     def _program_memory_map_default(self):
         return dict()
 
+    def _previous_matches_default(self):
+        return PreviousMatches()
+
     #### trait property getters
 
     def _get_can_resize(self):
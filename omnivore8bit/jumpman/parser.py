@@ -21,6 +21,30 @@ def is_valid_level_segment(segment):
     return False
 
 
+def get_level_addrs(segment):
+    """Return the addresses of the level definition table and the harvest
+    table, raising RuntimeError if either is outside of the segment
+    """
+    start = segment.start_addr
+    level_addr = segment[0x37] + segment[0x38]*256
+    harvest_addr = segment[0x4e] + segment[0x4f]*256
+    log.debug("level def table: %x, harvest table: %x" % (level_addr, harvest_addr))
+    last = segment.start_addr + len(segment)
+    if level_addr > start and harvest_addr > start and level_addr < last and harvest_addr < last:
+        return level_addr, harvest_addr
+    raise RuntimeError
+
+
+def get_level_colors(segment):
+    colors = segment[0x2a:0x33].copy()
+    # on some levels, the bombs are set to color 0 because they are
+    # cycled to produce a glowing effect, but that's not visible here
+    # so we force it to be bright white
+    fg = colors[4:8]
+    fg[fg == 0] = 15
+    return list(colors)
+
+
 def is_bad_harvest_position(x, y, hx, hy):
     hx = hx & 0x1f
     hy = (hy & 0x1f) / 2
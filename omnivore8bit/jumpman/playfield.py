@@ -90,28 +90,15 @@ class JumpmanPlayfieldModel(object):
 
     def calc_level_colors(self):
         if self.valid_level:
-            colors = self.segment[0x2a:0x33].copy()
-            # on some levels, the bombs are set to color 0 because they are
-            # cycled to produce a glowing effect, but that's not visible here
-            # so we force it to be bright white
-            fg = colors[4:8]
-            fg[fg == 0] = 15
-        else:
-            colors = powerup_colors()
-        return list(colors)
+            return ju.get_level_colors(self.segment)
+        return list(powerup_colors())
 
     def get_level_addrs(self):
         if not self.possible_jumpman_segment:
             raise RuntimeError
         source = self.segment
-        start = source.start_addr
-        level_addr = source[0x37] + source[0x38]*256
-        harvest_addr = source[0x4e] + source[0x4f]*256
-        log.debug("level def table: %x, harvest table: %x" % (level_addr, harvest_addr))
-        last = source.start_addr + len(source)
-        if level_addr > start and harvest_addr > start and level_addr < last and harvest_addr < last:
-            return source, level_addr, harvest_addr
-        raise RuntimeError
+        level_addr, harvest_addr = ju.get_level_addrs(source)
+        return source, level_addr, harvest_addr
 
     def set_trigger_root(self, root):
         if root is not None:
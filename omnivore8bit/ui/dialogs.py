@@ -236,6 +236,81 @@ class SegmentInterleaveDialog(SegmentOrderDialog):
         return self.get_length() > 0 and self.get_interleave() > 0
 
 
+class SearchResultsList(wx.ListCtrl):
+    """Virtual list of (segment number, index) search results, so only the
+    visible rows are ever formatted no matter how many matches there are
+    """
+    def __init__(self, parent, segments, results, size=(-1, -1)):
+        wx.ListCtrl.__init__(self, parent, size=size, style=wx.LC_REPORT|wx.LC_VIRTUAL|wx.LC_SINGLE_SEL)
+        self.segments = segments
+        self.results = results
+        for i, (title, width) in enumerate([("Segment", 200), ("Address", 80), ("Offset", 80)]):
+            self.InsertColumn(i, title, width=width)
+        self.SetItemCount(len(results))
+
+    def OnGetItemText(self, item, col):
+        segment_num, index = self.results[item]
+        s = self.segments[segment_num]
+        if col == 0:
+            return str(s)
+        elif col == 1:
+            return s.label(index)
+        return "%x" % index
+
+
+class SearchResultsDialog(wx.Dialog):
+    border = 5
+
+    def __init__(self, parent, title, segments, results, search_text=""):
+        wx.Dialog.__init__(self, parent, -1, title, style=wx.DEFAULT_DIALOG_STYLE|wx.RESIZE_BORDER)
+
+        sizer = wx.BoxSizer(wx.VERTICAL)
+        self.SetSizer(sizer)
+
+        t = wx.StaticText(self, -1, "%d matches of %s in %d segments" % (len(results), search_text, len(set(r[0] for r in results))))
+        sizer.Add(t, 0, wx.ALL|wx.EXPAND, self.border)
+
+        self.list = SearchResultsList(self, segments, results, size=(400, 300))
+        sizer.Add(self.list, 1, wx.ALL|wx.EXPAND, self.border)
+
+        btnsizer = wx.StdDialogButtonSizer()
+        self.ok_btn = wx.Button(self, wx.ID_OK)
+        self.ok_btn.SetDefault()
+        btnsizer.AddButton(self.ok_btn)
+        btn = wx.Button(self, wx.ID_CANCEL)
+        btnsizer.AddButton(btn)
+        btnsizer.Realize()
+        sizer.Add(btnsizer, 0, wx.ALL|wx.EXPAND, self.border)
+
+        self.list.Bind(wx.EVT_LIST_ITEM_SELECTED, self.on_selection_changed)
+        self.list.Bind(wx.EVT_LIST_ITEM_ACTIVATED, self.on_activated)
+        if results:
+            self.list.Select(0)
+            self.list.Focus(0)
+
+        sizer.Fit(self)
+        self.check_enable()
+
+    def on_selection_changed(self, evt):
+        self.check_enable()
+        evt.Skip()
+
+    def on_activated(self, evt):
+        self.EndModal(wx.ID_OK)
+
+    def check_enable(self):
+        self.ok_btn.Enable(self.list.GetFirstSelected() >= 0)
+
+    def get_selected(self):
+        """Return the (segment number, index) of the selected result, or
+        None if nothing is selected
+        """
+        item = self.list.GetFirstSelected()
+        if item < 0:
+            return None
+        return self.list.results[item]
+
+
 if __name__ == "__main__":
     app = wx.PySimpleApp()
 
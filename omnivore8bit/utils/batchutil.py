@@ -0,0 +1,60 @@
+"""Run jobs in a pool of worker processes for the command line utilities
+
+The utilities that work on many files (renderutil, listingutil, scanutil)
+and the batch disassembly of the segments of a document all call a function
+for each job, where a job is a tuple of the positional arguments for the
+function. Errors are returned instead of raised so one bad file or segment
+doesn't stop the whole batch.
+"""
+import sys
+import multiprocessing
+
+import logging
+log = logging.getLogger(__name__)
+
+
+def run_job(func, args, kwargs):
+    """Call func with the job's arguments, returning a tuple of the first
+    argument, the result and the error message
+    """
+    # some parsers print messages, which would be mixed in with the output
+    # of a utility that writes to standard output
+    stdout = sys.stdout
+    sys.stdout = sys.stderr
+    try:
+        result = func(*args, **kwargs)
+    except Exception, e:
+        return args[0], None, "%s: %s" % (e.__class__.__name__, e)
+    finally:
+        sys.stdout = stdout
+    return args[0], result, None
+
+
+def pool_job(job):
+    # Pool.imap only passes a single argument
+    return run_job(*job)
+
+
+def run_jobs(func, jobs, processes=None, chunksize=1, initializer=None, initargs=(), **kwargs):
+    """Call func(*args, **kwargs) for each tuple args in jobs using a pool
+    of worker processes, yielding an (args[0], result, error) tuple for each
+    job as it completes.
+
+    func must be a module level function so it can be sent to the worker
+    processes. If processes is 1, or there is only one job, the jobs are run
+    in this process and the initializer isn't used. chunksize is passed to
+    Pool.imap_unordered; small chunks keep the workers busy without holding
+    back the results of jobs that have already finished.
+    """
+    jobs = list(jobs)
+    if processes == 1 or len(jobs) < 2:
+        for args in jobs:
+            yield run_job(func, args, kwargs)
+        return
+    pool = multiprocessing.Pool(processes, initializer, initargs)
+    try:
+        for result in pool.imap_unordered(pool_job, ((func, args, kwargs) for args in jobs), chunksize):
+            yield result
+    finally:
+        pool.close()
+        pool.join()
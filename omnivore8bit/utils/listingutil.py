@@ -0,0 +1,155 @@
+"""Create assembler listings of disk images and binaries without a GUI
+
+The listings are written by the streaming ListingWriter, so they never have
+to fit in memory as a list of lines. It can be used as a library through
+list_segment and list_file, or from the command line to create listings of
+every segment of many files at once using a pool of worker processes:
+
+    python -m omnivore8bit.utils.listingutil -a cc65 -m "Atari 400/800" -o src *.atr
+"""
+import os
+import sys
+import argparse
+
+from omnivore.utils.runtime import get_all_subclasses
+
+from ..arch import disasm
+from ..arch import memory_map
+from .renderutil import get_segments, find_segment
+from .batchutil import run_jobs
+
+import logging
+log = logging.getLogger(__name__)
+
+
+def iter_disassemblers():
+    yield disasm.Basic6502Disassembler
+    for cls in get_all_subclasses(disasm.BaseDisassembler):
+        if cls is not disasm.Basic6502Disassembler:
+            yield cls
+
+
+def iter_memory_maps():
+    yield memory_map.EmptyMemoryMap
+    for cls in get_all_subclasses(memory_map.EmptyMemoryMap):
+        yield cls
+
+
+def find_by_name(classes, name, kind):
+    """Return the class whose class name or display name matches name,
+    ignoring case
+    """
+    name = name.lower()
+    for cls in classes:
+        if cls.__name__.lower() == name or cls.name.lower() == name:
+            return cls
+    raise KeyError("Unknown %s %s" % (kind, name))
+
+
+def get_assembler(name):
+    name = name.lower()
+    for asm in disasm.known_assemblers:
+        if asm['name'].lower() == name:
+            return dict(asm)
+    raise KeyError("Unknown assembler %s" % name)
+
+
+def get_disassembler(cpu="6502", assembler="MAC/65", mmap=None, hex_lower=True, mnemonic_lower=False):
+    """Return a disassembler configured like the one used by the disassembly
+    viewer
+    """
+    cls = find_by_name(iter_disassemblers(), cpu, "disassembler")
+    if mmap is not None:
+        mmap = find_by_name(iter_memory_maps(), mmap, "memory map")()
+    d = cls(get_assembler(assembler), mmap, hex_lower, mnemonic_lower)
+    for i, name in disasm.iter_disasm_styles():
+        d.add_chunk_processor(name, i)
+    return d
+
+
+def list_segment(segment, fh, lst=False, **kwargs):
+    """Write the listing of the segment to the file handle, as source code or
+    as an ATasm style .lst listing with line numbers and bytes
+    """
+    d = get_disassembler(**kwargs)
+    d.disassemble_segment(segment)
+    if lst:
+        d.write_atasm_lst_text(fh)
+    else:
+        d.write_disassembled_text(fh)
+
+
+def list_file(filename, output_dir, segment_id=None, lst=False, **kwargs):
+    """Write listings of a file, one for each segment unless a segment is
+    specified
+
+    Returns the names of the listing files.
+    """
+    segments = get_segments(filename)
+    if segment_id is not None:
+        segment = find_segment(segments, segment_id)
+        numbered = [(segments.index(segment), segment)]
+    else:
+        numbered = list(enumerate(segments))
+    ext = ".lst" if lst else ".s"
+    outputs = []
+    for i, segment in numbered:
+        if len(segment) == 0:
+            continue
+        output = os.path.join(output_dir, "%s.%d%s" % (os.path.basename(filename), i, ext))
+        with open(output, "wb") as fh:
+            list_segment(segment, fh, lst, **kwargs)
+        outputs.append(output)
+    return outputs
+
+
+def list_files(filenames, output_dir, processes=None, **kwargs):
+    """Create listings of many files using a pool of worker processes,
+    yielding a (filename, outputs, error) tuple for each file as it
+    completes.
+    """
+    jobs = [(filename, output_dir) for filename in filenames]
+    return run_jobs(list_file, jobs, processes, **kwargs)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Create assembler listings of 8-bit disk images and binaries without a GUI")
+    parser.add_argument("filenames", nargs="*", help="files to disassemble")
+    parser.add_argument("-s", "--segment", default=None, help="segment number or name (default: every segment)")
+    parser.add_argument("-c", "--cpu", default="6502", help="disassembler class or display name (default: %(default)s)")
+    parser.add_argument("-a", "--assembler", default="MAC/65", help="assembler syntax (default: %(default)s)")
+    parser.add_argument("-m", "--memory-map", default=None, help="memory map class or display name used for labels")
+    parser.add_argument("--hex-upper", action="store_true", default=False, help="use upper case hex digits")
+    parser.add_argument("--mnemonic-lower", action="store_true", default=False, help="use lower case mnemonics")
+    parser.add_argument("--lst", action="store_true", default=False, help="create ATasm style .lst listings with line numbers and bytes instead of source code")
+    parser.add_argument("-o", "--output-dir", default=".", help="directory for the listings (default: current directory)")
+    parser.add_argument("-j", "--jobs", type=int, default=None, help="number of worker processes (default: number of CPUs)")
+    parser.add_argument("-l", "--list", action="store_true", default=False, help="list the available disassemblers, assemblers and memory maps")
+    options = parser.parse_args(argv)
+
+    if options.list:
+        for cls in iter_disassemblers():
+            print("cpu: %-32s %s" % (cls.__name__, cls.name))
+        for asm in disasm.known_assemblers:
+            print("assembler: %s" % asm['name'])
+        for cls in iter_memory_maps():
+            print("memory map: %-32s %s" % (cls.__name__, cls.name))
+        return 0
+
+    if not os.path.exists(options.output_dir):
+        os.makedirs(options.output_dir)
+
+    errors = 0
+    results = list_files(options.filenames, options.output_dir, options.jobs, segment_id=options.segment, lst=options.lst, cpu=options.cpu, assembler=options.assembler, mmap=options.memory_map, hex_lower=not options.hex_upper, mnemonic_lower=options.mnemonic_lower)
+    for filename, outputs, error in results:
+        if error is not None:
+            errors += 1
+            sys.stderr.write("%s: %s\n" % (filename, error))
+        else:
+            log.info("%s -> %s" % (filename, ", ".join(outputs)))
+    return 1 if errors else 0
+
+
+if __name__ == "__main__":
+    logging.basicConfig(level=logging.WARNING)
+    sys.exit(main())
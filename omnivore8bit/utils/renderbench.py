@@ -0,0 +1,198 @@
+"""Benchmark and regression check of the bitmap and font renderers
+
+Every renderer class is run against synthetic segments of increasing size,
+at several zoom factors and with several densities of style bits (selection,
+comments, search matches and data regions), and the throughput is reported
+in megapixels of output per second. Uses the headless renderer interface, so
+it doesn't need a display:
+
+    python -m omnivore8bit.utils.renderbench --save baseline.json
+    python -m omnivore8bit.utils.renderbench --compare baseline.json
+
+Comparing to a stored baseline exits with a failure status if any case is
+slower than the baseline by more than the threshold. Baselines are only
+meaningful on the machine that created them.
+"""
+import sys
+import json
+import argparse
+import timeit
+
+import numpy as np
+
+from atrcopy import selected_bit_mask, comment_bit_mask, match_bit_mask
+
+from ..arch import antic_renderers as ar
+from . import renderutil as ru
+
+import logging
+log = logging.getLogger(__name__)
+
+
+default_sizes = [0x1000, 0x10000, 0x100000]
+
+default_zooms = [1, 2, 4]
+
+default_densities = [0.0, 0.1, 0.5]
+
+style_bits = np.asarray([selected_bit_mask, comment_bit_mask, match_bit_mask, 1], dtype=np.uint8)
+
+
+class BenchmarkCase(object):
+    def __init__(self, renderer, size, zoom, density, bytes_per_row=40):
+        self.renderer = renderer
+        self.size = size
+        self.zoom = zoom
+        self.density = density
+        self.bytes_per_row = bytes_per_row
+
+    @property
+    def key(self):
+        return "%s/%d/z%d/s%d" % (self.renderer.__class__.__name__, self.size, self.zoom, int(self.density * 100))
+
+    def get_data(self, seed=1234):
+        """Random bytes with the requested fraction of bytes styled, using
+        one of the style bits that have a visible effect
+        """
+        rng = np.random.RandomState(seed)
+        data = rng.randint(0, 256, self.size).astype(np.uint8)
+        style = np.zeros(self.size, dtype=np.uint8)
+        if self.density > 0:
+            styled = rng.random_sample(self.size) < self.density
+            style[styled] = style_bits[rng.randint(0, len(style_bits), np.count_nonzero(styled))]
+        return data, style
+
+    def run(self, viewer, repeat=3):
+        """Return the best time and the number of output pixels
+        """
+        data, style = self.get_data()
+        best = None
+        for i in range(repeat):
+            t0 = timeit.default_timer()
+            array = ru.render_bytes(viewer, self.renderer, data, style, self.bytes_per_row, self.zoom)
+            elapsed = timeit.default_timer() - t0
+            if best is None or elapsed < best:
+                best = elapsed
+        return best, array.shape[0] * array.shape[1]
+
+
+def iter_cases(renderers=None, sizes=None, zooms=None, densities=None):
+    if renderers is None:
+        renderers = sorted(ru.iter_renderers(), key=lambda c: c.__name__)
+    for cls in renderers:
+        r = cls()
+        bytes_per_row = 256 if isinstance(r, ar.BytePerPixelMemoryMap) else 40
+        for size in sizes or default_sizes:
+            for zoom in zooms or default_zooms:
+                for density in densities if densities is not None else default_densities:
+                    yield BenchmarkCase(r, size, zoom, density, bytes_per_row)
+
+
+def run_benchmarks(cases, repeat=3, viewer=None, report=None):
+    """Run each case and return a dict of megapixels per second keyed on the
+    case name, and a dict of error messages of the cases that failed.
+
+    report, if given, is called with the case, its result and the error
+    message (or None) as each case finishes.
+    """
+    if viewer is None:
+        viewer = ru.HeadlessViewer()
+    results = {}
+    errors = {}
+    for case in cases:
+        try:
+            elapsed, pixels = case.run(viewer, repeat)
+        except Exception, e:
+            # some renderers only handle specific data sizes; report them
+            # but keep going
+            mps = None
+            errors[case.key] = "%s: %s" % (e.__class__.__name__, e)
+        else:
+            mps = pixels / max(elapsed, 1e-9) / 1e6
+            results[case.key] = mps
+        if report is not None:
+            report(case, mps, errors.get(case.key))
+    return results, errors
+
+
+def compare_results(results, baseline, threshold=0.2, errors={}):
+    """Return the list of (key, baseline, current) of the cases that are
+    slower than the baseline by more than the threshold fraction. A case that
+    is in the baseline but fails now is a regression with a current value of
+    None; other cases missing from either set of results are ignored.
+    """
+    regressions = []
+    for key in sorted(baseline):
+        if key in results:
+            if results[key] < baseline[key] * (1.0 - threshold):
+                regressions.append((key, baseline[key], results[key]))
+        elif key in errors:
+            regressions.append((key, baseline[key], None))
+    return regressions
+
+
+def save_results(filename, results, speedups=True):
+    with open(filename, "w") as fh:
+        json.dump({"speedups": speedups, "results": results}, fh, indent=1, sort_keys=True)
+
+
+def load_results(filename):
+    with open(filename, "r") as fh:
+        return json.load(fh)["results"]
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Benchmark the bitmap and font renderers")
+    parser.add_argument("-r", "--renderer", action="append", default=[], help="renderer class or display name to benchmark; may be repeated (default: all)")
+    parser.add_argument("--sizes", default=None, help="comma separated segment sizes in bytes (default: %s)" % ",".join(str(s) for s in default_sizes))
+    parser.add_argument("--zooms", default=None, help="comma separated zoom factors (default: %s)" % ",".join(str(z) for z in default_zooms))
+    parser.add_argument("--densities", default=None, help="comma separated fractions of bytes with style bits set (default: %s)" % ",".join(str(d) for d in default_densities))
+    parser.add_argument("-n", "--repeat", type=int, default=3, help="number of runs of each case; the fastest is used (default: %(default)s)")
+    parser.add_argument("--no-speedups", action="store_true", default=False, help="use the numpy versions instead of the compiled antic_speedups")
+    parser.add_argument("--save", default=None, help="save results as a baseline in this JSON file")
+    parser.add_argument("--compare", default=None, help="compare to the baseline in this JSON file and fail on regressions")
+    parser.add_argument("-t", "--threshold", type=float, default=0.2, help="allowed slowdown as a fraction of the baseline (default: %(default)s)")
+    options = parser.parse_args(argv)
+
+    renderers = None
+    if options.renderer:
+        renderers = [ru.get_renderer(name).__class__ for name in options.renderer]
+    sizes = [int(s, 0) for s in options.sizes.split(",")] if options.sizes else None
+    zooms = [int(z) for z in options.zooms.split(",")] if options.zooms else None
+    densities = [float(d) for d in options.densities.split(",")] if options.densities else None
+
+    baseline = load_results(options.compare) if options.compare else {}
+
+    def report(case, mps, error):
+        if error is not None:
+            print("%-56s     failed: %s" % (case.key, error))
+        else:
+            if case.key in baseline:
+                change = "%+6.1f%%" % ((mps / baseline[case.key] - 1.0) * 100.0)
+            else:
+                change = ""
+            print("%-56s %10.2f MP/s %s" % (case.key, mps, change))
+        sys.stdout.flush()
+
+    if options.no_speedups:
+        ar.speedups = None
+    print("antic_speedups: %s" % ("not used" if ar.speedups is None else "used"))
+    results, errors = run_benchmarks(iter_cases(renderers, sizes, zooms, densities), options.repeat, report=report)
+
+    if options.save:
+        save_results(options.save, results, ar.speedups is not None)
+    if options.compare:
+        regressions = compare_results(results, baseline, options.threshold, errors)
+        for key, old, new in regressions:
+            if new is None:
+                print("REGRESSION %s: failed, baseline %.2f MP/s" % (key, old))
+            else:
+                print("REGRESSION %s: %.2f MP/s, baseline %.2f MP/s" % (key, new, old))
+        if regressions:
+            return 1
+    return 0
+
+
+if __name__ == "__main__":
+    logging.basicConfig(level=logging.WARNING)
+    sys.exit(main())
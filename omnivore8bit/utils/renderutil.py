@@ -0,0 +1,306 @@
+"""Render segments to images without a GUI
+
+The renderers only need a few attributes of the segment viewer, its machine
+and the preferences, so this provides stand-ins for those that don't depend
+on wx or traits. It can be used as a library through render_segment and
+render_file, or from the command line to create PNG images of many files at
+once using a pool of worker processes:
+
+    python -m omnivore8bit.utils.renderutil -r ModeD -w 40 -o thumbs *.atr
+"""
+import os
+import sys
+import argparse
+
+import numpy as np
+
+from atrcopy import SegmentData, DefaultSegment, iter_parsers, UnsupportedDiskImage
+
+from omnivore.utils.nputil import intscale
+from omnivore.utils.pngutil import save_png
+from omnivore.utils.runtime import get_all_subclasses
+
+from ..arch import antic_renderers as ar
+from ..arch import colors
+from ..arch import fonts
+from ..jumpman import parser as ju
+from .batchutil import run_jobs
+
+import logging
+log = logging.getLogger(__name__)
+
+
+class HeadlessColor(tuple):
+    """Stand-in for the wx.Colour values stored in the preferences
+    """
+    def Get(self, includeAlpha=True):
+        if includeAlpha:
+            return tuple(self) + (255,)
+        return tuple(self)
+
+
+class HeadlessPreferences(object):
+    """Same default colors as the byte editor preferences
+    """
+    background_color = HeadlessColor((255, 255, 255))
+
+    highlight_background_color = HeadlessColor((100, 200, 230))
+
+    data_background_color = HeadlessColor((224, 224, 224))
+
+    empty_background_color = HeadlessColor((240, 240, 240))
+
+    match_background_color = HeadlessColor((255, 255, 180))
+
+    comment_background_color = HeadlessColor((255, 180, 200))
+
+
+class HeadlessMachine(object):
+    """The subset of the Machine color and font attributes used by the
+    renderers
+    """
+    def __init__(self, antic_color_registers=None, color_standard=0, font_data=None, font_mapping=None):
+        self.color_standard = color_standard
+        self.antic_font_data = font_data if font_data is not None else fonts.A8DefaultFont
+        self.font_mapping = font_mapping if font_mapping is not None else ar.ATASCIIFontMapping()
+        self.update_colors(antic_color_registers if antic_color_registers is not None else colors.powerup_colors())
+
+    def update_colors(self, c):
+        baseline = list(colors.powerup_colors())
+        if len(c) == 5:
+            baseline[4:9] = [int(i) for i in c]
+        else:
+            baseline[0:len(c)] = [int(i) for i in c]
+        self.antic_color_registers = baseline
+        self.color_registers = self.get_color_registers()
+
+    def get_color_registers(self, antic_color_registers=None):
+        if antic_color_registers is None:
+            antic_color_registers = self.antic_color_registers
+        return colors.get_color_registers(antic_color_registers, self.get_color_converter())
+
+    def get_color_converter(self):
+        if self.color_standard == 0:
+            return colors.gtia_ntsc_to_rgb
+        return colors.gtia_pal_to_rgb
+
+
+class HeadlessViewer(object):
+    """The segment viewer interface used by the renderers
+    """
+    def __init__(self, machine=None, preferences=None):
+        self.machine = machine if machine is not None else HeadlessMachine()
+        self.preferences = preferences if preferences is not None else HeadlessPreferences()
+
+    def get_antic_font(self, font_renderer, reverse=False):
+        return fonts.AnticFont(self, self.machine.antic_font_data, font_renderer, self.machine.antic_color_registers[4:9], reverse)
+
+
+##### Renderer lookup
+
+def iter_renderers():
+    for cls in get_all_subclasses(ar.BaseRenderer):
+        if cls.__name__.startswith("Base") or cls.__name__.endswith("Base"):
+            # intermediate classes that aren't complete renderers
+            continue
+        yield cls
+
+
+def get_renderer(name):
+    """Return an instance of the renderer whose class name or display name
+    matches name, ignoring case
+    """
+    name = name.lower()
+    for cls in iter_renderers():
+        if cls.__name__.lower() == name or cls.name.lower() == name:
+            return cls()
+    raise KeyError("Unknown renderer %s" % name)
+
+
+def is_font_renderer(renderer):
+    return hasattr(renderer, "char_bit_width")
+
+
+def get_font(name):
+    """Return builtin font data by name or uuid
+    """
+    name = name.lower()
+    for font in fonts.builtin_font_data.values():
+        if font['uuid'] == name or font['name'].lower() == name:
+            return font
+    raise KeyError("Unknown font %s" % name)
+
+
+##### Segments
+
+def get_segments(filename):
+    with open(filename, "rb") as fh:
+        rawdata = SegmentData(np.fromstring(fh.read(), dtype=np.uint8))
+    try:
+        mime, parser = iter_parsers(rawdata)
+    except UnsupportedDiskImage:
+        parser = None
+    if parser is None:
+        return [DefaultSegment(rawdata, 0, name=os.path.basename(filename))]
+    return parser.segments
+
+
+def find_segment(segments, segment_id=None):
+    """Find a segment by index or by name. With no segment_id, the segment
+    containing the whole file is used.
+    """
+    if segment_id is None:
+        return segments[0]
+    try:
+        return segments[int(segment_id)]
+    except ValueError:
+        pass
+    for segment in segments:
+        if segment.name == segment_id:
+            return segment
+    raise KeyError("No segment named %s" % segment_id)
+
+
+def get_jumpman_playfield(segment, machine):
+    """Draw the Jumpman level in the segment into a new playfield and set the
+    machine colors to the level colors
+    """
+    if not ju.is_valid_level_segment(segment):
+        raise RuntimeError("%s is not a Jumpman level" % segment.name)
+    level_addr, harvest_addr = ju.get_level_addrs(segment)
+    builder = ju.JumpmanLevelBuilder([])
+    builder.parse_level_data(segment, level_addr, harvest_addr)
+    playfield = DefaultSegment(SegmentData(np.zeros(160 * 88, dtype=np.uint8)), 0x7000)
+    playfield[:] = 8  # background is the 9th ANTIC color register
+    builder.draw_objects(playfield, None, segment)
+    machine.update_colors(ju.get_level_colors(segment))
+    return playfield
+
+
+##### Rendering
+
+def render_bytes(viewer, renderer, bytes, style, bytes_per_row, zoom=1):
+    """Return an RGB image of bytes using the renderer, which can be either a
+    bitmap or a font renderer
+    """
+    if not is_font_renderer(renderer):
+        bytes_per_row = renderer.validate_bytes_per_row(bytes_per_row)
+    count = len(bytes)
+    nr = (count + bytes_per_row - 1) // bytes_per_row
+    size = nr * bytes_per_row
+    if size > count:
+        padded = np.zeros(size, dtype=np.uint8)
+        padded[0:count] = bytes
+        bytes = padded
+        padded = np.zeros(size, dtype=np.uint8)
+        padded[0:count] = style
+        style = padded
+    if is_font_renderer(renderer):
+        font = viewer.get_antic_font(renderer)
+        array = renderer.get_image(viewer, font, bytes.reshape((nr, -1)), style.reshape((nr, -1)), 0, count, bytes_per_row, nr, 0, bytes_per_row)
+        return intscale(array, zoom * renderer.scale_height, zoom * renderer.scale_width)
+    try:
+        pixels, style_classes = renderer.get_index_image(viewer, bytes_per_row, nr, count, bytes, style)
+    except NotImplementedError:
+        # renderers that create the RGB image directly
+        array = renderer.get_image(viewer, bytes_per_row, nr, count, bytes, style)
+        return intscale(array, zoom)
+    return renderer.get_rgb_image(renderer.get_palette(viewer), pixels, style_classes, zoom, zoom)
+
+
+def render_segment(segment, renderer, bytes_per_row, viewer=None, zoom=1, show_style=False):
+    """Return an RGB image of the segment
+
+    renderer can be a renderer instance or name. The style information of
+    the segment (selections, comments, etc.) is ignored unless show_style is
+    True.
+    """
+    if viewer is None:
+        viewer = HeadlessViewer()
+    if not hasattr(renderer, "get_image"):
+        renderer = get_renderer(renderer)
+    if isinstance(renderer, ar.JumpmanPlayfieldRenderer):
+        segment = get_jumpman_playfield(segment, viewer.machine)
+        bytes_per_row = 160
+    bytes = np.asarray(segment.data)
+    if show_style:
+        style = np.asarray(segment.style)
+    else:
+        style = np.zeros(len(bytes), dtype=np.uint8)
+    return render_bytes(viewer, renderer, bytes, style, bytes_per_row, zoom)
+
+
+def render_file(filename, output, segment_id=None, renderer="OneBitPerPixelB", bytes_per_row=40, zoom=1, antic_colors=None, color_standard=0, font=None, antic_order=False, max_bytes=None, show_style=False):
+    """Render a segment of a file to a PNG image
+
+    Returns the name of the PNG image.
+    """
+    segment = find_segment(get_segments(filename), segment_id)
+    font_mapping = ar.AnticFontMapping() if antic_order else None
+    font_data = get_font(font) if font is not None else None
+    machine = HeadlessMachine(antic_colors, color_standard, font_data, font_mapping)
+    viewer = HeadlessViewer(machine)
+    if max_bytes is not None and len(segment) > max_bytes:
+        r = SegmentData(segment.data[0:max_bytes].copy(), segment.style[0:max_bytes].copy())
+        segment = DefaultSegment(r, segment.start_addr, name=segment.name)
+    array = render_segment(segment, renderer, bytes_per_row, viewer, zoom, show_style)
+    save_png(output, array)
+    return output
+
+
+def render_files(filenames, output_dir, processes=None, **kwargs):
+    """Render many files using a pool of worker processes, yielding a
+    (filename, output, error) tuple for each file as it completes.
+    """
+    jobs = []
+    for filename in filenames:
+        output = os.path.join(output_dir, os.path.basename(filename) + ".png")
+        jobs.append((filename, output))
+    return run_jobs(render_file, jobs, processes, **kwargs)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Render segments of 8-bit disk images and binaries to PNG images without a GUI")
+    parser.add_argument("filenames", nargs="*", help="files to render")
+    parser.add_argument("-s", "--segment", default=None, help="segment number or name (default: the entire file)")
+    parser.add_argument("-r", "--renderer", default="OneBitPerPixelB", help="renderer class or display name (default: %(default)s)")
+    parser.add_argument("-w", "--width", type=int, default=40, help="bytes per row (default: %(default)s)")
+    parser.add_argument("-z", "--zoom", type=int, default=1, help="integer zoom factor (default: %(default)s)")
+    parser.add_argument("-c", "--colors", default=None, help="comma separated ANTIC color register values, either 5 playfield colors or up to 9 starting with the player colors")
+    parser.add_argument("--pal", action="store_true", default=False, help="use PAL colors instead of NTSC")
+    parser.add_argument("-f", "--font", default=None, help="builtin font name for font renderers")
+    parser.add_argument("--antic-order", action="store_true", default=False, help="map characters in ANTIC internal order instead of ATASCII order")
+    parser.add_argument("--max-bytes", type=int, default=None, help="only render the first MAX_BYTES bytes of each segment")
+    parser.add_argument("--style", action="store_true", default=False, help="show comments and other style information stored in the segment")
+    parser.add_argument("-o", "--output-dir", default=".", help="directory for the PNG images (default: current directory)")
+    parser.add_argument("-j", "--jobs", type=int, default=None, help="number of worker processes (default: number of CPUs)")
+    parser.add_argument("-l", "--list", action="store_true", default=False, help="list the available renderers and fonts")
+    options = parser.parse_args(argv)
+
+    if options.list:
+        for cls in sorted(iter_renderers(), key=lambda c: c.__name__):
+            print("%-32s %s" % (cls.__name__, cls.name))
+        for font in fonts.builtin_font_data.values():
+            print("font: %s" % font['name'])
+        return 0
+
+    antic_colors = None
+    if options.colors:
+        antic_colors = [int(c, 0) for c in options.colors.split(",")]
+    if not os.path.exists(options.output_dir):
+        os.makedirs(options.output_dir)
+
+    errors = 0
+    results = render_files(options.filenames, options.output_dir, options.jobs, segment_id=options.segment, renderer=options.renderer, bytes_per_row=options.width, zoom=options.zoom, antic_colors=antic_colors, color_standard=1 if options.pal else 0, font=options.font, antic_order=options.antic_order, max_bytes=options.max_bytes, show_style=options.style)
+    for filename, output, error in results:
+        if error is not None:
+            errors += 1
+            sys.stderr.write("%s: %s\n" % (filename, error))
+        else:
+            log.info("%s -> %s" % (filename, output))
+    return 1 if errors else 0
+
+
+if __name__ == "__main__":
+    logging.basicConfig(level=logging.WARNING)
+    sys.exit(main())
@@ -0,0 +1,280 @@
+"""Search many disk images and binaries without a GUI
+
+Directories are walked to find the files, which are recognized and split into
+segments by the same atrcopy parsers used when opening them in the editor.
+Each segment is searched for a byte pattern (like the hex search of the Find
+minibuffer), an expression (like Find Using Expression) or text in its
+disassembly. It can be used as a library through search_file and
+search_files, or from the command line to search a whole archive of files
+at once using a pool of worker processes:
+
+    python -m omnivore8bit.utils.scanutil -x "ad ?? d4" -o matches.txt archive/
+
+Each match is written as a tab separated record of the file name, segment
+number, segment name, offset into the segment and address. When writing to
+a file, the files that have been searched are recorded in a progress file
+next to it, so a scan that is interrupted can be continued with --resume
+instead of starting over.
+"""
+import os
+import sys
+import time
+import argparse
+
+import numpy as np
+
+from omnivore.utils.parseutil import NumpyIntExpression, ParseException
+
+from .renderutil import get_segments
+from .searchutil import BytePattern, ExpressionVariables, find_in_segments, remove_overlapping_matches
+from .batchutil import run_jobs
+
+import logging
+log = logging.getLogger(__name__)
+
+
+def iter_filenames(paths, extensions=None):
+    """Yield the files named in paths and all the files in the directories
+    named in paths, in sorted order so a scan always visits them in the same
+    order. If extensions are given, only the files found in the directories
+    that have one of those extensions are used.
+    """
+    if extensions is not None:
+        extensions = set(e.lower() if e.startswith(".") else "." + e.lower() for e in extensions)
+    for path in paths:
+        if not os.path.isdir(path):
+            yield path
+            continue
+        for root, dirs, files in os.walk(path):
+            dirs.sort()
+            for name in sorted(files):
+                if extensions is None or os.path.splitext(name)[1].lower() in extensions:
+                    yield os.path.join(root, name)
+
+
+def search_disassembly(segments, text, match_case=False, mode="substring", **kwargs):
+    # the disassembler needs udis, so it's only imported when used
+    from .listingutil import get_disassembler
+    found = []
+    for i, segment in enumerate(segments):
+        if len(segment) == 0 or segment.start_addr + len(segment) > 0x10000:
+            # the disassembler labels only cover a 64K address space, so
+            # e.g. the segment of an entire disk image is skipped
+            continue
+        d = get_disassembler(**kwargs)
+        d.disassemble_segment(segment)
+        found.extend((i, start) for start, end in d.search(text, match_case, mode))
+    return sorted(set(found))
+
+
+def compile_expression(text):
+    """Return the compiled expression, raising ValueError if it isn't valid
+    or uses a variable that isn't available
+    """
+    try:
+        plan = NumpyIntExpression.compile(text)
+    except ParseException, e:
+        raise ValueError(e)
+    for name in plan.variables:
+        ExpressionVariables.parse_name(name)
+    return plan
+
+
+def search_expression(segments, text):
+    # like the byte patterns, a byte that is in more than one segment is
+    # only reported in the smallest one
+    plan = compile_expression(text)
+    starts = {}
+    for i, segment in enumerate(segments):
+        variables = ExpressionVariables(segment, plan.variables)
+        starts[i] = np.flatnonzero(variables.get_mask(plan))
+    return remove_overlapping_matches(segments, starts, 1)
+
+
+def search_file(filename, pattern=None, expression=None, disasm=None, **kwargs):
+    """Search all the segments of a file, returning a list of (segment
+    number, segment name, index, address) of the matches.
+
+    pattern is the text of a byte pattern, expression is an expression as
+    used by Find Using Expression, and disasm is text to find in the
+    disassembly, which uses the match_case and mode keyword arguments of
+    the disassembler's search and the rest to create the disassembler.
+    Matches of a byte pattern or an expression in bytes that are in more
+    than one segment are only reported once, in the smallest segment.
+    """
+    segments = get_segments(filename)
+    found = []
+    if pattern is not None:
+        found.extend(find_in_segments(segments, BytePattern.parse(pattern), threads=1))
+    if expression is not None:
+        found.extend(search_expression(segments, expression))
+    if disasm is not None:
+        found.extend(search_disassembly(segments, disasm, **kwargs))
+    results = []
+    for i, index in sorted(set(found)):
+        s = segments[i]
+        results.append((i, s.name, index, s.start_addr + index))
+    return results
+
+
+def search_files(filenames, processes=None, **kwargs):
+    """Search many files using a pool of worker processes, yielding a
+    (filename, results, error) tuple for each file as it completes.
+    """
+    jobs = [(filename,) for filename in filenames]
+    return run_jobs(search_file, jobs, processes, 4, **kwargs)
+
+
+def format_record(filename, segment_num, segment_name, index, address):
+    return "%s\t%d\t%s\t%d\t%04x\n" % (filename, segment_num, segment_name, index, address)
+
+
+class ScanProgress(object):
+    """Record of the files that have been searched, for resuming a scan
+
+    Each line of the progress file is the size of the output file after the
+    records of a file were written, followed by the name of the file. When
+    resuming, the output is cut back to the last recorded size so the
+    records of a file that was only partly written aren't duplicated.
+    """
+    def __init__(self, filename):
+        self.filename = filename
+        self.done = set()
+        self.output_size = 0
+
+    def load(self):
+        """Read the progress file, dropping a last line that was only partly
+        written
+        """
+        self.done = set()
+        self.output_size = 0
+        if not os.path.exists(self.filename):
+            return
+        valid = 0
+        with open(self.filename, "r+b") as fh:
+            for line in fh:
+                if not line.endswith("\n"):
+                    break
+                size, name = line[:-1].split("\t", 1)
+                self.output_size = int(size)
+                self.done.add(name)
+                valid += len(line)
+            fh.truncate(valid)
+
+    def open(self, resume):
+        if resume:
+            self.load()
+        else:
+            self.done = set()
+            self.output_size = 0
+        self.fh = open(self.filename, "ab" if resume else "wb")
+
+    def add(self, filename, output_size):
+        self.fh.write("%d\t%s\n" % (output_size, filename))
+        self.fh.flush()
+        self.done.add(filename)
+
+    def close(self):
+        self.fh.close()
+
+
+def scan(filenames, output, progress=None, resume=False, processes=None, status=None, **kwargs):
+    """Search the files and write the records of the matches to the output
+    file handle as each file completes. Returns the number of files that
+    couldn't be searched.
+
+    If progress is a ScanProgress, files already listed in it are skipped
+    when resuming, and each searched file is added to it after its records
+    are written. Files that couldn't be searched aren't added, so they are
+    tried again when resuming. status(count, total, matches) is called after each file.
+    """
+    filenames = list(filenames)
+    if progress is not None:
+        progress.open(resume)
+        if resume:
+            output.seek(progress.output_size)
+            output.truncate()
+            filenames = [f for f in filenames if f not in progress.done]
+    errors = 0
+    matches = 0
+    try:
+        for count, (filename, results, error) in enumerate(search_files(filenames, processes, **kwargs)):
+            if error is not None:
+                # not added to the progress, so resuming tries it again
+                errors += 1
+                sys.stderr.write("%s: %s\n" % (filename, error))
+            else:
+                output.write("".join(format_record(filename, *r) for r in results))
+                matches += len(results)
+                if progress is not None:
+                    output.flush()
+                    progress.add(filename, output.tell())
+            if status is not None:
+                status(count + 1, len(filenames), matches)
+    finally:
+        if progress is not None:
+            progress.close()
+    return errors
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Search segments of many 8-bit disk images and binaries without a GUI")
+    parser.add_argument("paths", nargs="*", help="files or directories to search")
+    parser.add_argument("-x", "--hex", default=None, help="byte pattern to find, like 'a9 ?? 8d' or '(ad|bd) 00 d4'")
+    parser.add_argument("-e", "--expression", default=None, help="expression to find, like 'b == $ad && w[+1] >= $d000'")
+    parser.add_argument("-d", "--disasm", default=None, help="text to find in the disassembly")
+    parser.add_argument("--match-case", action="store_true", default=False, help="match case when searching the disassembly")
+    parser.add_argument("--token", action="store_true", default=False, help="only match whole mnemonics, operands and labels in the disassembly")
+    parser.add_argument("--regex", action="store_true", default=False, help="search the disassembly using a regular expression")
+    parser.add_argument("-c", "--cpu", default="6502", help="disassembler class or display name (default: %(default)s)")
+    parser.add_argument("-m", "--memory-map", default=None, help="memory map class or display name used for labels")
+    parser.add_argument("--ext", action="append", default=None, help="only search files in directories with this extension; can be given more than once")
+    parser.add_argument("-o", "--output", default=None, help="file for the matches (default: standard output)")
+    parser.add_argument("--resume", action="store_true", default=False, help="continue an interrupted scan to the same output file")
+    parser.add_argument("-p", "--progress", action="store_true", default=False, help="show the number of files searched")
+    parser.add_argument("-j", "--jobs", type=int, default=None, help="number of worker processes (default: number of CPUs)")
+    options = parser.parse_args(argv)
+
+    if options.hex is None and options.expression is None and options.disasm is None:
+        parser.error("nothing to search for; use --hex, --expression or --disasm")
+    if options.resume and options.output is None:
+        parser.error("--resume needs an output file")
+    kwargs = {}
+    if options.hex is not None:
+        try:
+            BytePattern.parse(options.hex)
+        except ValueError, e:
+            parser.error(str(e))
+        kwargs["pattern"] = options.hex
+    if options.expression is not None:
+        try:
+            compile_expression(options.expression)
+        except ValueError, e:
+            parser.error(str(e))
+        kwargs["expression"] = options.expression
+    if options.disasm is not None:
+        kwargs.update(disasm=options.disasm, match_case=options.match_case, mode="regex" if options.regex else "token" if options.token else "substring", cpu=options.cpu, mmap=options.memory_map)
+
+    def show_status(count, total, matches):
+        now = time.time()
+        if count == total or now - show_status.last > 1.0:
+            sys.stderr.write("\r%d/%d files, %d matches" % (count, total, matches))
+            if count == total:
+                sys.stderr.write("\n")
+            show_status.last = now
+    show_status.last = 0
+
+    filenames = iter_filenames(options.paths, options.ext)
+    status = show_status if options.progress else None
+    if options.output is None:
+        return 1 if scan(filenames, sys.stdout, processes=options.jobs, status=status, **kwargs) else 0
+    progress = ScanProgress(options.output + ".progress")
+    resume = options.resume and os.path.exists(options.output)
+    with open(options.output, "r+b" if resume else "wb") as fh:
+        errors = scan(filenames, fh, progress, resume, options.jobs, status, **kwargs)
+    return 1 if errors else 0
+
+
+if __name__ == "__main__":
+    logging.basicConfig(level=logging.WARNING)
+    sys.exit(main())
@@ -1,13 +1,315 @@
 import re
+from multiprocessing.pool import ThreadPool
 
 import numpy as np
 
+from atrcopy import get_style_bits
+
 from omnivore.utils.parseutil import NumpyIntExpression, ParseException
 
+from .segmentutil import set_style_ranges, bool_to_ranges
+
 import logging
 log = logging.getLogger(__name__)
 
 
+def get_search_data(segment):
+    """Return the bytes of the segment as a numpy array, which is the
+    segment's own array unless it uses a byte order
+    """
+    data = segment.data
+    if isinstance(data, np.ndarray):
+        return data
+    return data[:]
+
+
+class BytePattern(object):
+    """A pattern of bytes where each position can match several values
+
+    Each position is a list of (value, mask) alternatives, and a byte
+    matches if (byte & mask) == value for any of them. The text form is a
+    list of hex bytes like the hex searcher has always used, where a hex
+    digit can be replaced by ? to match any value of that nibble, a byte can
+    be followed by &mask to compare only the bits in the mask, and a list of
+    bytes separated by | inside parentheses matches any of them:
+
+        A9 ?? 8D         LDA immediate followed by STA absolute
+        (AD|BD|B9) 00 D4 LDA from $D400, absolute or indexed
+        20 ?? ?? 6?      JSR, then an RTS or any other $6x opcode
+        80&80            any byte with the high bit set
+
+    Searching works directly on the numpy array of the segment. The
+    position whose allowed values are expected to be rarest in the data is
+    checked first in blocks of the array, and only the candidates found
+    there are checked at the other positions.
+    """
+    token_re = re.compile(r"\s*(?:([()|])|([0-9a-fA-F?]{2}|\?)(?:&([0-9a-fA-F]{2}))?)")
+
+    # bytes checked at a time to find the candidates at the first position
+    block_size = 1 << 20
+
+    # the data is sampled at this interval to estimate how rare a byte is
+    sample_step = 64
+
+    def __init__(self, positions):
+        self.positions = positions
+        values = np.arange(256, dtype=np.uint8)
+        self.tables = []
+        for options in positions:
+            table = np.zeros(256, dtype=np.bool_)
+            for value, mask in options:
+                table |= (values & mask) == value
+            self.tables.append(table)
+
+    def __len__(self):
+        return len(self.positions)
+
+    def startswith(self, other):
+        return self.positions[:len(other.positions)] == other.positions
+
+    @classmethod
+    def from_bytes(cls, data):
+        return cls([[(b, 0xff)] for b in bytearray(data)])
+
+    @classmethod
+    def parse_byte(cls, text, mask_text):
+        if text == "?":
+            text = "??"
+        value = 0
+        mask = 0
+        for c in text:
+            value <<= 4
+            mask <<= 4
+            if c != "?":
+                value |= int(c, 16)
+                mask |= 0xf
+        if mask_text:
+            mask &= int(mask_text, 16)
+        return value & mask, mask
+
+    @classmethod
+    def parse(cls, text):
+        """Create the pattern from its text form, raising ValueError if the
+        text isn't valid
+        """
+        positions = []
+        group = None
+        expect_byte = True
+        index = 0
+        text = text.rstrip()
+        while index < len(text):
+            m = cls.token_re.match(text, index)
+            if m is None or m.end() == index:
+                raise ValueError("Invalid byte pattern at '%s'" % text[index:])
+            index = m.end()
+            symbol, byte, mask = m.groups()
+            if byte is not None:
+                if group is not None and not expect_byte:
+                    raise ValueError("Missing | between alternatives")
+                option = cls.parse_byte(byte, mask)
+                if group is None:
+                    positions.append([option])
+                else:
+                    group.append(option)
+                    expect_byte = False
+            elif symbol == "(" and group is None:
+                group = []
+                expect_byte = True
+            elif symbol == "|" and group is not None and not expect_byte:
+                expect_byte = True
+            elif symbol == ")" and group is not None and not expect_byte:
+                positions.append(group)
+                group = None
+            else:
+                raise ValueError("Unexpected '%s' in byte pattern" % symbol)
+        if group is not None:
+            raise ValueError("Missing ) in byte pattern")
+        return cls(positions)
+
+    def get_search_order(self, data):
+        """Return the positions sorted by the estimated number of bytes in
+        the data that match them, fewest first
+        """
+        sample = np.bincount(data[::self.sample_step], minlength=256) + 1
+        counts = [sample[table].sum() for table in self.tables]
+        return np.argsort(counts, kind="mergesort")
+
+    def get_candidates(self, block, position):
+        options = self.positions[position]
+        if len(options) == 1:
+            value, mask = options[0]
+            if mask == 0xff:
+                return np.flatnonzero(block == value)
+            if mask == 0:
+                return np.arange(len(block))
+            return np.flatnonzero((block & mask) == value)
+        return np.flatnonzero(self.tables[position][block])
+
+    def refine(self, data, candidates, start_position):
+        """Return the candidates where the pattern occurs, given that the
+        positions before start_position are known to match at all of them
+        """
+        candidates = candidates[candidates <= len(data) - len(self.positions)]
+        for position in range(start_position, len(self.positions)):
+            if len(candidates) == 0:
+                break
+            candidates = candidates[self.tables[position][data[candidates + position]]]
+        return candidates
+
+    def find(self, data):
+        """Return the indexes of all the places the pattern occurs in the
+        numpy array, including ones that overlap
+        """
+        size = len(self.positions)
+        last = len(data) - size + 1
+        if size == 0 or last <= 0:
+            return np.zeros(0, dtype=np.int64)
+        order = self.get_search_order(data)
+        first = order[0]
+        found = []
+        for start in range(0, last, self.block_size):
+            end = min(start + self.block_size, last)
+            candidates = self.get_candidates(data[start + first:end + first], first) + start
+            for position in order[1:]:
+                if len(candidates) == 0:
+                    break
+                candidates = candidates[self.tables[position][data[candidates + position]]]
+            found.append(candidates)
+        return np.concatenate(found).astype(np.int64)
+
+
+def get_raw_starts(segment, starts, size):
+    """Return a key for the raw bytes covered by each match, so the same
+    bytes found through different segments can be recognized. The key is
+    made from the indexes of the first and last byte into the base array
+    """
+    r = segment.rawdata
+    if r.is_indexed:
+        first = r.order[starts]
+        last = r.order[starts + size - 1]
+    else:
+        offset = r.get_raw_index(0)
+        first = starts + offset
+        last = first + size - 1
+    return (np.asarray(first, dtype=np.int64) << 32) | np.asarray(last, dtype=np.int64)
+
+
+def get_base_key(segment):
+    r = segment.rawdata
+    data = r.data.np_data if r.is_indexed else r.data
+    while isinstance(data.base, np.ndarray):
+        data = data.base
+    return id(data)
+
+
+def find_in_segments(segments, pattern, threads=None, chunk_size=1 << 20):
+    """Search every segment for the pattern, returning a sorted list of
+    (segment number, index) of the matches.
+
+    Segments that overlap share their raw data, so the same bytes would be
+    found once for each segment containing them. Segments are checked from
+    the smallest to the largest and a match is only reported for the first
+    segment that covers its bytes, so e.g. a match in a file is reported in
+    the file's segment rather than also in the segment of the whole disk.
+
+    The segments are split into chunks that are searched in a pool of
+    threads. The searching is done by numpy, which releases the GIL while
+    it works through the arrays.
+    """
+    size = len(pattern)
+    if size == 0:
+        return []
+    numbered = [(i, s) for i, s in enumerate(segments) if len(s) >= size]
+    arrays = dict((i, get_search_data(s)) for i, s in numbered)
+    jobs = []
+    for i, s in numbered:
+        last = len(s) - size + 1
+        for start in range(0, last, chunk_size):
+            jobs.append((i, start, min(start + chunk_size, last)))
+
+    def search_chunk(job):
+        i, start, end = job
+        return pattern.find(arrays[i][start:end + size - 1]) + start
+
+    if threads == 1 or len(jobs) < 2:
+        found = [search_chunk(job) for job in jobs]
+    else:
+        pool = ThreadPool(threads)
+        try:
+            found = pool.map(search_chunk, jobs)
+        finally:
+            pool.close()
+            pool.join()
+    starts = {}
+    for (i, start, end), chunk in zip(jobs, found):
+        starts.setdefault(i, []).append(chunk)
+    starts = dict((i, np.concatenate(chunks)) for i, chunks in starts.iteritems())
+    return remove_overlapping_matches(segments, starts, size)
+
+
+def remove_overlapping_matches(segments, starts, size):
+    """Return a sorted list of (segment number, index) of the matches,
+    where starts maps a segment number to the array of indexes of the
+    matches in that segment and size is the number of bytes in a match.
+
+    A match is only reported for the smallest segment that covers its bytes,
+    so the same bytes seen through overlapping segments are only reported
+    once.
+    """
+    seen = {}
+    results = []
+    numbered = sorted(starts.iteritems(), key=lambda item: (len(segments[item[0]]), item[0]))
+    for i, segment_starts in numbered:
+        if len(segment_starts) == 0:
+            continue
+        s = segments[i]
+        keys = get_raw_starts(s, segment_starts, size)
+        base = get_base_key(s)
+        previous = seen.get(base)
+        if previous is not None:
+            unique = ~np.in1d(keys, previous)
+            segment_starts = segment_starts[unique]
+            keys = keys[unique]
+            seen[base] = np.concatenate((previous, keys))
+        else:
+            seen[base] = keys
+        results.extend((i, index) for index in segment_starts.tolist())
+    results.sort()
+    return results
+
+
+class PreviousMatches(object):
+    """The matches of the last pattern searched for by each searcher
+
+    While a search is typed, each keystroke usually adds to the end of the
+    previous pattern. The new pattern can only match where the previous one
+    did, so only those places need to be checked. The matches are only used
+    for the same segment, and only if the data of the document hasn't
+    changed since. They are kept in the previous_matches of the document.
+    """
+    def __init__(self):
+        self.entries = {}
+
+    def get_candidates(self, key, segment, version, pattern):
+        """Return the matches of the previous pattern and the number of
+        positions of the new pattern they are known to match, or None if
+        they can't be used
+        """
+        entry = self.entries.get(key)
+        if entry is None:
+            return None, 0
+        old_segment, old_version, old_pattern, starts = entry
+        if old_segment is not segment or old_version != version or not pattern.startswith(old_pattern):
+            return None, 0
+        return starts, len(old_pattern)
+
+    def set_matches(self, key, segment, version, pattern, starts):
+        self.entries[key] = (segment, version, pattern, starts)
+
+    def clear(self):
+        self.entries = {}
+
+
 class BaseSearcher(object):
     pretty_name = "<base class>"
 
@@ -20,16 +322,28 @@ class BaseSearcher(object):
             self.matches = []
 
     def get_search_text(self, text):
-        return bytearray(text, "utf-8")
+        return BytePattern.from_bytes(bytearray(text, "utf-8"))
 
     def get_matches(self, editor):
-        text = editor.segment.search_copy
-        rs = re.escape(str(self.search_text))
-        matches = [(i.start(), i.end()) for i in re.finditer(rs, text)]
+        pattern = self.search_text
+        segment = editor.segment
+        data = get_search_data(segment)
+        key = self.__class__
+        # the change_count is also bumped by selecting the match, so it
+        # can't tell if the data is the same
+        version = editor.document.data_version
+        previous = editor.document.previous_matches
+        candidates, count = previous.get_candidates(key, segment, version, pattern)
+        if candidates is None:
+            starts = pattern.find(data)
+        else:
+            starts = pattern.refine(data, candidates, count)
+        previous.set_matches(key, segment, version, pattern, starts)
+        matches = zip(starts.tolist(), (starts + len(pattern)).tolist())
         return matches
 
     def set_style(self, editor):
-        editor.segment.set_style_ranges(self.matches, match=True)
+        set_style_ranges(editor.segment, self.matches, match=True)
 
 
 class HexSearcher(BaseSearcher):
@@ -40,9 +354,9 @@ class HexSearcher(BaseSearcher):
 
     def get_search_text(self, text):
         try:
-            return bytearray.fromhex(text)
-        except ValueError:
-            log.debug("%s: fromhex failed on: %s")
+            return BytePattern.parse(text)
+        except ValueError, e:
+            log.debug("%s: byte pattern failed on %s: %s" % (self.pretty_name, text, e))
             return ""
 
 
@@ -79,6 +393,86 @@ class CommentSearcher(BaseSearcher):
         return matches
 
 
+class ExpressionVariables(object):
+    """The values of the variables that an expression can use, for each
+    block of the bytes of a segment:
+
+        a   address of the byte
+        b   value of the byte
+        w   little endian word starting at the byte
+        s   style bits of the byte
+
+    Any of them can be followed by an offset in brackets to use the value at
+    a neighboring byte, like b[-1] for the byte before or b[+1] for the byte
+    after. A byte never matches if a neighbor it uses would be outside the
+    segment.
+    """
+    names = ["a", "b", "w", "s"]
+
+    # number of extra bytes past the offset used by each variable
+    extra_bytes = {"w": 1}
+
+    def __init__(self, segment, variables):
+        self.start_addr = segment.start_addr
+        self.data = get_search_data(segment)
+        self.style = segment.style
+        if not isinstance(self.style, np.ndarray):
+            self.style = self.style[:]
+        self.variables = []
+        first = 0
+        last = len(segment)
+        for name in variables:
+            base, offset = self.parse_name(name)
+            first = max(first, -offset)
+            last = min(last, len(segment) - offset - self.extra_bytes.get(base, 0))
+            self.variables.append((name, base, offset))
+        self.first = first
+        self.size = max(0, last - first)
+
+    @classmethod
+    def parse_name(cls, name):
+        """Return the variable name and offset of a variable used by an
+        expression, like ("b", -1) for b[-1]
+        """
+        base, offset = name, 0
+        if "[" in name:
+            base, offset = name[:-1].split("[")
+            offset = int(offset)
+        if base not in cls.names:
+            raise ValueError("Unknown variable %s" % name)
+        return base, offset
+
+    def get_vars(self, start, end):
+        vars_ = {}
+        start += self.first
+        end += self.first
+        data = self.data
+        for name, base, offset in self.variables:
+            i = start + offset
+            j = end + offset
+            if base == "b":
+                value = data[i:j]
+            elif base == "w":
+                value = data[i + 1:j + 1].astype(np.uint16)
+                value <<= 8
+                value |= data[i:j]
+            elif base == "s":
+                value = self.style[i:j]
+            else:
+                value = np.arange(i + self.start_addr, j + self.start_addr, dtype=np.int64)
+            vars_[name] = value
+        return vars_
+
+    def get_mask(self, plan):
+        """Return a boolean array that's True for the bytes where the
+        compiled expression is true
+        """
+        mask = np.zeros(len(self.data), dtype=np.bool_)
+        if self.size > 0:
+            mask[self.first:self.first + self.size] = plan.eval_mask(self.size, self.get_vars)
+        return mask
+
+
 class AlgorithmSearcher(BaseSearcher):
     def __str__(self):
         return "pyparsing matches: %s" % str(self.matches)
@@ -87,20 +481,20 @@ class AlgorithmSearcher(BaseSearcher):
         return text
 
     def get_matches(self, editor):
-        s = editor.segment
-        a = np.arange(s.start_addr, s.start_addr + len(s))
-        b = np.copy(s.data)
-        v = {
-            'a': np.arange(s.start_addr, s.start_addr + len(s)),
-            'b': np.copy(s.data),
-            }
-        expression = NumpyIntExpression(v)
         try:
-            result = expression.eval(self.search_text)
-            matches = s.bool_to_ranges(result)
-            return matches
+            plan = NumpyIntExpression.compile(self.search_text)
         except ParseException, e:
             raise ValueError(e)
+        variables = ExpressionVariables(editor.segment, plan.variables)
+        self.mask = variables.get_mask(plan)
+        return bool_to_ranges(self.mask)
+
+    def set_style(self, editor):
+        # an expression can match most of a segment, so the style is set
+        # from the mask rather than from the list of ranges
+        indexes = np.flatnonzero(self.mask)
+        s = editor.segment.style
+        s[indexes] = s[indexes] | get_style_bits(match=True)
 
 
 known_searchers = [
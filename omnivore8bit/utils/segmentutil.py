@@ -1,6 +1,71 @@
 import numpy as np
 
-from atrcopy import SegmentData, SegmentParser, InvalidSegmentParser, DefaultSegment, iter_known_segment_parsers
+from atrcopy import SegmentData, SegmentParser, InvalidSegmentParser, DefaultSegment, iter_known_segment_parsers, user_bit_mask, get_style_bits
+
+
+def bool_to_ranges(matches):
+    """Return a list of (start, end) pairs of the runs of True values
+
+    Same results as DefaultSegment.bool_to_ranges, but found from the
+    positions where the values change instead of splitting the array into
+    groups.
+    """
+    m = np.zeros(len(matches) + 2, dtype=np.int8)
+    m[1:-1] = matches
+    edges = np.flatnonzero(np.diff(m))
+    return zip(edges[0::2].tolist(), edges[1::2].tolist())
+
+
+def get_style_ranges(segment, **kwargs):
+    """Return a list of (start, end) pairs of the bytes that have all the
+    specified style bits, like DefaultSegment.get_style_ranges
+    """
+    style_bits = get_style_bits(**kwargs)
+    return bool_to_ranges((segment.style[:] & style_bits) == style_bits)
+
+
+def set_style_ranges(segment, ranges, **kwargs):
+    """Set the specified style bits of all the bytes in the list of (start,
+    end) pairs at once, like DefaultSegment.set_style_ranges
+    """
+    if len(ranges) == 0:
+        return
+    style_bits = get_style_bits(**kwargs)
+    num_bytes = len(segment)
+    r = np.clip(np.asarray(ranges, dtype=np.int64).reshape(-1, 2), 0, num_bytes)
+    r.sort(axis=1)
+    starts = r[:, 0]
+    lengths = r[:, 1] - starts
+
+    # the index of every byte in every range, without an array the size of
+    # the segment
+    offsets = np.cumsum(lengths) - lengths
+    indexes = np.repeat(starts - offsets, lengths) + np.arange(lengths.sum())
+    s = segment.style
+    s[indexes] = s[indexes] | style_bits
+
+
+def get_user_style_ranges(segment, user):
+    """Return a list of (start, end) pairs of the bytes that have the user
+    style value (the disassembler style) user
+    """
+    return bool_to_ranges((segment.style[:] & user_bit_mask) == user)
+
+
+def values_to_ranges(values, split=None):
+    """Return a list of ((start, end), value) covering the array of values,
+    starting a new range wherever the value changes or split is True
+    """
+    num_bytes = len(values)
+    if num_bytes < 1:
+        return []
+    changed = values[1:] != values[:-1]
+    if split is not None:
+        changed |= split[1:]
+    starts = np.flatnonzero(changed) + 1
+    ends = np.append(starts, num_bytes)
+    starts = np.insert(starts, 0, 0)
+    return [((start, end), value) for start, end, value in zip(starts.tolist(), ends.tolist(), values[starts].tolist())]
 
 
 class AnticFontSegment(DefaultSegment):
@@ -67,6 +67,8 @@ class SegmentViewer(HasTraits):
 
     zoom_text = "viewer zoom factor"
 
+    has_overview = False  # can summarize blocks of bytes per pixel
+
     has_caret = True
 
     valid_mouse_modes = []  # toolbar description
@@ -660,17 +662,16 @@ class ByteViewersPlugin(FrameworkPlugin):
     )
 
     def _viewers_default(self):
-        # from omnivore8bit.viewers.bitmap import MemoryMapViewer
-        from omnivore8bit.viewers.bitmap2 import BitmapViewer
+        from omnivore8bit.viewers.bitmap2 import BitmapViewer, MemoryMapViewer
         from omnivore8bit.viewers.char2 import CharViewer
         from omnivore8bit.viewers.cpu2 import DisassemblyViewer
         from omnivore8bit.viewers.hex2 import HexEditViewer
-        from omnivore8bit.viewers.info import CommentsViewer, UndoViewer, SegmentListViewer
+        from omnivore8bit.viewers.info import CommentsViewer, UndoViewer, SegmentListViewer, XrefsViewer
         from omnivore8bit.viewers.map2 import MapViewer
         from omnivore8bit.viewers.tile import TileViewer
         from omnivore8bit.viewers.jumpman2 import JumpmanViewer, TriggerPaintingViewer, LevelSummaryViewer
         from omnivore8bit.viewers.emulator import Atari800Viewer, CPU6502Viewer, ANTICViewer, POKEYViewer, GTIAViewer, PIAViewer
 
-        return [BitmapViewer, CharViewer, DisassemblyViewer, HexEditViewer, CommentsViewer, UndoViewer, SegmentListViewer, MapViewer, TileViewer, JumpmanViewer, TriggerPaintingViewer, LevelSummaryViewer, Atari800Viewer, CPU6502Viewer, ANTICViewer, POKEYViewer, GTIAViewer, PIAViewer]
+        return [BitmapViewer, MemoryMapViewer, CharViewer, DisassemblyViewer, HexEditViewer, CommentsViewer, UndoViewer, SegmentListViewer, XrefsViewer, MapViewer, TileViewer, JumpmanViewer, TriggerPaintingViewer, LevelSummaryViewer, Atari800Viewer, CPU6502Viewer, ANTICViewer, POKEYViewer, GTIAViewer, PIAViewer]
 
 plugins = [ByteViewersPlugin()]
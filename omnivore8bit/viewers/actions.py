@@ -18,6 +18,7 @@ from omnivore8bit.arch.ui.antic_colors import AnticColorDialog
 from omnivore.utils.wx.dialogs import prompt_for_hex, prompt_for_dec, prompt_for_string, get_file_dialog_wildcard, ListReorderDialog
 from omnivore8bit.ui.dialogs import prompt_for_assembler
 from omnivore8bit.arch.machine import Machine
+from omnivore8bit.utils.segmentutil import get_style_ranges
 from ..byte_edit.commands import SetCommentCommand
 
 if sys.platform == "darwin":
@@ -270,6 +271,55 @@ class ViewerZoomAction(ViewerAction):
             v.set_zoom(val)
 
 
+class MemoryMapOverviewAction(ViewerAction):
+    """Zoom out the memory map so each pixel summarizes a block of bytes. At
+    level zero each pixel is one byte, and each level above that shows four
+    times as many bytes per pixel, so the layout of an entire disk image can
+    be seen at once.
+    """
+    name = "Overview Level"
+    enabled_name = 'has_overview'
+
+    def perform(self, event):
+        v = self.viewer
+        val = prompt_for_dec(v.control, 'Enter new %s' % v.overview_text, 'Set Overview Level', v.overview_level)
+        if val is not None and val >= 0:
+            v.set_overview_level(val)
+
+
+class MemoryMapFitOverviewAction(ViewerAction):
+    """Choose the overview level that fits the entire segment in the memory
+    map window
+    """
+    name = "Fit Overview"
+    enabled_name = 'has_overview'
+
+    def perform(self, event):
+        self.viewer.fit_overview()
+
+
+class MemoryMapSummaryAction(ViewerAction):
+    """When showing more than one byte per pixel, shade each pixel using the
+    {name} of the byte values in its block. The style of the block is always
+    the combination of the styles of all its bytes.
+    """
+    doc_hint = "parent,list"
+    style = RADIO_STYLE
+    enabled_name = 'has_overview'
+
+    summary = Any
+
+    def _name_default(self):
+        return self.summary.capitalize()
+
+    def perform(self, event):
+        v = self.viewer
+        v.set_overview_level(v.overview_level, self.summary)
+
+    def _update_checked(self, ui_state):
+        self.checked = getattr(self.viewer.control, 'overview_summary', None) == self.summary
+
+
 class AnticColorAction(ViewerAction):
     """Open a window to choose the color palette from the available colors
     of the ANTIC processor.
@@ -746,7 +796,7 @@ class AddCommentAction(ViewerAction):
         e = self.active_editor
         s = e.segment
         if self.is_range(event):
-            ranges = s.get_style_ranges(selected=True)
+            ranges = get_style_ranges(s, selected=True)
             if len(ranges) == 1:
                 desc = "Enter comment for first byte of range:\n%s" % e.get_label_of_first_byte(ranges)
             else:
@@ -782,7 +832,7 @@ class RemoveCommentAction(ViewerAction):
         e = self.active_editor
         s = e.segment
         if e.can_copy:
-            ranges = s.get_style_ranges(selected=True)
+            ranges = get_style_ranges(s, selected=True)
         else:
             index = e.caret_index
             ranges = [(index, index+1)]
@@ -798,7 +848,7 @@ class RemoveCommentPopupAction(ViewerAction):
         e = self.active_editor
         s = e.segment
         if event.popup_data["in_selection"]:
-            ranges = s.get_style_ranges(selected=True)
+            ranges = get_style_ranges(s, selected=True)
         else:
             index = event.popup_data["index"]
             ranges = [(index, index+1)]
@@ -831,7 +881,7 @@ class AddLabelAction(ViewerAction):
 
     def get_ranges(self, editor, segment, event):
         if editor.can_copy:  # has selected ranges
-            ranges = segment.get_style_ranges(selected=True)
+            ranges = get_style_ranges(segment, selected=True)
         else:
             ranges = [(editor.caret_index, editor.caret_index + 1)]
         return ranges
@@ -856,7 +906,7 @@ class AddLabelAction(ViewerAction):
 class AddLabelPopupAction(AddLabelAction):
     def get_ranges(self, editor, segment, event):
         if event.popup_data["in_selection"]:
-            ranges = segment.get_style_ranges(selected=True)
+            ranges = get_style_ranges(segment, selected=True)
         else:
             index = event.popup_data["index"]
             ranges = [(index, index+1)]
@@ -882,7 +932,7 @@ class RemoveLabelAction(AddLabelAction):
 class RemoveLabelPopupAction(RemoveLabelAction):
     def get_ranges(self, editor, segment, event):
         if event.popup_data["in_selection"]:
-            ranges = segment.get_style_ranges(selected=True)
+            ranges = get_style_ranges(segment, selected=True)
         else:
             index = event.popup_data["index"]
             ranges = [(index, index+1)]
@@ -2,12 +2,13 @@ import os
 import sys
 
 import wx
+import numpy as np
 
 from traits.api import on_trait_change, Bool, Undefined
 
-from omnivore.utils.nputil import intscale
 from omnivore.utils.wx import compactgrid as cg
 
+from ..arch.overview import MemoryMapPyramid
 from ..ui.segment_grid import SegmentGridControl, SegmentTable
 
 from . import SegmentViewer
@@ -22,18 +23,132 @@ class BitmapImageCache(cg.DrawTextImageCache):
         start = 0
         end = len(data)
         nr = 1
-        array = grid_control.bitmap_renderer.get_image(grid_control.segment_viewer, end, nr, end, data, style)
-        width = array.shape[1]
-        height = array.shape[0]
-        if width > 0 and height > 0:
-            array = intscale(array, grid_control.zoom_h, grid_control.zoom_w)
-            #print("bitmap: %d,%d,3 after scaling: %s" % (height, width, str(array.shape)))
-            image = wx.Image(array.shape[1], array.shape[0])
-            image.SetData(array.tostring())
-            bmp = wx.Bitmap(image)
+        renderer = grid_control.bitmap_renderer
+        pixels, style_classes = renderer.get_index_image(grid_control.segment_viewer, end, nr, end, data, style)
+        if pixels.shape[0] > 0 and pixels.shape[1] > 0:
+            palette = renderer.get_palette(grid_control.segment_viewer)
+            array = renderer.get_rgb_image(palette, pixels, style_classes, grid_control.zoom_h, grid_control.zoom_w)
+            bmp = cg.numpy_to_bitmap(array)
             dc.DrawBitmap(bmp, rect.x, rect.y)
 
 
+class BitmapRowCache(object):
+    """Cache of the rendered rows of a bitmap viewer
+
+    Each row is stored with a version string made from its bytes and style,
+    so a redraw only decodes the rows whose content has actually changed.
+    The decoded color register indexes are kept separately from the RGB
+    pixels, so a palette change only redoes the palette lookup. The bitmap
+    of the last visible frame is also kept, and only changed rows are blitted
+    into it if the viewport hasn't moved.
+    """
+    def __init__(self):
+        self.invalidate()
+
+    def invalidate(self):
+        self.key = None
+        self.palette = None
+        self.rows = {}
+        self.frame_key = None
+        self.frame_bitmap = None
+
+    def iter_runs(self, row_numbers):
+        """Group a sorted list of row numbers into (first, count) runs of
+        consecutive rows
+        """
+        start = None
+        for row in row_numbers:
+            if start is None:
+                start = last = row
+            elif row == last + 1:
+                last = row
+            else:
+                yield start, last - start + 1
+                start = last = row
+        if start is not None:
+            yield start, last - start + 1
+
+    def get_bitmap(self, grid_control, first_row, nr, data, style):
+        if nr <= 0:
+            return None
+        renderer = grid_control.bitmap_renderer
+        segment_viewer = grid_control.segment_viewer
+        bytes_per_row = grid_control.table.items_per_row
+        key = (renderer.name, bytes_per_row, grid_control.table.start_offset, grid_control.zoom_h, grid_control.zoom_w)
+        if key != self.key:
+            self.invalidate()
+            self.key = key
+        palette = renderer.get_palette(segment_viewer)
+        if self.palette is None or not np.array_equal(palette, self.palette):
+            self.palette = palette
+            self.frame_key = None
+            for entry in self.rows.itervalues():
+                entry[2] = None
+
+        data = data.reshape((nr, bytes_per_row))
+        style = style.reshape((nr, bytes_per_row))
+
+        # rows with new content need to be decoded again
+        changed = []
+        for i in range(nr):
+            version = data[i].tostring() + style[i].tostring()
+            entry = self.rows.get(first_row + i)
+            if entry is None or entry[0] != version:
+                self.rows[first_row + i] = [version, None, None]
+                changed.append(i)
+        for i, count in self.iter_runs(changed):
+            pixels, style_classes = renderer.get_index_image(segment_viewer, bytes_per_row, count, count * bytes_per_row, data[i:i + count].ravel(), style[i:i + count].ravel())
+            for j in range(count):
+                self.rows[first_row + i + j][1] = (pixels[j:j + 1], style_classes[j:j + 1])
+
+        # rows without RGB data need the palette lookup
+        recolored = [i for i in range(nr) if self.rows[first_row + i][2] is None]
+        runs = []
+        for i, count in self.iter_runs(recolored):
+            planes = [self.rows[first_row + i + j][1] for j in range(count)]
+            pixels = np.vstack([p[0] for p in planes])
+            style_classes = np.vstack([p[1] for p in planes])
+            array = renderer.get_rgb_image(palette, pixels, style_classes, grid_control.zoom_h, grid_control.zoom_w)
+            h = array.shape[0] / count
+            for j in range(count):
+                self.rows[first_row + i + j][2] = array[j * h:(j + 1) * h]
+            runs.append((i * h, array))
+
+        frame_key = (first_row, nr)
+        if frame_key != self.frame_key:
+            rows = [self.rows[first_row + i][2] for i in range(nr)]
+            h, w, _ = rows[0].shape
+            array = np.empty((h * nr, w, 3), dtype=np.uint8)
+            for i, row in enumerate(rows):
+                array[i * h:(i + 1) * h] = row
+            self.frame_bitmap = self.array_to_bitmap(array)
+            self.frame_key = frame_key
+        elif runs and self.frame_bitmap is not None:
+            dc = wx.MemoryDC(self.frame_bitmap)
+            for y, array in runs:
+                bmp = self.array_to_bitmap(array)
+                if bmp is not None:
+                    dc.DrawBitmap(bmp, 0, y)
+            dc.SelectObject(wx.NullBitmap)
+        self.prune(first_row, nr)
+        return self.frame_bitmap
+
+    def array_to_bitmap(self, array):
+        if array.shape[0] == 0 or array.shape[1] == 0:
+            return None
+        return cg.numpy_to_bitmap(array)
+
+    def prune(self, first_row, nr):
+        # keep a few screens worth of rows around the viewport so scrolling
+        # back and forth doesn't need to decode again
+        if len(self.rows) > 4 * nr:
+            low = first_row - nr
+            high = first_row + 2 * nr
+            for row in self.rows.keys():
+                if row < low or row >= high:
+                    del self.rows[row]
+
+
 class BitmapLineRenderer(cg.TableLineRenderer):
     default_image_cache = BitmapImageCache
 
@@ -110,17 +225,8 @@ class BitmapLineRenderer(cg.TableLineRenderer):
             data = t.data[first_index:last_index]
             style = t.style[first_index:last_index]
 
-        # get_image(cls, machine, antic_font, bytes, style, start_byte, end_byte, bytes_per_row, nr, start_col, visible_cols):
-
-        array = grid_control.bitmap_renderer.get_image(grid_control.segment_viewer, bytes_per_row, nr, bytes_per_row * nr, data, style)
-        width = array.shape[1]
-        height = array.shape[0]
-        if width > 0 and height > 0:
-            array = intscale(array, grid_control.zoom_h, grid_control.zoom_w)
-            #print("bitmap: %d,%d,3 after scaling: %s" % (height, width, str(array.shape)))
-            image = wx.Image(array.shape[1], array.shape[0])
-            image.SetData(array.tostring())
-            bmp = wx.Bitmap(image)
+        bmp = grid_control.row_cache.get_bitmap(grid_control, first_row, nr, data, style)
+        if bmp is not None:
             dc.DrawBitmap(bmp, frame_rect.x, frame_rect.y)
 
 
@@ -128,6 +234,7 @@ class BitmapGridControl(SegmentGridControl):
     def set_viewer_defaults(self):
         self.items_per_row = self.view_params.bitmap_width
         self.zoom = 2
+        self.row_cache = BitmapRowCache()
 
     @property
     def bitmap_renderer(self):
@@ -186,18 +293,180 @@ class BitmapViewer(SegmentViewer):
     def window_title(self):
         return self.machine.bitmap_renderer.name
 
-    @on_trait_change('machine.bitmap_shape_change_event,machine.bitmap_color_change_event')
+    @on_trait_change('machine.bitmap_shape_change_event')
     def update_bitmap(self, evt):
         log.debug("BitmapViewer: machine bitmap changed for %s" % self.control)
         if evt is not Undefined:
             self.control.recalc_view()
             self.linked_base.editor.update_pane_names()
 
+    @on_trait_change('machine.bitmap_color_change_event')
+    def update_colors(self, evt):
+        log.debug("BitmapViewer: machine colors changed for %s" % self.control)
+        if evt is not Undefined:
+            # the decoded pixels are still valid, so only the palette lookup
+            # needs to be redone when redrawing
+            self.control.refresh_view()
+
     def validate_width(self, width):
         return self.machine.bitmap_renderer.validate_bytes_per_row(width)
 
 
+class MemoryMapOverviewTable(SegmentTable):
+    """Table for the memory map where each item is a block of bytes from the
+    summary pyramid instead of a single byte.
+
+    Indexes passed in and out of the table are still byte indexes into the
+    segment so the carets and selections are shared with the other viewers.
+    """
+    def __init__(self, linked_base, bytes_per_row, pyramid, level, summary):
+        self.pyramid = pyramid
+        self.level = level
+        self.block_size = pyramid.block_size(level)
+        SegmentTable.__init__(self, linked_base, bytes_per_row)
+        self.data, self.style = pyramid.get_level(level, summary)
+        if level > 0:
+            # blocks don't line up with the start address, so start each row
+            # on a block boundary
+            self.start_offset = 0
+        self.num_rows = ((self.start_offset + len(self.data) - 1) / bytes_per_row) + 1
+        self.last_valid_index = pyramid.num_bytes
+
+    def calc_labels(self):
+        SegmentTable.calc_labels(self)
+        if self.level > 0:
+            self.label_start_addr = self.start_addr
+
+    def get_index_range(self, row, col):
+        block = row * self.items_per_row + col - self.start_offset
+        block = max(0, min(block, len(self.data) - 1))
+        index = block * self.block_size
+        return index, min(index + self.block_size, self.last_valid_index)
+
+    def get_index_of_row(self, line):
+        return ((line * self.items_per_row) - self.start_offset) * self.block_size
+
+    def index_to_row_col(self, index):
+        return divmod((index / self.block_size) + self.start_offset, self.items_per_row)
+
+
+class MemoryMapGridControl(BitmapGridControl):
+    def set_viewer_defaults(self):
+        BitmapGridControl.set_viewer_defaults(self)
+        self.items_per_row = 256
+        self.zoom = 1
+        self.pyramid = None
+        self.overview_level = 0
+        self.overview_summary = "max"
+
+    def serialize_extra_to_dict(self, mdict):
+        BitmapGridControl.serialize_extra_to_dict(self, mdict)
+        mdict['overview_level'] = self.overview_level
+        mdict['overview_summary'] = self.overview_summary
+
+    def restore_extra_from_dict(self, e):
+        BitmapGridControl.restore_extra_from_dict(self, e)
+        if 'overview_level' in e:
+            self.overview_level = e['overview_level']
+        if 'overview_summary' in e:
+            self.overview_summary = e['overview_summary']
+
+    @property
+    def bitmap_renderer(self):
+        return self.segment_viewer.machine.page_renderer
+
+    def get_pyramid(self):
+        segment = self.segment_viewer.segment
+        if self.pyramid is None or not self.pyramid.is_source(segment.data, segment.style):
+            self.pyramid = MemoryMapPyramid(segment.data, segment.style)
+        else:
+            self.pyramid.sync()
+        return self.pyramid
+
+    def calc_default_table(self):
+        pyramid = self.get_pyramid()
+        self.overview_level = max(0, min(self.overview_level, pyramid.num_levels - 1))
+        self.row_cache.invalidate()
+        return MemoryMapOverviewTable(self.caret_handler, self.items_per_row, pyramid, self.overview_level, self.overview_summary)
+
+    def get_fit_level(self):
+        pyramid = self.get_pyramid()
+        num_rows = max(1, self.main.GetClientSize()[1] / max(1, self.zoom_h * self.scale_height))
+        return pyramid.get_fit_level(self.items_per_row, num_rows)
+
+    def get_extra_actions(self):
+        actions = [None, va.ViewerWidthAction, va.ViewerZoomAction, None, va.MemoryMapOverviewAction, va.MemoryMapFitOverviewAction]
+        return actions
+
+
 class MemoryMapViewer(BitmapViewer):
     name = "memmap"
 
     pretty_name = "Memory Page Map"
+
+    control_cls = MemoryMapGridControl
+
+    has_colors = False
+
+    width_text = "memory map width in bytes"
+
+    zoom_text = "memory map zoom factor"
+
+    has_overview = True
+
+    overview_text = "overview level (each level summarizes 4x as many bytes per pixel)"
+
+    @property
+    def window_title(self):
+        level = self.control.overview_level
+        if level > 0:
+            return "%s (%d bytes per pixel, %s)" % (self.machine.page_renderer.name, self.control.pyramid.block_size(level), self.control.overview_summary)
+        return self.machine.page_renderer.name
+
+    @property
+    def overview_level(self):
+        return self.control.overview_level
+
+    def set_overview_level(self, level, summary=None):
+        self.control.overview_level = level
+        if summary is not None:
+            self.control.overview_summary = summary
+        wx.CallAfter(self.control.recalc_view)
+        self.linked_base.editor.update_pane_names()
+
+    def fit_overview(self):
+        self.set_overview_level(self.control.get_fit_level())
+
+    @on_trait_change('linked_base.editor.document.byte_values_changed')
+    def byte_values_changed(self, index_range):
+        log.debug("byte_values_changed: %s index_range=%s" % (self, str(index_range)))
+        if index_range is not Undefined:
+            self.update_pyramid(index_range)
+
+    @on_trait_change('linked_base.editor.document.byte_style_changed')
+    def byte_style_changed(self, index_range):
+        log.debug("byte_style_changed: %s index_range=%s" % (self, str(index_range)))
+        if index_range is not Undefined:
+            self.update_pyramid(index_range)
+
+    def update_pyramid(self, index_range):
+        pyramid = self.control.pyramid
+        if pyramid is None:
+            return
+        if index_range is None:
+            pyramid.sync()
+        else:
+            # some commands include the last index in the range
+            start, end = index_range
+            pyramid.update(start, end + 1)
+
+    def refresh_view(self, flags):
+        # selections and search matches change the style bits without a
+        # command. Level zero shows the segment itself, but the summaries of
+        # the other levels have to be checked before they are drawn.
+        if self.control.overview_level > 0 and self.control.pyramid is not None:
+            self.control.pyramid.sync()
+        BitmapViewer.refresh_view(self, flags)
+
+    def validate_width(self, width):
+        return width
@@ -30,9 +30,7 @@ class AnticCharImageCache(cg.DrawTextImageCache):
         height = array.shape[0]
         if width > 0 and height > 0:
             array = intscale(array, parent.zoom_h, parent.zoom_w)
-            image = wx.Image(array.shape[1], array.shape[0])
-            image.SetData(array.tostring())
-            bmp = wx.Bitmap(image)
+            bmp = cg.numpy_to_bitmap(array)
             dc.DrawBitmap(bmp, rect.x, rect.y)
 
 
@@ -121,10 +119,7 @@ class AnticCharRenderer(cg.TableLineRenderer):
         height = array.shape[0]
         if width > 0 and height > 0:
             array = intscale(array, grid_control.zoom_h, grid_control.zoom_w)
-            #print("bitmap: %d,%d,3 after scaling: %s" % (height, width, str(array.shape)))
-            image = wx.Image(array.shape[1], array.shape[0])
-            image.SetData(array.tostring())
-            bmp = wx.Bitmap(image)
+            bmp = cg.numpy_to_bitmap(array)
             dc.DrawBitmap(bmp, frame_rect.x, frame_rect.y)
 
 
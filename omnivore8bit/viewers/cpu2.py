@@ -1,5 +1,7 @@
 import os
 import sys
+import codecs
+import cStringIO
 
 import numpy as np
 
@@ -16,8 +18,13 @@ from omnivore.utils.wx import compactgrid as cg
 
 from ..ui.segment_grid import SegmentGridControl, SegmentTable, SegmentGridTextCtrl
 from .hex2 import HexEditControl
-from ..arch.disasm import iter_disasm_styles
+from ..arch.disasm import iter_disasm_styles, DisassemblyWorker, FormattedRowCache
+from ..arch.listing import ListingWriter
+from ..arch.xref import xref_kind_names
+from ..arch.disasm_cache import DisassemblyCache
+from ..arch.disasm_batch import BatchDisassemblyRequest
 from ..utils import searchutil
+from ..utils.segmentutil import get_style_ranges
 from ..byte_edit.commands import SetCommentCommand
 from ..commands import SetIndexedDataCommand
 
@@ -40,6 +47,7 @@ class UdisFastTable(cg.HexTable):
         self.index_to_row = []
         self.end_addr = 0
         self.chunk_size = 256
+        self.row_cache = FormattedRowCache()
         self.set_display_format(linked_base.cached_preferences)
 
     def set_display_format(self, prefs):
@@ -175,6 +183,19 @@ class UdisFastTable(cg.HexTable):
         if line is None:
             line = self.lines[row]
             index = line.pc - self.start_addr
+
+        # rows are only formatted when they first become visible or after
+        # they have changed, not every time the grid is painted
+        cache = self.row_cache
+        cache.sync(self.disassembly)
+        key = (line.pc, line.num_bytes, col)
+        text = cache.get(key)
+        if text is None:
+            text = self.format_display_text(row, col, line, index)
+            cache[key] = text
+        return text
+
+    def format_display_text(self, row, col, line, index):
         if col == 0:
             if self.lines[row].flag == flag_origin:
                 text = ""
@@ -211,28 +232,33 @@ class DisassemblyGridControl(SegmentGridControl):
 
     def recalc_view(self):
         v = self.segment_viewer
-        v.restart_disassembly()
+        v.sync_disassembly()
         cg.CompactGrid.recalc_view(self)
         if v.is_tracing:
             v.update_trace_in_segment()
 
     def get_disassembled_text(self, start=0, end=-1):
+        self.table.disassembly.complete()
         return self.table.disassembly.get_disassembled_text(start, end)
 
     def encode_data(self, segment, linked_base):
         """Segment saver interface: take a segment and produce a byte
         representation to save to disk.
         """
-        lines = self.table.disassembly.get_disassembled_text()
-        text = os.linesep.join(lines) + os.linesep
-        data = text.encode("utf-8")
-        return data
+        # written a block at a time like the command line listings rather
+        # than building a list of every line first
+        fh = cStringIO.StringIO()
+        writer = ListingWriter(self.table.disassembly, codecs.getwriter("utf-8")(fh), newline=os.linesep)
+        writer.write_source()
+        return fh.getvalue()
 
     def extra_popup_actions(self, popup_data):
         actions = []
         addr_dest = self.table.disassembly.get_addr_dest(popup_data['row'], popup_data['col'])
         actions.extend(self.segment_viewer.linked_base.get_goto_actions_other_segments(addr_dest))
         actions.extend(self.segment_viewer.linked_base.get_goto_actions_same_byte(popup_data['index']))
+        index = popup_data['index']
+        actions.extend(self.segment_viewer.linked_base.get_goto_actions_referrers(index, self.segment_viewer.get_referrers(index)))
         return actions
 
     ##### editing
@@ -305,7 +331,7 @@ class CopyDisassemblyAction(EditorAction):
     def perform(self, event):
         e = self.active_editor
         s = e.segment
-        ranges = s.get_style_ranges(selected=True)
+        ranges = get_style_ranges(s, selected=True)
         lines = []
         try:
             for start, end in ranges:
@@ -334,7 +360,7 @@ class CopyDisassemblyCommentsAction(EditorAction):
     def perform(self, event):
         e = self.active_editor
         s = e.segment
-        ranges = s.get_style_ranges(selected=True)
+        ranges = get_style_ranges(s, selected=True)
         lines = []
         for start, end in ranges:
             for _, _, _, comment, _ in e.disassembly.table.disassembler.iter_row_text(start, end):
@@ -421,7 +447,7 @@ class DisassemblySearcher(searchutil.BaseSearcher):
     def __init__(self, viewer, panel):
         self.search_text = None
         self.matches = []
-        self.panel = panel
+        self.viewer = viewer
         self.pretty_name = viewer.machine.disassembler.name
 
     def __call__(self, editor, search_text):
@@ -440,7 +466,12 @@ class DisassemblySearcher(searchutil.BaseSearcher):
         return text
 
     def get_matches(self, editor):
-        matches = self.panel.search(self.search_text, editor.last_search_settings.get('match_case', False))
+        # the disassembly keeps its search index between searches, so this is
+        # fast enough to be repeated for each character typed in the
+        # minibuffer
+        settings = editor.last_search_settings
+        mode = "regex" if settings.get('regex', False) else "substring"
+        matches = self.viewer.current_disassembly.search(self.search_text, settings.get('match_case', False), mode)
         return matches
 
 
@@ -461,6 +492,19 @@ class DisassemblyViewer(SegmentViewer):
 
     current_disassembly_ = Any(None)
 
+    # Segments at least this big are disassembled in a background thread
+    background_disassembly_size = 0x8000
+
+    worker = Any(None)
+
+    # Config directory holding the disassembly results of previously seen
+    # segments
+    disassembly_cache_subdir = "disassembly_cache"
+
+    # Documents with at least this many segments have all their segments
+    # disassembled in worker processes when the disassembler is created
+    batch_disassembly_segments = 4
+
     trace = Instance(TraceInfo)
 
     # trait defaults
@@ -490,12 +534,21 @@ class DisassemblyViewer(SegmentViewer):
     def byte_values_changed(self, index_range):
         log.debug("byte_values_changed: %s index_range=%s" % (self, str(index_range)))
         if index_range is not Undefined:
-            self.restart_disassembly(index_range)
+            self.process_segment_change(index_range)
 
     @on_trait_change('linked_base.editor.document.byte_style_changed')
     def byte_style_changed(self, index_range):
         log.debug("byte_style_changed: %s index_range=%s" % (self, str(index_range)))
         if index_range is not Undefined:
+            self.process_segment_change(index_range)
+
+    def process_segment_change(self, index_range):
+        if index_range is None:
+            # commands like SetLabelCommand don't report a range, but the
+            # changed bytes, styles and labels are found by comparing to the
+            # last disassembly
+            self.sync_disassembly()
+        else:
             self.restart_disassembly(index_range)
 
     def recalc_data_model(self):
@@ -504,26 +557,160 @@ class DisassemblyViewer(SegmentViewer):
 
     ##### UdisFast interface
 
-    def create_disassembler(self):
+    def create_disassembler(self, segment=None):
+        if segment is None:
+            segment = self.segment
         prefs = self.linked_base.cached_preferences
-        d = self.machine.get_disassembler(prefs.hex_grid_lower_case, prefs.assembly_lower_case, self.document.document_memory_map, self.segment.memory_map)
+        d = self.machine.get_disassembler(prefs.hex_grid_lower_case, prefs.assembly_lower_case, self.document.document_memory_map, segment.memory_map)
         for i, name in iter_disasm_styles():
             d.add_chunk_processor(name, i)
+        d.cache = self.get_disassembly_cache()
+        d.batch_results = self.linked_base.disassembly_results
         return d
 
+    def get_disassembly_cache(self):
+        try:
+            app = self.linked_base.editor.window.application
+            dirname = app.get_config_dir(self.disassembly_cache_subdir)
+        except (AttributeError, OSError), e:
+            log.warning("Disassembly cache not available: %s" % e)
+            return None
+        return DisassemblyCache.get_cache(dirname)
+
     @property
     def current_disassembly(self):
         if self.current_disassembly_ is None:
             d = self.create_disassembler()
             self.current_disassembly_ = d
+            if len(self.document.segments) >= self.batch_disassembly_segments:
+                # the segments of a disk image are independent, so they are
+                # all disassembled at once by a pool of processes rather
+                # than one at a time as they are viewed. The linked base
+                # only runs the batch once for each version of the data.
+                self.start_batch_disassembly()
         return self.current_disassembly_
 
     def clear_disassembly(self):
         self.current_disassembly_ = None
 
     def restart_disassembly(self, index=None):
-        self.current_disassembly.disassemble_segment(self.segment)
-        self.control.table.update_disassembly(self.segment, self.current_disassembly)
+        d = self.current_disassembly
+        if index is None:
+            if len(self.segment) >= self.background_disassembly_size:
+                # placeholder rows are shown until the worker fills them in,
+                # starting with the rows that are visible
+                d.start_disassembly(self.segment, self.get_visible_index_range)
+            else:
+                d.disassemble_segment(self.segment)
+        else:
+            # bytes have changed, so only the area around the changes needs
+            # to be disassembled again
+            start, end = index
+            d.update_segment_range(self.segment, start, end)
+        self.control.table.update_disassembly(self.segment, d)
+        self.schedule_disassembly()
+        self.linked_base.disassembly_changed_event = True
+
+    def sync_disassembly(self):
+        """Bring the disassembly up to date without knowing what has
+        changed, only disassembling the areas around any changes if the
+        disassembler is still showing the same segment
+        """
+        d = self.current_disassembly
+        if d.info is None or not d.is_current(self.segment):
+            self.restart_disassembly()
+            return
+        d.update_segment(self.segment)
+        self.control.table.update_disassembly(self.segment, d)
+        self.schedule_disassembly()
+        self.linked_base.disassembly_changed_event = True
+
+    def get_visible_index_range(self):
+        c = self.control
+        if c is None:
+            return 0, 0
+        _, first_row = c.GetViewStart()
+        start, _ = c.table.get_index_range(first_row, 0)
+        _, end = c.table.get_index_range(first_row + c.main.visible_rows, 0)
+        return start, end
+
+    ##### background disassembly
+
+    def schedule_disassembly(self):
+        d = self.current_disassembly
+        if d.progress is None:
+            return
+        if self.worker is None or self.worker.source is not d:
+            # the disassembler has been replaced, so the worker needs a copy
+            # of the new one
+            if self.worker is not None:
+                self.worker.stop()
+            self.worker = DisassemblyWorker(d, self.disassembly_request_finished)
+        request = d.progress.next_request()
+        if request is not None:
+            self.worker.send_request(request)
+
+    def start_batch_disassembly(self):
+        request = self.linked_base.get_batch_disassembly_request(self.create_disassembler)
+        if request is not None:
+            # the pool of processes is waited for in a worker thread of its
+            # own, so neither the GUI nor the progressive disassembly of this
+            # segment is held up. The thread exits after the batch.
+            worker = DisassemblyWorker(self.current_disassembly, self.disassembly_request_finished)
+            worker.send_request(request)
+            worker.stop()
+
+    def disassembly_request_finished(self, request):
+        # called from the worker thread
+        wx.CallAfter(self.process_disassembly_request, request)
+
+    def process_disassembly_request(self, request):
+        if isinstance(request, BatchDisassemblyRequest):
+            self.linked_base.set_batch_disassembly_results(request)
+            return
+        c = self.control
+        if c is None:
+            return
+        d = self.current_disassembly
+        if d.apply_progress(request):
+            # keep the same bytes at the top of the view as the rows change
+            sx, sy = c.GetViewStart()
+            first_index, _ = c.table.get_index_range(sy, 0)
+            c.table.update_disassembly(self.segment, d)
+            cg.CompactGrid.recalc_view(c)
+            row, _ = c.table.index_to_row_col(first_index)
+            c.move_viewport_origin((row, sx))
+            c.refresh_view()
+            self.linked_base.disassembly_changed_event = True
+        self.schedule_disassembly()
+
+    def stop_disassembly(self):
+        if self.worker is not None:
+            self.worker.stop()
+            self.worker = None
+
+    def prepare_for_destroy(self):
+        self.stop_disassembly()
+        if self.current_disassembly_ is not None:
+            self.current_disassembly_.cancel_progress()
+        SegmentViewer.prepare_for_destroy(self)
+
+    def get_referrers(self, index):
+        """Return a list of (index, description) of the rows of the
+        disassembly that refer to the address at index
+        """
+        d = self.current_disassembly
+        s = self.segment
+        if not s.is_valid_index(index) or d.info is None:
+            return []
+        referrers = []
+        for ref_index, kind in d.get_referrers(s.start_addr + index):
+            if s.is_valid_index(ref_index):
+                text = d.format_instruction(ref_index, d.info[d.info.index_to_row[ref_index]]).strip()
+            else:
+                text = ""
+            referrers.append((ref_index, "%-5s %s" % (xref_kind_names[kind], text)))
+        return referrers
 
     ##### disassembly tracing
 
@@ -268,6 +268,131 @@ class CommentsViewer(BaseInfoViewer):
         return len(self.control.items)
 
 
+XrefItem = namedtuple('XrefItem', ('index', 'label'))
+
+class XrefsPanel(wx.VListBox):
+    """List of the rows of the disassembly that refer to the address at the
+    caret
+    """
+    def __init__(self, parent, **kwargs):
+        self.items = []
+        self.target_index = -1
+        wx.VListBox.__init__(self, parent, wx.ID_ANY, **kwargs)
+        self.Bind(wx.EVT_LEFT_DOWN, self.on_click)
+        _, self.font_height = self.GetTextExtent("MWSqj")
+        self.select_color = wx.SystemSettings.GetColour(wx.SYS_COLOUR_HIGHLIGHTTEXT)
+        self.normal_color = self.GetForegroundColour()
+
+    def OnDrawItem(self, dc, rect, n):
+        if self.GetSelection() == n:
+            dc.SetTextForeground(self.select_color)
+        else:
+            dc.SetTextForeground(self.normal_color)
+        dc.DrawLabel(self.items[n].label, rect, wx.ALIGN_LEFT | wx.ALIGN_CENTER_VERTICAL)
+
+    def OnMeasureItem(self, n):
+        return self.font_height + 2
+
+    def on_click(self, evt):
+        index = self.HitTest(evt.GetPosition())
+        if index >= 0:
+            self.SetSelection(index)
+            self.segment_viewer.sync_caret_to_index(self.items[index].index)
+            self.Refresh()
+        evt.Skip()
+
+    def is_listed(self, index):
+        for item in self.items:
+            if item.index == index:
+                return True
+        return False
+
+    def set_target(self, index):
+        v = self.segment_viewer
+        self.target_index = index
+        referrers = v.get_referrers(index)
+        if referrers:
+            title = "References to $%04x:" % (v.segment.start_addr + index)
+        else:
+            title = "No references to $%04x" % (v.segment.start_addr + index)
+        self.items = [XrefItem(index, title)]
+        for ref_index, desc in referrers:
+            self.items.append(XrefItem(ref_index, "  $%04x %s" % (v.segment.start_addr + ref_index, desc)))
+        self.SetItemCount(len(self.items))
+
+    def recalc_view(self):
+        index = self.segment_viewer.linked_base.carets.current.index
+        if index != self.target_index and not self.is_listed(index):
+            self.set_target(index)
+
+    def rebuild(self):
+        # the references to the same target may have changed
+        if self.target_index < 0:
+            self.recalc_view()
+        else:
+            self.set_target(self.target_index)
+
+    def refresh_view(self):
+        self.Refresh()
+
+
+class XrefsViewer(BaseInfoViewer):
+    name = "xrefs"
+
+    pretty_name = "References"
+
+    @classmethod
+    def create_control(cls, parent, linked_base, mdict):
+        return XrefsPanel(parent, size=(100,500))
+
+    @property
+    def disassembly_viewer(self):
+        for v in self.linked_base.editor.viewers:
+            if v.linked_base == self.linked_base and hasattr(v, "get_referrers"):
+                return v
+        return None
+
+    def get_referrers(self, index):
+        v = self.disassembly_viewer
+        if v is None:
+            return []
+        return v.get_referrers(index)
+
+    def sync_caret(self, flags):
+        # moving to one of the listed rows keeps the current list
+        self.control.recalc_view()
+        self.control.refresh_view()
+
+    def show_caret(self, control, index, bit):
+        pass
+
+    @on_trait_change('linked_base.editor.document.byte_values_changed')
+    def byte_values_changed(self, index_range):
+        if index_range is not Undefined:
+            self.update_references()
+
+    @on_trait_change('linked_base.editor.document.byte_style_changed')
+    def byte_style_changed(self, index_range):
+        if index_range is not Undefined:
+            self.update_references()
+
+    @on_trait_change('linked_base.disassembly_changed_event')
+    def process_disassembly_change(self, evt):
+        if evt is not Undefined:
+            self.update_references()
+
+    def update_references(self):
+        if self.control is not None:
+            self.control.rebuild()
+            self.control.refresh_view()
+
+    def recalc_data_model(self):
+        # the references may have changed even if the caret hasn't moved
+        self.control.target_index = -1
+        self.control.items = []
+        BaseInfoViewer.recalc_data_model(self)
+
+
 class UndoViewer(BaseInfoViewer):
     name = "undo"
 
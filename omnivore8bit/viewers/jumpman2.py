@@ -7,14 +7,13 @@ from atrcopy import SegmentData, DefaultSegment, selected_bit_mask, comment_bit_
 
 from traits.api import on_trait_change, Bool, Undefined, Int, Str, Dict, Any
 
-from omnivore.utils.nputil import intscale
 from omnivore.utils.wx import compactgrid as cg
 from omnivore.templates import get_template
 
 from ..ui.segment_grid import SegmentGridControl, SegmentTable
 from ..ui.info_panels import InfoPanel
 from ..arch.machine import Machine
-from ..arch.antic_renderers import BaseRenderer
+from ..arch.antic_renderers import JumpmanPlayfieldRenderer
 from ..arch.colors import powerup_colors
 from ..jumpman import parser as ju
 from ..jumpman import playfield as jp
@@ -32,41 +31,6 @@ log = logging.getLogger(__name__)
 drawlog = logging.getLogger("refresh")
 
 
-class JumpmanPlayfieldRenderer(BaseRenderer):
-    """ Custom renderer instead of Antic Mode D renderer. Need to display
-    highlighting on a per-pixel level which isn't possible with the Mode D
-    renderer because the styling info is applied at the byte level and there
-    are 4 pixels per byte in Mode D.
-
-    So this renderer is one byte per pixel, but only uses the first 16 colors.
-    It is mapped to the ANTIC color register order, so the first 4 colors are
-    player colors, then the 5 playfield colors. A blank screen corresponds to
-    the index value of 8, so the last playfield color.
-    """
-    name = "Jumpman 1 Byte Per Pixel"
-    pixels_per_byte = 1
-    bitplanes = 1
-
-    def get_image(self, segment_viewer, bytes_per_row, nr, count, pixels, style):
-        normal = style == 0
-        highlight = (style & selected_bit_mask) == selected_bit_mask
-        comment = (style & comment_bit_mask) == comment_bit_mask
-        data = (style & user_bit_mask) > 0
-        match = (style & match_bit_mask) == match_bit_mask
-
-        color_registers, h_colors, m_colors, c_colors, d_colors = self.get_colors(segment_viewer, range(32))
-        bitimage = np.empty((nr * bytes_per_row, 3), dtype=np.uint8)
-        for i in range(32):
-            color_is_set = (pixels == i)
-            bitimage[color_is_set & normal] = color_registers[i]
-            bitimage[color_is_set & comment] = c_colors[i]
-            bitimage[color_is_set & match] = m_colors[i]
-            bitimage[color_is_set & data] = d_colors[i]
-            bitimage[color_is_set & highlight] = h_colors[i]
-        bitimage[count:,:] = segment_viewer.preferences.empty_background_color[0:3]
-        return bitimage.reshape((nr, bytes_per_row, 3))
-
-
 class JumpmanFrameRenderer(BitmapLineRenderer):
     def draw_grid(self, grid_control, dc, first_row, visible_rows, first_cell, visible_cells):
         model = grid_control.model
@@ -87,19 +51,17 @@ class JumpmanFrameRenderer(BitmapLineRenderer):
         style = model.style[first_index:last_index]
         drawlog.debug("draw_grid: first_index:%d last_index:%d" % (first_index, last_index))
 
-        array = grid_control.bitmap_renderer.get_image(grid_control.segment_viewer, bytes_per_row, last_row - first_row, last_index - first_index, data, style)
-        width = array.shape[1]
-        height = array.shape[0]
+        renderer = grid_control.bitmap_renderer
+        pixels, style_classes = renderer.get_index_image(grid_control.segment_viewer, bytes_per_row, last_row - first_row, last_index - first_index, data, style)
+        height, width = pixels.shape
         drawlog.debug("Calculated image: %dx%d" % (width, height))
         if width > 0 and height > 0:
-            # image returned will have the correct number of rows but will be
-            # 160 pixels wide; need to crop to visible columns
-            cropped = array[:,first_col:last_col,:]
-            array = intscale(cropped, grid_control.zoom_h, grid_control.zoom_w)
-            #print("bitmap: %d,%d,3 after scaling: %s" % (height, width, str(array.shape)))
-            image = wx.Image(array.shape[1], array.shape[0])
-            image.SetData(array.tostring())
-            bmp = wx.Bitmap(image)
+            # pixels will have the correct number of rows but will be 160
+            # pixels wide; crop to visible columns before the palette lookup
+            # so only visible pixels are converted and zoomed
+            palette = renderer.get_palette(grid_control.segment_viewer)
+            array = renderer.get_rgb_image(palette, pixels[:,first_col:last_col], style_classes[:,first_col:last_col], grid_control.zoom_h, grid_control.zoom_w)
+            bmp = cg.numpy_to_bitmap(array)
             dc.SetClippingRegion(frame_rect)
             dc.DrawBitmap(bmp, frame_rect.x, frame_rect.y)
 
@@ -23,10 +23,22 @@ cmdclass = {
     "build_ext": build_ext,
     }
 
+if sys.platform.startswith("win"):
+    openmp_compile_args = ["/openmp"]
+    openmp_link_args = []
+elif sys.platform == "darwin":
+    openmp_compile_args = []
+    openmp_link_args = []
+else:
+    openmp_compile_args = ["-fopenmp"]
+    openmp_link_args = ["-fopenmp"]
+
 ext_modules = [
     Extension("omnivore8bit.arch.antic_speedups",
               sources=["omnivore8bit/arch/antic_speedups.pyx"],
               include_dirs=[numpy.get_include()],
+              extra_compile_args=openmp_compile_args,
+              extra_link_args=openmp_link_args,
               )
     ]
 
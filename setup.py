@@ -23,6 +23,19 @@ if sys.platform.startswith("win"):
 else:
     udis_compile_args = []
 
+# The renderer kernels split rows across cores using OpenMP. Apple's compiler
+# doesn't support it, so the kernels run on a single core (still without the
+# GIL) there.
+if sys.platform.startswith("win"):
+    openmp_compile_args = ["/openmp"]
+    openmp_link_args = []
+elif sys.platform == "darwin":
+    openmp_compile_args = []
+    openmp_link_args = []
+else:
+    openmp_compile_args = ["-fopenmp"]
+    openmp_link_args = ["-fopenmp"]
+
 ext_modules = [
     Extension("traits.ctraits",
               sources = ["traits/ctraits.c"],
@@ -30,7 +43,8 @@ ext_modules = [
               ),
     Extension("omnivore8bit.arch.antic_speedups",
               sources=["omnivore8bit/arch/antic_speedups.c"],
-              extra_compile_args = ["-O3" ],
+              extra_compile_args = ["-O3" ] + openmp_compile_args,
+              extra_link_args = openmp_link_args,
               ),
     Extension("udis.udis_fast.disasm_info",
               sources = ["udis/udis_fast/disasm_info.c"],
@@ -371,7 +385,7 @@ if 'nsis' not in sys.argv:
                   'null = pyface.ui.null.init:toolkit_object',
               ],
         },
-        scripts = ['scripts/omnivore'],
+        scripts = ['scripts/omnivore', 'scripts/omnivore-render'],
         app=["run.py"],
         windows=[dict(
             script="run.py",
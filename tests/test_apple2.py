@@ -0,0 +1,102 @@
+import numpy as np
+import pytest
+
+from omnivore8bit.arch import antic_renderers as ar
+from omnivore8bit.utils.renderutil import HeadlessViewer
+
+
+def screen_offset(y):
+    # From Apple Graphics and Arcade Game Design
+    a = y // 64
+    d = y - (64 * a)
+    b = d // 8
+    c = d - 8 * b
+    return (1024 * c) + (128 * b) + (40 * a)
+
+
+def artifact_pixels(row):
+    """Per-pixel version of the artifacting rules for a single row of bytes
+    """
+    bits = []
+    palettes = []
+    for b in row:
+        for i in range(7):
+            bits.append((b >> i) & 1)
+            palettes.append(b >> 7)
+    pixels = []
+    for x, bit in enumerate(bits):
+        left = bits[x - 1] if x > 0 else 0
+        right = bits[x + 1] if x < len(bits) - 1 else 0
+        if bit:
+            if left or right:
+                c = ar.apple2_artifact_white
+            else:
+                c = ar.apple2_artifact_color + palettes[x] * 2 + (x & 1)
+        elif left and right:
+            c = ar.apple2_artifact_color + palettes[x] * 2 + ((x + 1) & 1)
+        else:
+            c = ar.apple2_artifact_black
+        pixels.append(c)
+    return pixels
+
+
+class TestApple2(object):
+    def setup(self):
+        np.random.seed(2345)
+        self.viewer = HeadlessViewer()
+
+    def test_screen_index(self):
+        index = ar.apple2_screen_index.reshape((192, 40))
+        for y in range(192):
+            assert np.array_equal(index[y], np.arange(40) + screen_offset(y))
+        assert len(np.unique(index)) == 192 * 40
+
+    def test_full_screen(self):
+        r = ar.OneBitPerPixelApple2FullScreen()
+        page = np.random.randint(0, 256, 0x2000).astype(np.uint8)
+        style = np.zeros(0x2000, dtype=np.uint8)
+        style[0x400:0x428] = 0x80
+        pixels, style_classes = r.get_index_image(self.viewer, 40, 192, len(page), page, style)
+        assert pixels.shape == (192, 280)
+        assert np.array_equal(pixels[1], ar.apple2_pixel_lut[page[0x400:0x428]].ravel())
+        assert np.all(style_classes[1] == ar.highlight_style_class)
+        assert np.all(style_classes[0] == ar.normal_style_class)
+
+    def test_full_screen_partial(self):
+        r = ar.OneBitPerPixelApple2FullScreen()
+        page = np.random.randint(0, 256, 0x1000).astype(np.uint8)
+        style = np.zeros(0x1000, dtype=np.uint8)
+        pixels, style_classes = r.get_index_image(self.viewer, 40, 192, len(page), page, style)
+        empty = (style_classes == ar.empty_style_class)[:,::7].ravel()
+        assert np.array_equal(empty, ar.apple2_screen_index >= 0x1000)
+
+    @pytest.mark.parametrize("bytes_per_row", [2, 7, 40])
+    def test_artifacting(self, bytes_per_row):
+        r = ar.OneBitPerPixelApple2Artifacting()
+        nr = 5
+        data = np.random.randint(0, 256, nr * bytes_per_row).astype(np.uint8)
+        style = np.zeros(len(data), dtype=np.uint8)
+        pixels, style_classes = r.get_index_image(self.viewer, bytes_per_row, nr, len(data), data, style)
+        for y in range(nr):
+            row = data[y * bytes_per_row:(y + 1) * bytes_per_row]
+            assert list(pixels[y]) == artifact_pixels(row)
+
+    @pytest.mark.parametrize("row,color", [
+        ([0x2a, 0x55], (32, 192, 0)),
+        ([0x55, 0x2a], (159, 0, 253)),
+        ([0xaa, 0xd5], (240, 80, 0)),
+        ([0xd5, 0xaa], (0, 128, 255)),
+        ([0x7f, 0x7f], (255, 255, 255)),
+        ([0x80, 0x80], (0, 0, 0)),
+    ])
+    def test_artifact_colors(self, row, color):
+        r = ar.OneBitPerPixelApple2Artifacting()
+        data = np.asarray(row, dtype=np.uint8)
+        image = r.get_image(self.viewer, 2, 1, 2, data, np.zeros(2, dtype=np.uint8))
+        assert np.all(image[0,1:13] == color)
+
+
+if __name__ == "__main__":
+    t = TestApple2()
+    t.setup()
+    t.test_artifacting(7)
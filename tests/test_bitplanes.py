@@ -0,0 +1,38 @@
+import numpy as np
+import pytest
+
+from omnivore8bit.arch import antic_renderers as ar
+
+
+bitplane_renderers = [
+    ar.TwoBitPlanesLE, ar.TwoBitPlanesBE, ar.TwoBitPlanesLineLE, ar.TwoBitPlanesLineBE,
+    ar.ThreeBitPlanesLE, ar.ThreeBitPlanesBE, ar.ThreeBitPlanesLineLE, ar.ThreeBitPlanesLineBE,
+    ar.FourBitPlanesLE, ar.FourBitPlanesBE, ar.FourBitPlanesLineLE, ar.FourBitPlanesLineBE,
+]
+
+
+class TestBitplaneLookup(object):
+    def setup(self):
+        np.random.seed(1234)
+
+    @pytest.mark.parametrize("renderer_cls", bitplane_renderers)
+    @pytest.mark.parametrize("groups_per_row", [1, 2, 5])
+    def test_lut_matches_per_pixel(self, renderer_cls, groups_per_row):
+        r = renderer_cls()
+        bytes_per_row = r.validate_bytes_per_row(groups_per_row * r.bitplanes)
+        nr = 7
+        data = np.random.randint(0, 256, nr * bytes_per_row).astype(np.uint8)
+        pixels_per_row = 8 * bytes_per_row / r.bitplanes
+
+        bits = np.unpackbits(data).reshape((-1, 8))
+        expected = np.empty((nr * bytes_per_row / r.bitplanes, 8), dtype=np.uint8)
+        r.get_bitplane_pixels(bits, expected, bytes_per_row, pixels_per_row)
+
+        pixels = r.get_bitplane_pixels_lut(data, bytes_per_row, nr)
+        assert np.array_equal(pixels, expected)
+
+
+if __name__ == "__main__":
+    t = TestBitplaneLookup()
+    t.setup()
+    t.test_lut_matches_per_pixel(ar.FourBitPlanesLineBE, 2)
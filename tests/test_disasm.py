@@ -8,6 +8,9 @@ from mock import MockHexEditor
 
 from omnivore.utils.file_guess import FileGuess
 from omnivore8bit.arch.disasm import *
+from omnivore8bit.arch.memory_map import EmptyMemoryMap
+from omnivore8bit.arch.disasm_cache import get_key
+from omnivore8bit.arch.disasm_batch import disassemble_segments, get_snapshots, BatchDisassemblyRequest
 
 from atrcopy import SegmentData, DefaultSegment
 
@@ -231,6 +234,484 @@ class TestSmall(object):
             last_expected = expected
 
 
+def check_same_disassembly(d, full, size):
+    assert d.info.num_instructions == full.info.num_instructions
+    for row in range(full.info.num_instructions):
+        a = d.info[row]
+        b = full.info[row]
+        assert (a.pc, a.num_bytes, a.flag, a.dest_pc, a.instruction) == (b.pc, b.num_bytes, b.flag, b.dest_pc, b.instruction)
+    assert np.array_equal(d.info.index_to_row[0:size], full.info.index_to_row[0:size])
+    assert np.array_equal(np.asarray(d.info.labels) > 0, np.asarray(full.info.labels) > 0)
+    assert d.pc_label_cache == full.pc_label_cache
+    assert d.dest_pc_label_cache == full.dest_pc_label_cache
+    assert d.computed_directive_cache == full.computed_directive_cache
+    assert d.xrefs == full.xrefs
+
+
+class TestIncremental(object):
+    def get_disasm(self):
+        disasm = Basic6502Disassembler()
+        disasm.add_chunk_processor("data", 1)
+        disasm.add_chunk_processor("antic_dl", 2)
+        return disasm
+
+    def setup(self):
+        np.random.seed(9876)
+        self.editor = MockHexEditor()
+        guess = FileGuess("../test_data/pytest.atr")
+        self.editor.load(guess)
+        self.editor.find_segment("02: robots I")
+        self.segment = self.editor.segment
+        self.disasm = self.get_disasm()
+        self.disasm.disassemble_segment(self.segment)
+
+    def check(self):
+        full = self.get_disasm()
+        full.disassemble_segment(self.segment)
+        check_same_disassembly(self.disasm, full, len(self.segment))
+
+    @pytest.mark.parametrize("window", [8, 256])
+    def test_byte_edits(self, window):
+        s = self.segment
+        self.disasm.resync_window = window
+        self.disasm.pc_label_cache
+        self.disasm.computed_directive_cache
+        self.disasm.xrefs
+        for i in range(20):
+            start = np.random.randint(0, len(s) - 8)
+            end = start + np.random.randint(1, 8)
+            s.data[start:end] = np.random.randint(0, 256, end - start)
+            self.disasm.update_segment(s)
+            self.check()
+
+    def test_style_edits(self):
+        s = self.segment
+        for i in range(20):
+            start = np.random.randint(0, len(s) - 32)
+            end = start + np.random.randint(1, 32)
+            s.style[start:end] = (s.style[start:end] & ~user_bit_mask) | np.random.randint(0, 3)
+            self.disasm.update_segment(s)
+            self.check()
+
+    def test_no_change(self):
+        info = self.disasm.info
+        assert self.disasm.update_segment(self.segment) is info
+
+
+    def test_referrers(self):
+        d = self.disasm
+        for line in d.info:
+            if line.flag & udis_fast.flag_label and line.instruction.lower().startswith("jsr"):
+                break
+        refs = d.get_referrers(line.dest_pc)
+        assert (line.pc - d.start_addr, xref_call) in refs
+
+class TestProgressive(object):
+    def get_disasm(self):
+        disasm = Basic6502Disassembler()
+        disasm.add_chunk_processor("data", 1)
+        disasm.add_chunk_processor("antic_dl", 2)
+        return disasm
+
+    def setup(self):
+        np.random.seed(5432)
+        self.editor = MockHexEditor()
+        guess = FileGuess("../test_data/pytest.atr")
+        self.editor.load(guess)
+        self.editor.find_segment("02: robots I")
+        self.segment = self.editor.segment
+        self.disasm = self.get_disasm()
+        self.visible = [0, 1]
+
+    def get_visible(self):
+        return self.visible
+
+    def run(self, disasm):
+        while not disasm.is_complete:
+            request = disasm.progress.next_request()
+            request.process(disasm)
+            disasm.apply_progress(request)
+
+    def check(self):
+        full = self.get_disasm()
+        full.disassemble_segment(self.segment)
+        check_same_disassembly(self.disasm, full, len(self.segment))
+        assert self.disasm.get_disassembled_text() == full.get_disassembled_text()
+
+    @pytest.mark.parametrize("block_size", [0x40, 0x400])
+    def test_visible_first(self, block_size):
+        s = self.segment
+        d = self.disasm
+        d.start_disassembly(s, self.get_visible)
+        d.progress.block_size = block_size
+        with pytest.raises(IndexError):
+            d.get_disassembled_text(0, 16)
+        for i in range(20):
+            start = np.random.randint(0, len(s))
+            self.visible = [start, start + 64]
+            request = d.progress.next_request()
+            request.process(d)
+            d.apply_progress(request)
+            if d.is_complete:
+                break
+            assert not d.info.is_placeholder(request.start)
+        self.run(d)
+        self.check()
+
+    def test_edit_while_running(self):
+        s = self.segment
+        d = self.disasm
+        d.start_disassembly(s, self.get_visible)
+        request = d.progress.next_request()
+        s.data[10:20] = np.random.randint(0, 256, 10)
+        d.update_segment(s)
+        request.process(d)
+        assert not d.apply_progress(request)
+        self.run(d)
+        self.check()
+
+    def test_complete(self):
+        d = self.disasm
+        d.start_disassembly(self.segment)
+        d.complete()
+        assert d.is_complete
+        # the whole segment is disassembled again rather than filling in the
+        # placeholder rows
+        assert not isinstance(d.info, SplicedDisassemblyInfo)
+        self.check()
+
+    def start_partial(self):
+        d = self.disasm
+        d.start_disassembly(self.segment, self.get_visible)
+        d.progress.block_size = 0x100
+        request = d.progress.next_request()
+        request.process(d)
+        d.apply_progress(request)
+        return d
+
+    def test_xrefs_while_running(self):
+        d = self.start_partial()
+        count = len(d.xrefs)
+        assert not d.is_complete
+        self.run(d)
+        full = self.get_disasm()
+        full.disassemble_segment(self.segment)
+        assert len(d.xrefs) == len(full.xrefs) > count
+
+    def test_search_while_running(self):
+        d = self.start_partial()
+        matches = d.search("lda")
+        assert not d.is_complete
+        assert d.search("...") == []
+        assert all(not d.info.is_placeholder(start) for start, end in matches)
+        self.run(d)
+        full = self.get_disasm()
+        full.disassemble_segment(self.segment)
+        assert len(d.search("lda")) == len(full.search("lda")) > len(matches)
+
+
+class TestLabelCaches(object):
+    def get_disasm(self, memory_map=None):
+        disasm = Basic6502Disassembler(memory_map=memory_map)
+        disasm.add_chunk_processor("data", 1)
+        disasm.add_chunk_processor("antic_dl", 2)
+        return disasm
+
+    def setup(self):
+        np.random.seed(2468)
+        self.editor = MockHexEditor()
+        guess = FileGuess("../test_data/pytest.atr")
+        self.editor.load(guess)
+        self.editor.find_segment("02: robots I")
+        self.segment = self.editor.segment
+        self.disasm = self.get_disasm()
+        self.disasm.disassemble_segment(self.segment)
+        self.disasm.pc_label_cache
+        self.disasm.computed_directive_cache
+
+    def check(self):
+        mmap = type("LabelMap", (EmptyMemoryMap,), {"rmemmap": dict(self.segment.memory_map)})
+        full = self.get_disasm(mmap)
+        full.disassemble_segment(self.segment)
+        check_same_disassembly(self.disasm, full, len(self.segment))
+
+    def test_cache(self):
+        cache = PcTextCache(0x1000, 16)
+        cache[0x1004] = "a"
+        cache[0x1008] = "b"
+        assert len(cache) == 2
+        assert cache == {0x1004: "a", 0x1008: "b"}
+        assert cache.pop(0x1004) == "a"
+        assert cache.get(0x1004) is None
+        cache.clear_range(0x1000, 0x1010)
+        assert len(cache) == 0
+
+    def test_labels(self):
+        s = self.segment
+        pcs = s.start_addr + np.random.randint(0, len(s), 20)
+        for i, pc in enumerate(pcs):
+            s.memory_map[pc] = "LABEL%d" % i
+            self.disasm.update_segment(s)
+            self.check()
+        for pc in pcs[::2]:
+            s.memory_map.pop(pc, None)
+        self.disasm.update_segment(s)
+        self.check()
+
+    def test_machine_labels(self):
+        s = self.segment
+        pc = s.start_addr + 10
+        mmap = type("MachineMap", (EmptyMemoryMap,), {"rmemmap": {pc: "HWREG"}})
+        d = self.get_disasm(mmap)
+        d.disassemble_segment(s)
+        s.memory_map[pc] = "LABEL"
+        d.update_segment(s)
+        assert d.memory_map.get_name(pc) == "LABEL"
+        s.memory_map.pop(pc)
+        d.update_segment(s)
+        assert d.memory_map.get_name(pc) == "HWREG"
+        assert mmap.rmemmap == {pc: "HWREG"}
+
+    def test_selection_only(self):
+        s = self.segment
+        info = self.disasm.info
+        s.style[0:100] |= selected_bit_mask
+        assert self.disasm.update_segment(s) is info
+        self.check()
+
+
+class TestBatch(object):
+    def get_disasm(self):
+        disasm = Basic6502Disassembler()
+        disasm.add_chunk_processor("data", 1)
+        disasm.add_chunk_processor("antic_dl", 2)
+        return disasm
+
+    def setup(self):
+        np.random.seed(2468)
+        self.editor = MockHexEditor()
+        guess = FileGuess("../test_data/pytest.atr")
+        self.editor.load(guess)
+        self.segments = list(self.editor.document.segments)
+        r = self.segments[0].rawdata
+        order = np.random.permutation(len(r))[0:0x800]
+        self.segments.append(DefaultSegment(r.get_indexed(order), 0x6000))
+
+    @pytest.mark.parametrize("processes", [1, 2])
+    def test_batch(self, processes):
+        found = set()
+        for segment, info, error in disassemble_segments(self.get_disasm(), self.segments, processes):
+            assert error is None
+            found.add(id(segment))
+            d = self.get_disasm()
+            d.set_segment(segment)
+            d.info = info
+            full = self.get_disasm()
+            full.disassemble_segment(segment)
+            check_same_disassembly(d, full, len(segment))
+        assert found == set(id(s) for s in self.segments)
+
+    def test_batch_results(self):
+        results = {}
+        for segment, info, error in disassemble_segments(self.get_disasm(), self.segments, 2):
+            results[get_key(self.get_disasm(), segment)] = info
+        d = self.get_disasm()
+        d.batch_results = results
+        segment = self.segments[-1]
+        info = d.disassemble_segment(segment)
+        assert info is results[get_key(d, segment)]
+
+    def test_snapshots(self):
+        snapshots = get_snapshots(self.segments)
+        bases = set(id(s.rawdata.data_base) for s in self.segments)
+        snapshot_bases = set(id(s.rawdata.data_base) for s in snapshots)
+        assert len(snapshot_bases) == len(bases)
+        assert not snapshot_bases & bases
+        for segment, snapshot in zip(self.segments, snapshots):
+            assert snapshot.start_addr == segment.start_addr
+            assert np.array_equal(snapshot.data[:], segment.data[:])
+            assert np.array_equal(snapshot.style[:], segment.style[:])
+
+    @pytest.mark.parametrize("processes", [1, 2])
+    def test_batch_request(self, processes):
+        items = [(segment, self.get_disasm()) for segment in self.segments]
+        keys = set(get_key(d, segment) for segment, d in items)
+        request = BatchDisassemblyRequest(items, {}, processes)
+
+        # the request has its own copy of the segments
+        segment = self.segments[-1]
+        segment.data[0:16] = segment.data[0:16] + 1
+        request.process()
+        assert set(request.results.keys()) == keys
+        assert get_key(self.get_disasm(), segment) not in request.results
+
+        # only the changed segments are disassembled again
+        again = BatchDisassemblyRequest(items, request.results, processes)
+        again.process()
+        new_keys = set(get_key(d, segment) for segment, d in items)
+        assert set(again.results.keys()) == new_keys
+        assert new_keys - keys
+        for key in new_keys & keys:
+            assert again.results[key] is request.results[key]
+
+
+def brute_force_search(d, search_text, match_case):
+    s = d.start_addr
+    if not match_case:
+        search_text = search_text.lower()
+    fix = (lambda t: t) if match_case else (lambda t: t.lower())
+    matches = set((t.pc - s, t.pc - s + t.num_bytes) for t in d.info if search_text in fix(t.instruction))
+    for labels in [d.pc_label_cache, d.dest_pc_label_cache, d.computed_directive_cache]:
+        matches.update((pc - s, pc - s + 1) for pc, label in labels.iteritems() if search_text in fix(label))
+    for index, comment in d.segment.get_comments_in_range(0, len(d.segment)).iteritems():
+        if comment and search_text in fix(comment):
+            matches.add((index, index + 1))
+    return sorted(matches)
+
+
+class TestSearch(object):
+    def get_disasm(self):
+        disasm = Basic6502Disassembler()
+        disasm.add_chunk_processor("data", 1)
+        disasm.add_chunk_processor("antic_dl", 2)
+        return disasm
+
+    def setup(self):
+        np.random.seed(1234)
+        self.editor = MockHexEditor()
+        guess = FileGuess("../test_data/pytest.atr")
+        self.editor.load(guess)
+        self.editor.find_segment("02: robots I")
+        self.segment = self.editor.segment
+        self.disasm = self.get_disasm()
+        self.disasm.disassemble_segment(self.segment)
+
+    def check(self, search_text, match_case=False):
+        d = self.disasm
+        assert sorted(set(d.search(search_text, match_case))) == brute_force_search(d, search_text, match_case)
+
+    def test_substring(self):
+        for text in ["l", "ld", "lda", "LDA", "lda $", "$0", "byte", ",x", "zzz"]:
+            self.check(text)
+            self.check(text, True)
+
+    def get_mnemonic_rows(self, mnemonic):
+        d = self.disasm
+        s = d.start_addr
+        return sorted((t.pc - s, t.pc - s + t.num_bytes) for t in d.info if t.instruction.split(None, 1)[0:1] == [mnemonic])
+
+    def test_token(self):
+        d = self.disasm
+        rows = self.get_mnemonic_rows("LDA")
+        assert rows
+        assert sorted(d.search("lda", mode="token")) == rows
+        assert sorted(d.search("LDA", True, mode="token")) == rows
+        assert d.search("lda", True, mode="token") == []
+        assert d.search("ld", mode="token") == []
+
+    def test_regex(self):
+        d = self.disasm
+        assert sorted(d.search("lda", mode="regex")) == sorted(d.search("lda"))
+        assert sorted(d.search("^lda", mode="regex")) == self.get_mnemonic_rows("LDA")
+        assert d.search("(", mode="regex") == []
+
+    def test_edits(self):
+        s = self.segment
+        self.check("lda")
+        for i in range(10):
+            index = np.random.randint(0, len(s) - 4)
+            s.data[index:index + 4] = np.random.randint(0, 256, 4)
+            if i % 3 == 0:
+                s.set_comment_at(index, "comment %d" % index)
+            self.disasm.update_segment(s)
+            for text in ["lda", "comment", "$"]:
+                self.check(text)
+
+
+class TestFormattedRowCache(object):
+    def get_disasm(self):
+        disasm = Basic6502Disassembler()
+        disasm.add_chunk_processor("data", 1)
+        disasm.add_chunk_processor("antic_dl", 2)
+        return disasm
+
+    def setup(self):
+        np.random.seed(4321)
+        self.editor = MockHexEditor()
+        guess = FileGuess("../test_data/pytest.atr")
+        self.editor.load(guess)
+        self.editor.find_segment("02: robots I")
+        self.segment = self.editor.segment
+        self.disasm = self.get_disasm()
+        self.disasm.disassemble_segment(self.segment)
+        self.disasm.pc_label_cache
+        self.cache = FormattedRowCache()
+
+    def format_row(self, line, col):
+        d = self.disasm
+        index = line.pc - d.start_addr
+        if col == 0:
+            return d.format_data_list_bytes(index, line.num_bytes)
+        text = d.format_instruction(index, line)
+        comment = d.format_comment(index, line)
+        if comment:
+            text += " ; " + comment
+        return text
+
+    def check(self):
+        cache = self.cache
+        cache.sync(self.disasm)
+        for line in self.disasm.info:
+            for col in range(2):
+                key = (line.pc, line.num_bytes, col)
+                text = self.format_row(line, col)
+                if key in cache:
+                    assert cache.get(key) == text
+                cache[key] = text
+
+    def test_lru(self):
+        cache = FormattedRowCache(2)
+        cache[1] = "a"
+        cache[2] = "b"
+        assert cache.get(1) == "a"
+        cache[3] = "c"
+        assert 2 not in cache
+        assert cache.get(1) == "a"
+        assert len(cache) == 2
+
+    def test_edits(self):
+        s = self.segment
+        self.check()
+        version = self.disasm.text_version
+        for i in range(20):
+            index = np.random.randint(0, len(s) - 4)
+            if i % 4 == 0:
+                s.memory_map[s.start_addr + index] = "LABEL%d" % i
+            else:
+                s.data[index:index + 4] = np.random.randint(0, 256, 4)
+            self.disasm.update_segment(s)
+            self.check()
+        assert self.disasm.text_version == version
+        assert len(self.cache) > 0
+
+    def test_comment(self):
+        s = self.segment
+        d = self.disasm
+        self.check()
+        for i in range(10):
+            # a comment on a single byte is reported as the index range
+            # (index, index) like SetCommentCommand does
+            index = np.random.randint(0, len(s))
+            s.set_comment_at(index, "comment %d" % i)
+            line = d.info[d.info.index_to_row[index]]
+            key = (line.pc, line.num_bytes, 1)
+            d.update_segment_range(s, index, index)
+            self.cache.sync(d)
+            assert key not in self.cache
+            self.check()
+            assert ("comment %d" % i) in self.cache.get(key)
+
+
 if __name__ == "__main__":
     t = TestSmall()
     t.setup()
@@ -0,0 +1,122 @@
+import os
+
+import numpy as np
+import pytest
+
+from omnivore8bit.arch.disasm_cache import DisassemblyCache, CachedDisassemblyInfo
+
+
+class Line(object):
+    def __init__(self, pc, num_bytes, flag, dest_pc, instruction):
+        self.pc = pc
+        self.num_bytes = num_bytes
+        self.flag = flag
+        self.dest_pc = dest_pc
+        self.instruction = instruction
+
+
+class Info(object):
+    def __init__(self, start_addr, num_bytes):
+        self.lines = []
+        self.index_to_row = np.zeros(num_bytes, dtype=np.int32)
+        self.labels = np.zeros(0x10000, dtype=np.uint8)
+        index = 0
+        while index < num_bytes:
+            size = min(np.random.randint(1, 4), num_bytes - index)
+            dest_pc = np.random.randint(start_addr, start_addr + num_bytes)
+            self.index_to_row[index:index + size] = len(self.lines)
+            self.lines.append(Line(start_addr + index, size, 1, dest_pc, "jmp $%04x ; %d" % (dest_pc, size)))
+            self.labels[dest_pc] = 1
+            index += size
+
+    def __iter__(self):
+        return iter(self.lines)
+
+
+class TestDisassemblyCache(object):
+    def setup(self):
+        np.random.seed(8642)
+
+    def test_round_trip(self, tmpdir):
+        cache = DisassemblyCache(str(tmpdir))
+        info = Info(0x4000, 1000)
+        cache.save("abc", info, 1000)
+        cached = cache.load("abc", 0x4000)
+        assert isinstance(cached, CachedDisassemblyInfo)
+        assert cached.num_instructions == len(info.lines)
+        for row, line in enumerate(info.lines):
+            c = cached[row]
+            assert (c.pc, c.num_bytes, c.flag, c.dest_pc, c.instruction) == (line.pc, line.num_bytes, line.flag, line.dest_pc, line.instruction)
+        assert np.array_equal(cached.index_to_row, info.index_to_row)
+        assert np.array_equal(cached.labels, info.labels)
+        assert cached.get_instruction_start_pc(0x4000 + 500) == info.lines[info.index_to_row[500]].pc
+        assert cache.load("def", 0x4000) is None
+
+    def test_texts(self, tmpdir):
+        cache = DisassemblyCache(str(tmpdir))
+        cache.save("abc", Info(0x4000, 100), 100)
+        assert cache.load_texts("abc", "labels") is None
+        items = [(0x4010, "L4010"), (0x4000, "START"), (0x4020, "")]
+        cache.save_texts("abc", "labels", items)
+        assert cache.load_texts("abc", "labels") == sorted(items)
+        assert not [f for f in os.listdir(cache.get_path("abc")) if f.startswith("tmp")]
+
+        # arrays left from different saves aren't used
+        np.save(cache.get_path("abc", "labels_pcs"), np.arange(2, dtype=np.int32))
+        assert cache.load_texts("abc", "labels") is None
+        cache.save_texts("abc", "labels", items[0:2])
+        np.save(cache.get_path("abc", "labels_text"), np.zeros(3, dtype=np.uint8))
+        assert cache.load_texts("abc", "labels") is None
+        cache.save_texts("abc", "labels", items[0:2])
+        assert cache.load_texts("abc", "labels") == sorted(items[0:2])
+
+    def test_key(self):
+        class Disassembler(object):
+            cpu = "6502"
+            hex_lower = True
+            mnemonic_lower = False
+            chunk_processors = [("data", 1)]
+            asm_syntax = {"origin": "*="}
+            memory_map = type("Map", (object,), {"rmemmap": {0x600: "PAGE6"}})
+            disassembly_style_mask = 0x07
+
+        class Segment(object):
+            def __init__(self, data, style, start_addr=0x600):
+                self.data = data
+                self.style = style
+                self.start_addr = start_addr
+
+        cache = DisassemblyCache.__new__(DisassemblyCache)
+        d = Disassembler()
+        data = np.arange(100, dtype=np.uint8)
+        style = np.zeros(100, dtype=np.uint8)
+        key = cache.get_key(d, Segment(data, style))
+        selected = style.copy()
+        selected[10] = 0x80
+        assert cache.get_key(d, Segment(data, selected)) == key
+        styled = style.copy()
+        styled[10] = 0x01
+        assert cache.get_key(d, Segment(data, styled)) != key
+        assert cache.get_key(d, Segment(data, style, 0x700)) != key
+        d.cpu = "65c02"
+        assert cache.get_key(d, Segment(data, style)) != key
+
+    def test_eviction(self, tmpdir):
+        cache = DisassemblyCache(str(tmpdir))
+        cache.save("0", Info(0x4000, 1000), 1000)
+        size = cache.get_entries()[0][1]
+        cache.max_size = size * 3
+        for i in range(1, 3):
+            cache.save(str(i), Info(0x4000, 1000), 1000)
+        t = os.path.getmtime(cache.get_path("2"))
+        for i, key in enumerate(["1", "0", "2"]):
+            os.utime(cache.get_path(key), (t - 30 + i, t - 30 + i))
+        cache.load("1", 0x4000)
+        cache.save("3", Info(0x4000, 1000), 1000)
+        keys = [key for _, _, key in cache.get_entries()]
+        assert sorted(keys) == ["1", "2", "3"]
+
+
+if __name__ == "__main__":
+    t = TestDisassemblyCache()
+    t.setup()
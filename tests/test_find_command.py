@@ -0,0 +1,62 @@
+import numpy as np
+import pytest
+
+from atrcopy import SegmentData, DefaultSegment
+
+from omnivore.framework.caret import CaretHandler
+from omnivore.utils.command import UndoInfo
+from omnivore8bit.byte_edit.commands import FindAllCommand
+from omnivore8bit.document import SegmentedDocument
+from omnivore8bit.utils.searchutil import BytePattern, HexSearcher
+
+
+class MockSearchEditor(object):
+    searchers = [HexSearcher]
+
+    def __init__(self, segment):
+        self.segment = segment
+        self.document = SegmentedDocument()
+        self.linked_base = CaretHandler()
+
+
+class TestFindAll(object):
+    def setup(self):
+        np.random.seed(2468)
+        data = np.random.randint(0, 4, 20000).astype(np.uint8)
+        self.editor = MockSearchEditor(DefaultSegment(SegmentData(data, np.zeros(len(data), dtype=np.uint8)), 0x1000))
+
+    def find(self, text):
+        # the command selects the first match through the caret handler,
+        # like the minibuffer does as the search is typed
+        e = self.editor
+        cmd = FindAllCommand(0, text, None)
+        undo = UndoInfo()
+        cmd.perform(e, undo)
+        e.linked_base.process_caret_flags(undo.flags, e.document)
+        return cmd
+
+    def test_typing(self):
+        e = self.editor
+        d = e.document
+        self.find("01 02")
+        count = d.change_count
+        matches = self.find("01 02 03").all_matches
+        assert d.change_count > count
+
+        # selecting the match doesn't stop the next search refining these
+        # matches
+        candidates, num = d.previous_matches.get_candidates(HexSearcher, e.segment, d.data_version, BytePattern.parse("01 02 03 00"))
+        assert num == 3
+        assert [(start, start + 3) for start in candidates.tolist()] == matches
+        assert len(self.find("01 02 03 00").all_matches) <= len(matches)
+
+        # but changing the data does
+        d.data_version += 1
+        candidates, num = d.previous_matches.get_candidates(HexSearcher, e.segment, d.data_version, BytePattern.parse("01 02 03 00 01"))
+        assert candidates is None
+
+
+if __name__ == "__main__":
+    t = TestFindAll()
+    t.setup()
+    t.test_typing()
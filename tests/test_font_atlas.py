@@ -0,0 +1,102 @@
+import numpy as np
+import pytest
+
+from atrcopy import selected_bit_mask, match_bit_mask, comment_bit_mask, user_bit_mask
+
+from omnivore8bit.arch import antic_renderers as ar
+from omnivore8bit.utils import renderutil as ru
+
+
+def get_per_cell_font_map_image(segment_viewer, antic_font, bytes, style, start_byte, end_byte, bytes_per_row, num_rows, start_col, num_cols):
+    # The per-cell loop that the glyph atlas replaced, kept as the reference
+    width = int(antic_font.char_w * num_cols)
+    height = int(num_rows * antic_font.char_h)
+    array = np.empty((height, width, 3), dtype=np.uint8)
+    end_col = min(bytes_per_row, start_col + num_cols)
+    y = 0
+    e = start_byte
+    f = antic_font.normal_font
+    fh = antic_font.highlight_font
+    fd = antic_font.data_font
+    fm = antic_font.match_font
+    fc = antic_font.comment_font
+    char_w = antic_font.char_w
+    char_h = antic_font.char_h
+    mapping = segment_viewer.machine.font_mapping.font_mapping
+    for j in range(num_rows):
+        x = 0
+        for i in range(start_col, start_col + num_cols):
+            if e + i >= end_byte or i >= end_col:
+                array[y:y+char_h,x:x+char_w,:] = segment_viewer.preferences.background_color
+            else:
+                c = mapping[bytes[j, i]]
+                s = style[j, i]
+                if s & selected_bit_mask:
+                    array[y:y+char_h,x:x+char_w,:] = fh[c]
+                elif s & match_bit_mask:
+                    array[y:y+char_h,x:x+char_w,:] = fm[c]
+                elif s & comment_bit_mask:
+                    array[y:y+char_h,x:x+char_w,:] = fc[c]
+                elif s & user_bit_mask:
+                    array[y:y+char_h,x:x+char_w,:] = fd[c]
+                else:
+                    array[y:y+char_h,x:x+char_w,:] = f[c]
+            x += char_w
+        y += char_h
+        e += bytes_per_row
+    return array
+
+
+font_renderers = [cls.__name__ for cls in ru.iter_renderers() if ru.is_font_renderer(cls())]
+
+
+class TestFontAtlas(object):
+    def setup(self):
+        np.random.seed(1928)
+        self.viewer = ru.HeadlessViewer()
+        self.images = []
+        for filename in ["../test_data/pytest.atr", "../test_data/Jumpman-2016-commented.atr", "../test_data/air_defense_v18.xex"]:
+            segment = ru.get_segments(filename)[0]
+            data = np.asarray(segment.data)[0:0x2000]
+            style = np.random.choice([0, 1, comment_bit_mask, match_bit_mask, selected_bit_mask, selected_bit_mask | match_bit_mask | 2], len(data)).astype(np.uint8)
+            self.images.append((data, style))
+
+    def check(self, renderer, data, style, bytes_per_row, start_byte, end_byte, start_col, num_cols):
+        nr = (len(data) + bytes_per_row - 1) // bytes_per_row
+        size = nr * bytes_per_row
+        bytes = np.zeros(size, dtype=np.uint8)
+        bytes[0:len(data)] = data
+        s = np.zeros(size, dtype=np.uint8)
+        s[0:len(style)] = style
+        bytes = bytes.reshape((nr, bytes_per_row))
+        s = s.reshape((nr, bytes_per_row))
+        font = self.viewer.get_antic_font(renderer)
+        args = (self.viewer, font, bytes, s, start_byte, end_byte, bytes_per_row, nr, start_col, num_cols)
+        expected = get_per_cell_font_map_image(*args)
+        assert np.array_equal(ar.get_numpy_font_map_image(*args), expected)
+        if ar.speedups is not None:
+            glyphs = ar.get_font_map_glyphs(*args)
+            assert np.array_equal(ar.speedups.get_font_glyph_image(font.font_atlas, glyphs), expected)
+
+    @pytest.mark.parametrize("name", font_renderers)
+    def test_images(self, name):
+        renderer = ru.get_renderer(name)
+        for data, style in self.images:
+            self.check(renderer, data, style, 40, 0, len(data), 0, 40)
+
+    @pytest.mark.parametrize("name", ["Mode2", "Mode4", "Apple2TextMode"])
+    def test_partial(self, name):
+        # visible columns that start inside the row, extend past the end of
+        # the row, and data that ends partway through the last row
+        renderer = ru.get_renderer(name)
+        data, style = self.images[0]
+        data = data[0:1000]
+        style = style[0:1000]
+        self.check(renderer, data, style, 32, 0, 990, 5, 40)
+        self.check(renderer, data, style, 32, 64, 1000, 0, 20)
+
+
+if __name__ == "__main__":
+    t = TestFontAtlas()
+    t.setup()
+    t.test_images("Mode2")
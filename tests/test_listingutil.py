@@ -0,0 +1,111 @@
+import os
+import StringIO
+
+import numpy as np
+import pytest
+
+from atrcopy import SegmentData, DefaultSegment
+import udis.udis_fast as udis_fast
+
+from omnivore8bit.arch.disasm import known_assemblers
+from omnivore8bit.arch.listing import ListingWriter
+from omnivore8bit.utils import listingutil as lu
+from omnivore8bit.utils.renderutil import get_segments
+
+
+def reference_rows(d, max_bytes_per_line=8):
+    # the rows of the listing formatted a row at a time by the same methods
+    # as the disassembly viewer
+    flag_data_bytes = udis_fast.flag_data_bytes
+    flag_origin = udis_fast.flag_origin
+    info = d.info
+    for row in range(info.index_to_row[0], info.index_to_row[len(d.segment) - 1] + 1):
+        line = info[row]
+        index = line.pc - d.start_addr
+        label = d.format_label(line)
+        comment = d.format_comment(index, line)
+        operand = d.get_operand_from_instruction(line.instruction)
+        if line.flag & flag_data_bytes and line.num_bytes > max_bytes_per_line:
+            for i in range(0, line.num_bytes, max_bytes_per_line):
+                count = min(line.num_bytes, i + max_bytes_per_line) - i
+                code = d.format_data_directive_bytes(operand[i*2:(i+count)*2])
+                yield line, d.format_data_list_bytes(index + i, count), label + "   " + code, comment, count
+                label = "     "
+                comment = ""
+        else:
+            hex_bytes = "" if line.flag == flag_origin else d.format_data_list_bytes(index, line.num_bytes)
+            yield line, hex_bytes, label + "   " + d.format_operand(line, operand), comment, line.num_bytes
+
+
+def get_rows(rows):
+    # rows of the disassembly aren't always the same objects each time
+    return [(r[0].pc, r[0].num_bytes) + tuple(r[1:]) for r in rows]
+
+
+class TestListing(object):
+    def setup(self):
+        np.random.seed(4321)
+        self.segments = get_segments("../test_data/pytest.atr")
+
+    def check(self, d, segment):
+        d.disassemble_segment(segment)
+        assert get_rows(d.iter_row_text()) == get_rows(reference_rows(d))
+        assert get_rows(d.iter_row_text(max_bytes_per_line=4)) == get_rows(reference_rows(d, 4))
+        if len(segment) > 32:
+            start = len(segment) / 3
+            end = start + 32
+            expected = [r for r in get_rows(reference_rows(d)) if r[0] + max(r[1], 1) > start + d.start_addr and r[0] < end + d.start_addr]
+            assert get_rows(d.iter_row_text(start, end)) == expected
+        fh = StringIO.StringIO()
+        d.write_disassembled_text(fh)
+        assert fh.getvalue() == "\n".join(d.get_disassembled_text()) + "\n"
+        fh = StringIO.StringIO()
+        d.write_atasm_lst_text(fh)
+        assert fh.getvalue() == "\n".join(d.get_atasm_lst_text()) + "\n"
+        fh = StringIO.StringIO()
+        ListingWriter(d, fh, newline="\r\n").write_source()
+        assert fh.getvalue() == "\r\n".join(d.get_disassembled_text()) + "\r\n"
+        fh = StringIO.StringIO()
+        ListingWriter(d, fh, newline="\r\n").write_atasm_lst()
+        assert fh.getvalue() == ("\n".join(d.get_atasm_lst_text()) + "\n").replace("\n", "\r\n")
+
+    @pytest.mark.parametrize("assembler", [asm['name'] for asm in known_assemblers])
+    def test_assemblers(self, assembler):
+        for segment in self.segments[1:]:
+            d = lu.get_disassembler(assembler=assembler, mmap="Atari 400/800")
+            self.check(d, segment)
+
+    def test_comments(self):
+        data = np.random.randint(0, 256, 2000).astype(np.uint8)
+        style = np.zeros(2000, dtype=np.uint8)
+        style[500:1000] = 1
+        segment = DefaultSegment(SegmentData(data, style), 0x3000)
+        for index in np.random.randint(0, 2000, 40):
+            segment.set_comment_at(int(index), "comment %d" % index)
+        d = lu.get_disassembler(hex_lower=False, mnemonic_lower=True)
+        self.check(d, segment)
+
+    def test_unknown(self):
+        with pytest.raises(KeyError):
+            lu.get_disassembler(cpu="nonexistent")
+        with pytest.raises(KeyError):
+            lu.get_assembler("nonexistent")
+
+    def test_files(self, tmpdir):
+        output_dir = str(tmpdir)
+        results = list(lu.list_files(["../test_data/pytest.atr", "nonexistent.atr"], output_dir, 2, lst=True))
+        results.sort()
+        assert results[1][0] == "nonexistent.atr"
+        assert results[1][2] is not None
+        filename, outputs, error = results[0]
+        assert error is None
+        assert len(outputs) == len([s for s in self.segments if len(s) > 0])
+        for output in outputs:
+            assert os.path.exists(output)
+            assert output.endswith(".lst")
+
+
+if __name__ == "__main__":
+    t = TestListing()
+    t.setup()
+    t.test_comments()
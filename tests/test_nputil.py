@@ -0,0 +1,31 @@
+import numpy as np
+import pytest
+
+from omnivore.utils.nputil import intscale, intwscale, intwscale_font
+
+
+class TestIntScale(object):
+    def setup(self):
+        self.image = np.arange(7 * 5 * 3, dtype=np.uint8).reshape((7, 5, 3))
+        self.font = np.arange(4 * 8 * 4 * 3, dtype=np.uint8).reshape((4, 8, 4, 3))
+
+    @pytest.mark.parametrize("hscale", [1, 2, 3, 4, 5, 8, 16])
+    @pytest.mark.parametrize("wscale", [1, 2, 3, 7, 16])
+    def test_intscale(self, hscale, wscale):
+        expected = self.image.repeat(hscale, axis=0).repeat(wscale, axis=1)
+        assert np.array_equal(intscale(self.image, hscale, wscale), expected)
+
+    @pytest.mark.parametrize("scale", [1, 2, 4, 5, 16])
+    def test_intwscale(self, scale):
+        assert np.array_equal(intwscale(self.image, scale), self.image.repeat(scale, axis=1))
+        assert np.array_equal(intwscale_font(self.font, scale), self.font.repeat(scale, axis=2))
+
+    def test_output_buffer(self):
+        out = np.zeros((7 * 3, 5 * 6, 3), dtype=np.uint8)
+        result = intscale(self.image, 3, 6, out)
+        assert result is out
+        assert np.array_equal(out, self.image.repeat(3, axis=0).repeat(6, axis=1))
+
+    def test_bad_scale(self):
+        with pytest.raises(ValueError):
+            intscale(self.image, 0)
@@ -0,0 +1,81 @@
+import numpy as np
+import pytest
+
+from omnivore8bit.arch.overview import MemoryMapPyramid
+
+
+def summarize(data, style, block_size):
+    n = (len(data) + block_size - 1) // block_size
+    maxes = np.empty(n, dtype=np.uint8)
+    means = np.empty(n, dtype=np.uint8)
+    styles = np.empty(n, dtype=np.uint8)
+    for i in range(n):
+        d = data[i * block_size:(i + 1) * block_size].astype(np.uint32)
+        maxes[i] = d.max()
+        means[i] = (d.sum() + len(d) // 2) // len(d)
+        styles[i] = np.bitwise_or.reduce(style[i * block_size:(i + 1) * block_size])
+    return maxes, means, styles
+
+
+class TestMemoryMapPyramid(object):
+    def setup(self):
+        np.random.seed(4321)
+        self.data = np.random.randint(0, 256, 1000).astype(np.uint8)
+        self.style = np.zeros(1000, dtype=np.uint8)
+        self.style[100:180] = 0x40
+        self.style[600] = 0x80
+        self.pyramid = MemoryMapPyramid(self.data, self.style)
+
+    def check_levels(self):
+        p = self.pyramid
+        for level in range(p.num_levels):
+            maxes, means, styles = summarize(self.data, self.style, p.block_size(level))
+            values, style = p.get_level(level, "max")
+            assert np.array_equal(values, maxes)
+            assert np.array_equal(style, styles)
+            values, style = p.get_level(level, "mean")
+            assert np.array_equal(values, means)
+
+    def test_build(self):
+        p = self.pyramid
+        assert p.num_levels == 6
+        assert len(p.get_level(p.num_levels - 1)[0]) == 1
+        self.check_levels()
+
+    @pytest.mark.parametrize("start,end", [(0, 1), (3, 5), (250, 771), (999, 1000), (0, 1000)])
+    def test_update(self, start, end):
+        values, style = self.pyramid.get_level(2)
+        self.data[start:end] = 255 - self.data[start:end]
+        self.style[start:end] |= 0x20
+        self.pyramid.update(start, end)
+        self.check_levels()
+
+        # summaries are updated in place
+        assert np.array_equal(values, self.pyramid.get_level(2)[0])
+
+    def test_sync(self):
+        assert self.pyramid.sync() == 0
+        self.data[[5, 6, 400, 998]] ^= 0xff
+        self.style[[10, 500]] = 0x80
+        assert self.pyramid.sync() == 6
+        self.check_levels()
+
+    def test_level_zero(self):
+        # the source is always current, without an update
+        self.data[10] ^= 0xff
+        self.style[20] = 0x80
+        values, style = self.pyramid.get_level(0)
+        assert values[10] == self.data[10]
+        assert style[20] == 0x80
+
+    def test_fit_level(self):
+        p = self.pyramid
+        assert p.get_fit_level(256, 4) == 0
+        assert p.get_fit_level(16, 4) == 2
+        assert p.get_fit_level(1, 1) == p.num_levels - 1
+
+
+if __name__ == "__main__":
+    t = TestMemoryMapPyramid()
+    t.setup()
+    t.test_sync()
@@ -0,0 +1,48 @@
+import numpy as np
+import pytest
+
+from omnivore8bit.utils import renderbench as rb
+from omnivore8bit.utils import renderutil as ru
+
+
+class TestRenderBenchmark(object):
+    def setup(self):
+        self.renderers = [ru.get_renderer(name).__class__ for name in ["ModeD", "Mode2", "BytePerPixelMemoryMap"]]
+
+    def test_cases(self):
+        cases = list(rb.iter_cases(self.renderers, [0x100, 0x200], [1, 2], [0, 0.5]))
+        assert len(cases) == 3 * 2 * 2 * 2
+        assert len(set(c.key for c in cases)) == len(cases)
+        assert cases[-1].bytes_per_row == 256
+
+    def test_data(self):
+        case = rb.BenchmarkCase(ru.get_renderer("ModeD"), 0x1000, 1, 0.5)
+        data, style = case.get_data()
+        assert len(data) == len(style) == 0x1000
+        assert 0.4 < np.count_nonzero(style) / float(len(style)) < 0.6
+        assert np.array_equal(style, case.get_data()[1])
+
+    def test_run(self):
+        cases = list(rb.iter_cases(self.renderers, [0x100], [1, 2], [0.1]))
+        results, errors = rb.run_benchmarks(cases, 1)
+        assert not errors
+        assert sorted(results) == sorted(c.key for c in cases)
+        assert all(v > 0 for v in results.values())
+
+    def test_compare(self):
+        baseline = {"a": 10.0, "b": 10.0, "c": 10.0, "d": 10.0}
+        results = {"a": 9.0, "b": 7.0, "e": 1.0}
+        errors = {"c": "ValueError: bad"}
+        regressions = rb.compare_results(results, baseline, 0.2, errors)
+        assert regressions == [("b", 10.0, 7.0), ("c", 10.0, None)]
+
+    def test_save(self, tmpdir):
+        filename = str(tmpdir.join("baseline.json"))
+        rb.save_results(filename, {"a": 1.5})
+        assert rb.load_results(filename) == {"a": 1.5}
+
+
+if __name__ == "__main__":
+    t = TestRenderBenchmark()
+    t.setup()
+    t.test_run()
@@ -0,0 +1,88 @@
+import struct
+import zlib
+
+import numpy as np
+import pytest
+
+from omnivore.utils.pngutil import numpy_to_png
+from omnivore8bit.utils import renderutil as ru
+
+
+def decode_png(data):
+    assert data[0:8] == b"\x89PNG\r\n\x1a\n"
+    width, height, depth, color_type = struct.unpack(">IIBB", data[16:26])
+    pos = 8
+    idat = b""
+    while pos < len(data):
+        length, = struct.unpack(">I", data[pos:pos + 4])
+        tag = data[pos + 4:pos + 8]
+        if tag == b"IDAT":
+            idat += data[pos + 8:pos + 8 + length]
+        pos += length + 12
+    channels = 3 if color_type == 2 else 1
+    raw = np.fromstring(zlib.decompress(idat), dtype=np.uint8).reshape((height, -1))
+    assert np.all(raw[:,0] == 0)
+    return raw[:,1:].reshape((height, width, channels)).squeeze()
+
+
+class TestPng(object):
+    def test_rgb(self):
+        array = np.random.randint(0, 256, (7, 13, 3)).astype(np.uint8)
+        assert np.array_equal(decode_png(numpy_to_png(array)), array)
+
+    def test_greyscale(self):
+        array = np.arange(60, dtype=np.uint8).reshape((6, 10))
+        assert np.array_equal(decode_png(numpy_to_png(array)), array)
+
+    def test_bad_shape(self):
+        with pytest.raises(ValueError):
+            numpy_to_png(np.zeros((4, 4, 4), dtype=np.uint8))
+
+
+class TestHeadlessRender(object):
+    def setup(self):
+        np.random.seed(1234)
+        self.data = np.random.randint(0, 256, 400).astype(np.uint8)
+        self.style = np.zeros(400, dtype=np.uint8)
+        self.viewer = ru.HeadlessViewer()
+
+    @pytest.mark.parametrize("name", ["ModeD", "antic d (gr 7, 2bpp)", "GTIA9", "OneBitPerPixelB", "FourBitPlanesLE"])
+    def test_get_renderer(self, name):
+        r = ru.get_renderer(name)
+        assert not ru.is_font_renderer(r)
+
+    def test_unknown_renderer(self):
+        with pytest.raises(KeyError):
+            ru.get_renderer("not a renderer")
+
+    @pytest.mark.parametrize("zoom", [1, 3])
+    def test_bitmap(self, zoom):
+        r = ru.get_renderer("ModeD")
+        array = ru.render_bytes(self.viewer, r, self.data, self.style, 40, zoom)
+        assert array.shape == (10 * r.scale_height * zoom, 160 * r.scale_width * zoom, 3)
+        expected = r.get_image(self.viewer, 40, 10, 400, self.data, self.style)
+        assert np.array_equal(array[::zoom,::zoom], expected)
+
+    def test_partial_row(self):
+        r = ru.get_renderer("ModeD")
+        array = ru.render_bytes(self.viewer, r, self.data[0:390], self.style[0:390], 40)
+        assert array.shape == (10 * r.scale_height, 160 * r.scale_width, 3)
+        empty = self.viewer.preferences.empty_background_color.Get(False)
+        assert np.all(array[-1,120 * r.scale_width:] == empty)
+
+    def test_font(self):
+        r = ru.get_renderer("Mode2")
+        assert ru.is_font_renderer(r)
+        array = ru.render_bytes(self.viewer, r, self.data, self.style, 40, 2)
+        assert array.shape == (10 * 8 * 2, 40 * 8 * 2, 3)
+
+    def test_colors(self):
+        machine = ru.HeadlessMachine([0x94, 0xca, 0x46, 0x00, 0x0e])
+        assert machine.antic_color_registers[4:9] == [0x94, 0xca, 0x46, 0x00, 0x0e]
+        assert len(machine.color_registers) == 32
+
+
+if __name__ == "__main__":
+    t = TestHeadlessRender()
+    t.setup()
+    t.test_font()
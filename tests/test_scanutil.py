@@ -0,0 +1,111 @@
+import os
+
+import numpy as np
+import pytest
+
+from omnivore8bit.utils import scanutil as su
+from omnivore8bit.utils.renderutil import get_segments
+from omnivore8bit.utils.searchutil import BytePattern, get_search_data
+
+
+class TestScan(object):
+    def setup(self):
+        self.filenames = ["../test_data/pytest.atr", "../test_data/air_defense_v18.xex", "../test_data/style32.dat"]
+
+    def get_expected(self, filename, text):
+        # every match in any segment, which must be reported through exactly
+        # one of the segments containing the same bytes
+        pattern = BytePattern.parse(text)
+        expected = set()
+        for segment in get_segments(filename):
+            for start in pattern.find(get_search_data(segment)).tolist():
+                r = segment.rawdata
+                expected.add(tuple(r.get_raw_index(i) for i in range(start, start + len(pattern))))
+        return expected
+
+    @pytest.mark.parametrize("text", ["a9 ?? 8d", "(20|4c) ?? ??", "00 00 00 00"])
+    def test_search_file(self, text):
+        for filename in self.filenames:
+            segments = get_segments(filename)
+            results = su.search_file(filename, pattern=text)
+            found = set()
+            for segment_num, name, index, address in results:
+                s = segments[segment_num]
+                assert s.name == name
+                assert address == s.start_addr + index
+                key = tuple(s.rawdata.get_raw_index(i) for i in range(index, index + len(BytePattern.parse(text))))
+                assert key not in found
+                found.add(key)
+            assert found == self.get_expected(filename, text)
+
+    def test_expression(self):
+        filename = self.filenames[0]
+        results = su.search_file(filename, expression="b == $a9 && b[+2] == $8d")
+        pattern_results = su.search_file(filename, pattern="a9 ?? 8d")
+        assert set(pattern_results).issubset(set(results))
+
+        # each byte is only reported through one of the segments containing
+        # it, like the byte patterns
+        segments = get_segments(filename)
+        raw = [segments[segment_num].rawdata.get_raw_index(index) for segment_num, name, index, address in results]
+        assert len(raw) == len(set(raw))
+
+    def test_disassembly(self):
+        filename = self.filenames[0]
+        segments = get_segments(filename)
+        results = su.search_file(filename, disasm="jmp", mode="token")
+        assert len(results) > 0
+        for segment_num, name, index, address in results:
+            assert segment_num > 0
+            assert 0 <= index < len(segments[segment_num])
+
+    def test_iter_filenames(self):
+        filenames = list(su.iter_filenames(["../test_data"], ["atr", ".XEX"]))
+        assert filenames == sorted(filenames)
+        assert "../test_data/pytest.atr" in filenames
+        assert "../test_data/air_defense_v18.xex" in filenames
+        assert not [f for f in filenames if f.endswith(".omnivore")]
+        assert list(su.iter_filenames(["nonexistent.atr"])) == ["nonexistent.atr"]
+
+    def scan(self, output, filenames, resume=False):
+        progress = su.ScanProgress(output + ".progress")
+        with open(output, "r+b" if resume else "wb") as fh:
+            return su.scan(filenames, fh, progress, resume, 2, pattern="a9 ?? 8d")
+
+    def test_resume(self, tmpdir):
+        filenames = self.filenames + ["nonexistent.atr"]
+        output = str(tmpdir.join("matches.txt"))
+        assert self.scan(output, filenames) == 1
+        with open(output, "rb") as fh:
+            complete = sorted(fh.readlines())
+        assert len(complete) == sum(len(su.search_file(f, pattern="a9 ?? 8d")) for f in self.filenames)
+
+        # interrupted after the first file, with a partly written record of
+        # the next one in both files
+        assert self.scan(output, filenames[0:1]) == 0
+        with open(output, "ab") as fh:
+            fh.write("../test_data/air_def")
+        with open(output + ".progress", "ab") as fh:
+            fh.write("12")
+        assert self.scan(output, filenames, True) == 1
+        with open(output, "rb") as fh:
+            assert sorted(fh.readlines()) == complete
+        # the file that couldn't be searched is tried again next time
+        progress = su.ScanProgress(output + ".progress")
+        progress.load()
+        assert progress.done == set(self.filenames)
+
+    def test_bad_expression(self):
+        with pytest.raises(ValueError):
+            su.compile_expression("b ==")
+        with pytest.raises(ValueError):
+            su.compile_expression("x == 1")
+        for expression in ["b ==", "x == 1", "b[+1] == 2 && q[-1] == 3"]:
+            with pytest.raises(SystemExit):
+                su.main(["-e", expression] + self.filenames)
+
+
+if __name__ == "__main__":
+    t = TestScan()
+    t.setup()
+    t.test_search_file("a9 ?? 8d")
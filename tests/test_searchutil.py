@@ -0,0 +1,209 @@
+import numpy as np
+import pytest
+
+from atrcopy import SegmentData, DefaultSegment, match_bit_mask
+
+from omnivore.utils.parseutil import NumpyIntExpression
+from omnivore8bit.utils.searchutil import BytePattern, HexSearcher, AlgorithmSearcher, PreviousMatches, get_search_data, find_in_segments
+from omnivore8bit.utils.segmentutil import bool_to_ranges
+
+
+def brute_force_find(data, pattern):
+    size = len(pattern)
+    found = []
+    for i in range(len(data) - size + 1):
+        if all(pattern.tables[k][data[i + k]] for k in range(size)):
+            found.append(i)
+    return found
+
+
+class TestBytePattern(object):
+    def setup(self):
+        np.random.seed(9753)
+        self.data = np.random.randint(0, 16, 5000).astype(np.uint8)
+        self.data[100:103] = [0xa9, 0x00, 0x8d]
+        self.data[200:203] = [0xa9, 0x45, 0x8d]
+
+    def test_parse(self):
+        assert BytePattern.parse("a9008d").positions == [[(0xa9, 0xff)], [(0, 0xff)], [(0x8d, 0xff)]]
+        assert BytePattern.parse("A9 ?? 8D").positions == [[(0xa9, 0xff)], [(0, 0)], [(0x8d, 0xff)]]
+        assert BytePattern.parse("6? ?f").positions == [[(0x60, 0xf0)], [(0xf, 0xf)]]
+        assert BytePattern.parse("c0&80").positions == [[(0x80, 0x80)]]
+        assert BytePattern.parse("(ad|bd) 00").positions == [[(0xad, 0xff), (0xbd, 0xff)], [(0, 0xff)]]
+        assert len(BytePattern.parse("")) == 0
+
+    @pytest.mark.parametrize("text", ["a", "zz", "(a9", "(a9 ad)", "a9|ad", "()", "(|a9)"])
+    def test_bad(self, text):
+        with pytest.raises(ValueError):
+            BytePattern.parse(text)
+
+    @pytest.mark.parametrize("text", ["0a", "a9 ?? 8d", "0? 0?", "?? 03", "08&08 ?? 01", "(01|02|a9) (00|45)", "00 00"])
+    @pytest.mark.parametrize("block_size", [7, 1 << 20])
+    def test_find(self, text, block_size):
+        pattern = BytePattern.parse(text)
+        pattern.block_size = block_size
+        assert pattern.find(self.data).tolist() == brute_force_find(self.data, pattern)
+
+    def test_matches(self):
+        pattern = BytePattern.parse("a9 ?? 8d")
+        assert pattern.find(self.data).tolist() == [100, 200]
+        assert len(pattern.find(self.data[0:2])) == 0
+        assert BytePattern.from_bytes("\xa9\x45").find(self.data).tolist() == [200]
+
+    def test_segment_data(self):
+        raw = SegmentData(self.data.copy())
+        segment = DefaultSegment(raw, 0x1000)
+        assert get_search_data(segment) is segment.data
+        order = np.arange(len(self.data))[::-1]
+        segment = DefaultSegment(raw.get_indexed(order), 0x1000)
+        pattern = BytePattern.parse("8d ?? a9")
+        assert pattern.find(get_search_data(segment)).tolist() == [len(self.data) - 203, len(self.data) - 103]
+
+
+class MockDocument(object):
+    def __init__(self):
+        self.data_version = 0
+        self.previous_matches = PreviousMatches()
+
+
+class MockEditor(object):
+    def __init__(self, segment):
+        self.segment = segment
+        self.document = MockDocument()
+
+
+class TestIncremental(object):
+    def setup(self):
+        np.random.seed(8642)
+        data = np.random.randint(0, 4, 20000).astype(np.uint8)
+        self.editor = MockEditor(DefaultSegment(SegmentData(data), 0x1000))
+
+    def check(self, text):
+        searcher = HexSearcher(self.editor, text)
+        pattern = BytePattern.parse(text)
+        expected = brute_force_find(self.editor.segment.data, pattern)
+        assert [start for start, end in searcher.matches] == expected
+        assert all(end - start == len(pattern) for start, end in searcher.matches)
+        return searcher
+
+    def test_typing(self):
+        text = "01 02 ?3 00 01"
+        for i in range(1, len(text) + 1):
+            try:
+                self.check(text[0:i])
+            except ValueError:
+                # incomplete byte
+                pass
+
+    def test_refine(self):
+        self.check("01 02")
+        self.check("01 02 03")
+        assert len(self.editor.document.previous_matches.entries[HexSearcher][3]) > 0
+        self.editor.segment.data[0:100] = 1
+        self.editor.document.data_version += 1
+        self.check("01 02 03")
+        self.check("(01|02)")
+
+    def test_style(self):
+        searcher = self.check("01 02 03")
+        s = self.editor.segment
+        assert len(searcher.matches) > 0
+        for start, end in searcher.matches:
+            assert (s.style[start:end] & match_bit_mask).all()
+
+class TestFindInSegments(object):
+    def setup(self):
+        np.random.seed(1357)
+        data = np.random.randint(0, 4, 15000).astype(np.uint8)
+        raw = SegmentData(data)
+        self.segments = [
+            DefaultSegment(raw, 0, name="All"),
+            DefaultSegment(raw[1000:9000], 0x2000, name="file 1"),
+            DefaultSegment(raw[5000:12000], 0x6000, name="overlaps file 1"),
+            DefaultSegment(raw.get_indexed(np.arange(12000, 15000)[::-1]), 0x4000, name="reversed"),
+            DefaultSegment(SegmentData(data.copy()), 0, name="copy"),
+            ]
+
+    def get_raw_bytes(self, segment, index, size):
+        r = segment.rawdata
+        return tuple(r.get_raw_index(i) for i in range(index, index + size))
+
+    @pytest.mark.parametrize("threads", [1, 4])
+    @pytest.mark.parametrize("chunk_size", [333, 1 << 20])
+    def test_find(self, threads, chunk_size):
+        pattern = BytePattern.parse("01 02 ?3 00 ??")
+        found = find_in_segments(self.segments, pattern, threads, chunk_size)
+        assert found == sorted(found)
+        seen = set()
+        for i, index in found:
+            s = self.segments[i]
+            assert index in brute_force_find(get_search_data(s), pattern)
+            key = (s.name == "copy", self.get_raw_bytes(s, index, len(pattern)))
+            assert key not in seen
+            seen.add(key)
+
+        # every match is reported through one of the segments
+        for i, s in enumerate(self.segments):
+            for index in brute_force_find(get_search_data(s), pattern):
+                assert (s.name == "copy", self.get_raw_bytes(s, index, len(pattern))) in seen
+
+        # matches in the overlap of the file segments are only reported in
+        # the smaller one, and matches in the files aren't reported in the
+        # segment of everything
+        assert [index for i, index in found if i == 1 and index >= 4000] == []
+        assert [index for i, index in found if i == 0 and 1000 <= index < 12000 - len(pattern)] == []
+
+    def test_empty(self):
+        assert find_in_segments(self.segments, BytePattern.parse("")) == []
+        assert find_in_segments([], BytePattern.parse("01")) == []
+
+class TestAlgorithm(object):
+    def setup(self):
+        np.random.seed(2468)
+        data = np.random.randint(0, 256, 10000).astype(np.uint8)
+        style = np.random.randint(0, 4, 10000).astype(np.uint8)
+        self.editor = MockEditor(DefaultSegment(SegmentData(data, style), 0x2000))
+
+    def check(self, text, expected):
+        searcher = AlgorithmSearcher(self.editor, text)
+        assert searcher.matches == bool_to_ranges(expected)
+        assert np.array_equal((self.editor.segment.style & match_bit_mask) != 0, expected)
+
+    @pytest.mark.parametrize("text", ["b > 128", "(b & 7) > 3 && a > $2010", "b * 3 + 1 > 400", "-b < -100 || a % 7 == 0", "(b > 3) & (b < 9)", "b == $a9 or b == 0x8d", "a // 0 == 0", "1", "0"])
+    def test_expression(self, text):
+        s = self.editor.segment
+        vars_ = {
+            'a': np.arange(s.start_addr, s.start_addr + len(s)),
+            'b': s.data.astype(np.int64),
+            }
+        with np.errstate(divide='ignore'):
+            expected = np.asarray(NumpyIntExpression(vars_).eval(text)) != 0
+        self.check(text, np.broadcast_to(expected, (len(s),)))
+
+    @pytest.mark.parametrize("block_size", [100, 1 << 16])
+    def test_neighbors(self, block_size):
+        s = self.editor.segment
+        b = s.data.astype(np.int64)
+        expected = np.zeros(len(s), dtype=np.bool_)
+        expected[1:-2] = (b[1:-2] == 0xad) & (b[:-3] < 0x80) & ((b[2:-1] | (b[3:] << 8)) >= 0xd000) & (s.style[1:-2] == s.style[3:])
+        NumpyIntExpression.compile("b == $ad && b[-1] < $80 && w[+1] >= $d000 && s == s[2]").block_size = block_size
+        self.check("b == $ad && b[-1] < $80 && w[+1] >= $d000 && s == s[2]", expected)
+
+    def test_chained(self):
+        b = self.editor.segment.data
+        self.check("3 < b < 10", (b > 3) & (b < 10))
+
+    def test_errors(self):
+        with pytest.raises(ValueError):
+            AlgorithmSearcher(self.editor, "b >")
+        with pytest.raises(ValueError):
+            AlgorithmSearcher(self.editor, "x > 3")
+
+    def test_cache(self):
+        assert NumpyIntExpression.compile("b > 3") is NumpyIntExpression.compile("b > 3")
+
+
+if __name__ == "__main__":
+    t = TestBytePattern()
+    t.setup()
+    t.test_matches()
@@ -0,0 +1,64 @@
+import numpy as np
+import pytest
+
+from atrcopy import SegmentData, DefaultSegment, selected_bit_mask
+
+from omnivore8bit.utils import segmentutil as su
+
+
+class TestStyleRanges(object):
+    def setup(self):
+        np.random.seed(1357)
+        n = 2000
+        style = np.repeat(np.random.randint(0, 4, n), np.random.randint(1, 20, n))[:n].astype(np.uint8)
+        style[np.random.rand(n) < 0.2] |= selected_bit_mask
+        self.raw = SegmentData(np.zeros(n, dtype=np.uint8), style)
+        self.segments = [DefaultSegment(self.raw, 0), DefaultSegment(self.raw[100:1500], 0x1000)]
+
+    def test_bool_to_ranges(self):
+        s = self.segments[0]
+        for value in range(4):
+            matches = s.style == value
+            assert su.bool_to_ranges(matches) == s.bool_to_ranges(matches)
+        assert su.bool_to_ranges(np.ones(10, dtype=np.bool_)) == [(0, 10)]
+        assert su.bool_to_ranges(np.zeros(10, dtype=np.bool_)) == []
+        assert su.bool_to_ranges([]) == []
+
+    @pytest.mark.parametrize("kwargs", [dict(selected=True), dict(data=True), dict(user=2), dict(selected=True, data=True)])
+    def test_style_ranges(self, kwargs):
+        for s in self.segments:
+            assert su.get_style_ranges(s, **kwargs) == s.get_style_ranges(**kwargs)
+
+    def test_user_style_ranges(self):
+        s = self.segments[1]
+        for value in range(4):
+            ranges = su.get_user_style_ranges(s, value)
+            covered = np.zeros(len(s), dtype=np.bool_)
+            for start, end in ranges:
+                covered[start:end] = True
+            assert np.array_equal(covered, (s.style[:] & 7) == value)
+
+    def test_set_style_ranges(self):
+        for s in self.segments:
+            ranges = [(10, 20), (15, 30), (50, 40), (len(s) - 5, len(s) + 10), (100, 100)]
+            original = s.style[:].copy()
+            s.set_style_ranges(ranges, match=True)
+            expected = s.style[:].copy()
+            s.style[:] = original
+            su.set_style_ranges(s, ranges, match=True)
+            assert np.array_equal(s.style[:], expected)
+        su.set_style_ranges(self.segments[0], [], match=True)
+
+    def test_values_to_ranges(self):
+        values = np.asarray([1, 1, 0, 0, 0, 2, 1], dtype=np.uint8)
+        assert su.values_to_ranges(values) == [((0, 2), 1), ((2, 5), 0), ((5, 6), 2), ((6, 7), 1)]
+        split = np.asarray([0, 1, 0, 0, 1, 0, 0], dtype=np.bool_)
+        assert su.values_to_ranges(values, split) == [((0, 1), 1), ((1, 2), 1), ((2, 4), 0), ((4, 5), 0), ((5, 6), 2), ((6, 7), 1)]
+        assert su.values_to_ranges(values[0:1]) == [((0, 1), 1)]
+        assert su.values_to_ranges(values[0:0]) == []
+
+
+if __name__ == "__main__":
+    t = TestStyleRanges()
+    t.setup()
+    t.test_values_to_ranges()
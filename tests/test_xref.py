@@ -0,0 +1,75 @@
+import numpy as np
+import pytest
+
+from omnivore8bit.arch.xref import CrossReferenceIndex, xref_read, xref_call
+
+flag_label = 0x01
+
+
+class Line(object):
+    def __init__(self, pc, dest_pc, flag=flag_label, instruction="lda"):
+        self.pc = pc
+        self.dest_pc = dest_pc
+        self.flag = flag
+        self.instruction = instruction
+
+
+def classify_line(line):
+    return xref_call if line.instruction == "jsr" else xref_read
+
+
+class TestCrossReferenceIndex(object):
+    def setup(self):
+        np.random.seed(1357)
+        self.line_kinds = {}
+        self.lines = self.random_lines(0x1000, 0x2000)
+        self.xrefs = CrossReferenceIndex(self.classify)
+        self.xrefs.add_lines(self.lines, flag_label)
+
+    def random_lines(self, start_pc, end_pc):
+        lines = []
+        pc = start_pc
+        while pc < end_pc:
+            flag = flag_label if np.random.rand() < 0.7 else 0
+            line = Line(pc, np.random.randint(0x1000, 0x1100), flag, np.random.choice(["lda", "jsr"]))
+            self.line_kinds[pc] = classify_line(line)
+            lines.append(line)
+            pc += np.random.randint(1, 4)
+        return lines
+
+    def classify(self, pcs, flags):
+        return [self.line_kinds[pc] for pc in pcs]
+
+    def check(self, lines):
+        for target in range(0x1000, 0x1100):
+            expected = [(line.pc, classify_line(line)) for line in lines if line.flag & flag_label and line.dest_pc == target]
+            sources, kinds = self.xrefs.get_referrers(target)
+            assert zip(sources, kinds) == expected
+            assert self.xrefs.count_referrers(target) == len(expected)
+
+    def test_lookup(self):
+        self.check(self.lines)
+        sources, kinds = self.xrefs.get_referrers(0x1000, 0x1100)
+        assert len(sources) == len([line for line in self.lines if line.flag & flag_label])
+        assert len(self.xrefs.get_referrers(0x2000)[0]) == 0
+
+    def test_replace(self):
+        lines = self.lines
+        for i in range(20):
+            first = np.random.randint(0, len(lines) - 10)
+            last = first + np.random.randint(1, 10)
+            start_pc = lines[first].pc
+            end_pc = lines[last].pc
+            new_lines = self.random_lines(start_pc, end_pc)
+            lines = lines[:first] + new_lines + lines[last:]
+            self.xrefs.replace(start_pc, end_pc, new_lines, flag_label)
+            self.check(lines)
+        full = CrossReferenceIndex(self.classify)
+        full.add_lines(lines, flag_label)
+        assert full == self.xrefs
+
+
+if __name__ == "__main__":
+    t = TestCrossReferenceIndex()
+    t.setup()
+    t.test_replace()